@@ -1,3 +1,10 @@
 # flake8: noqa
 from .cbers4asat import Cbers4aAPI
-from .cbers4a import Collections
+from .cbers4a import (
+    Collections,
+    AssetStore,
+    Monitor,
+    ThumbnailFetcher,
+    SearchCache,
+    AdaptiveLimiter,
+)
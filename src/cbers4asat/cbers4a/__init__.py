@@ -1,6 +1,13 @@
 # flake8: noqa
+from .async_search import AsyncSearch, AsyncSearchItem, close_shared_session
+from .catalog import CatalogWriter, read_catalog, write_catalog
 from .collections import Collections
-from .download import Download
+from .download import Download, DownloadedFile, IntegrityError
 from .item import Item
 from .itemCollection import ItemCollection
+from .limiter import AdaptiveLimiter
+from .monitor import Monitor, RequestEvent, ProgressEvent, PrometheusExporter
 from .search import Search, SearchItem
+from .search_cache import SearchCache
+from .store import AssetStore
+from .thumbnail import ThumbnailFetcher
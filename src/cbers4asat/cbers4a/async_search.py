@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+# Standard Libraries
+import asyncio
+from typing import Optional
+from weakref import WeakKeyDictionary
+
+# Local Modules
+from .monitor import Monitor, track
+from .search import Search, SearchItem
+
+# aiohttp (cbers4asat[async]) is imported when needed.
+
+# Connections per host of the shared session. Other requests wait for a free one.
+CONNECTIONS_PER_HOST = 8
+
+# One shared session per event loop: aiohttp sessions cannot change loops.
+_sessions: WeakKeyDictionary = WeakKeyDictionary()
+
+
+def _aiohttp():
+    try:
+        import aiohttp
+    except ImportError:
+        raise ImportError(
+            "Async searches require aiohttp: pip install cbers4asat[async]"
+        )
+    return aiohttp
+
+
+def async_session(connections_per_host: int = CONNECTIONS_PER_HOST):
+    """
+    New aiohttp session whose connections are kept alive and reused.
+
+    Args:
+        connections_per_host: Max of open connections to each host
+    Return:
+        aiohttp.ClientSession. Close it with ``await session.close()``
+    """
+    aiohttp = _aiohttp()
+    connector = aiohttp.TCPConnector(limit=0, limit_per_host=connections_per_host)
+    return aiohttp.ClientSession(connector=connector)
+
+
+def shared_session():
+    """
+    Session shared by the async searches of the running event loop.
+    """
+    loop = asyncio.get_running_loop()
+    session = _sessions.get(loop)
+    if session is None or session.closed:
+        session = _sessions[loop] = async_session()
+    return session
+
+
+async def close_shared_session() -> None:
+    """
+    Close the shared session of the running event loop. Call it on shutdown.
+    """
+    session = _sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None:
+        await session.close()
+
+
+class AsyncSearchItem(SearchItem):
+    """
+    ``SearchItem`` for asyncio: await the call. The items are requested concurrently.
+
+    Args:
+        monitor: Receives the lookup request events.
+        session: aiohttp session. Default is the shared session of the event loop.
+    Examples:
+        - search = AsyncSearchItem()
+        - search.ids(["CBERS4A_WPM22712220210808"], "CBERS4A_WPM_L4_DN")
+        - result = await search()
+    """
+
+    def __init__(self, monitor: Optional[Monitor] = None, session=None) -> None:
+        super().__init__(monitor)
+        self.session = session
+
+    async def __call__(self) -> dict | Exception:
+        """
+        Make requests using the search parameters.
+
+        Return:
+            GeoJson-like dictionary.
+        Raise:
+            ``Exception`` if any http error.
+        """
+        session = self.session or shared_session()
+        found = await asyncio.gather(
+            *(self.__get(session, id_) for id_ in self.search_item_body.ids)
+        )
+        features = [feature for feature in found if feature.get("type") == "Feature"]
+        return {"type": "FeatureCollection", "features": features}
+
+    async def __get(self, session, id_: str) -> dict | Exception:
+        url = self.item_url(id_)
+        with track(self.monitor, "item", url) as event:
+            async with session.get(url) as response:
+                event.status = response.status
+                event.bytes = response.content_length or 0
+                if response.status >= 400:
+                    raise Exception(
+                        f"{response.status} - ERROR searching {id_}. Reason: {response.reason}."
+                    )
+                return await response.json(content_type=None)
+
+
+class AsyncSearch(Search):
+    """
+    ``Search`` for asyncio: await the call.
+
+    Concurrent searches share the connections of one session, so many of them are
+    multiplexed on a few sockets.
+
+    Args:
+        monitor: Receives the search request event.
+        session: aiohttp session. Default is the shared session of the event loop.
+    Examples:
+        - search = AsyncSearch()
+        - search.bbox([-63.9, -8.8, -63.7, -8.6])
+        - search.collections(["CBERS4A_WPM_L4_DN"])
+        - result = await search()
+    """
+
+    def __init__(self, monitor: Optional[Monitor] = None, session=None) -> None:
+        super().__init__(monitor)
+        self.session = session
+
+    async def __call__(self) -> dict | Exception:
+        """
+        Make request using the search parameters.
+
+        Return:
+            GeoJson-like dictionary.
+        Raise:
+            ``Exception`` if any http error.
+        """
+        session = self.session or shared_session()
+        with track(self.monitor, "search", self.BASE_URL_SEARCH) as event:
+            async with session.post(
+                self.BASE_URL_SEARCH, json=self.request_body()
+            ) as response:
+                event.status = response.status
+                event.bytes = response.content_length or 0
+                if response.status >= 400:
+                    raise Exception(
+                        f"{response.status} - ERROR in query. Reason: {response.reason}."
+                    )
+                return self.features(await response.json(content_type=None))
@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+# Standard Libraries
+from json import dumps
+from os.path import splitext
+from typing import Literal, Optional, Union
+
+# Local Modules
+from .itemCollection import ItemCollection
+
+# pyarrow (cbers4asat[arrow]) and shapely are imported when needed.
+
+ASSETS = ("thumbnail", "red", "green", "blue", "nir", "pan")
+
+PROPERTIES = (
+    ("datetime", "string"),
+    ("path", "int32"),
+    ("row", "int32"),
+    ("satellite", "string"),
+    ("sensor", "string"),
+    ("cloud_cover", "float64"),
+)
+
+# GeoParquet file metadata. Without "crs", coordinates are longitude and latitude.
+GEO_METADATA = {
+    "version": "1.1.0",
+    "primary_column": "geometry",
+    "columns": {
+        "geometry": {"encoding": "WKB", "geometry_types": ["Polygon", "MultiPolygon"]}
+    },
+}
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError(
+            "Arrow and GeoParquet catalogs require pyarrow: pip install cbers4asat[arrow]"
+        )
+    return pyarrow
+
+
+def catalog_schema():
+    """
+    Arrow schema of a catalog: one row per item, with WKB geometry and assets hrefs.
+    """
+    pa = _pyarrow()
+    fields = [
+        pa.field("id", pa.string(), nullable=False),
+        pa.field("collection", pa.string()),
+        *(pa.field(name, getattr(pa, type_)()) for name, type_ in PROPERTIES),
+        pa.field("bbox", pa.list_(pa.float64())),
+        pa.field("geometry", pa.binary()),
+    ]
+    for asset in ASSETS:
+        fields.append(pa.field(f"{asset}_href", pa.string()))
+        fields.append(pa.field(f"{asset}_type", pa.string()))
+
+    return pa.schema(fields, metadata={"geo": dumps(GEO_METADATA)})
+
+
+def to_arrow(products: Union[dict, ItemCollection]):
+    """
+    Convert query results to an Arrow record batch
+
+    Args:
+        products: Query result dictionary or ``ItemCollection``
+    Returns:
+        pyarrow.RecordBatch
+    """
+    from shapely import to_wkb
+    from shapely.geometry import shape
+
+    pa = _pyarrow()
+
+    if isinstance(products, dict):
+        products = ItemCollection(**products)
+
+    if not isinstance(products, ItemCollection):
+        raise Exception("Bad Arguments.")
+
+    items = list(products)
+    columns = {
+        "id": [item.id for item in items],
+        "collection": [item.collection for item in items],
+        "bbox": [item.bbox for item in items],
+        "geometry": list(
+            to_wkb([shape(vars(item.geometry)) for item in items], output_dimension=2)
+        ),
+    }
+    for name, _ in PROPERTIES:
+        columns[name] = [getattr(item.properties, name) for item in items]
+    for asset in ASSETS:
+        values = [getattr(item.assets, asset, None) for item in items]
+        columns[f"{asset}_href"] = [getattr(v, "href", None) for v in values]
+        columns[f"{asset}_type"] = [getattr(v, "type", None) for v in values]
+
+    return pa.RecordBatch.from_pydict(columns, schema=catalog_schema())
+
+
+def from_arrow(table) -> dict:
+    """
+    Convert an Arrow table or record batch back to query results
+
+    Args:
+        table: pyarrow.Table or pyarrow.RecordBatch with the catalog schema
+    Returns:
+        dict: Dict with GeoJSON-like format, with the assets saved in the catalog
+    """
+    from shapely import from_wkb
+    from shapely.geometry import mapping
+
+    rows = table.to_pylist()
+    geometries = from_wkb([row["geometry"] for row in rows])
+
+    features = list()
+    for row, geometry in zip(rows, geometries):
+        assets = {
+            asset: {"href": row[f"{asset}_href"], "type": row[f"{asset}_type"]}
+            for asset in ASSETS
+            if row.get(f"{asset}_href") is not None
+        }
+        geometry = mapping(geometry)
+        features.append(
+            {
+                "type": "Feature",
+                "id": row["id"],
+                "collection": row["collection"],
+                "geometry": {
+                    "type": geometry["type"],
+                    "coordinates": _lists(geometry["coordinates"]),
+                },
+                "bbox": row["bbox"],
+                "properties": {name: row[name] for name, _ in PROPERTIES},
+                "assets": assets,
+            }
+        )
+
+    return {"type": "FeatureCollection", "features": features}
+
+
+def _lists(coordinates):
+    """
+    Shapely mapping tuples as GeoJSON lists.
+    """
+    if isinstance(coordinates, (list, tuple)):
+        return [_lists(value) for value in coordinates]
+    return coordinates
+
+
+def _format(path: str, format_: Optional[str]) -> str:
+    format_ = format_ or splitext(path)[1].lstrip(".").lower()
+    format_ = {"geoparquet": "parquet", "feather": "arrow", "ipc": "arrow"}.get(
+        format_, format_
+    )
+    if format_ not in ("parquet", "arrow"):
+        raise ValueError("Catalog formats available: parquet and arrow")
+    return format_
+
+
+class CatalogWriter:
+    """
+    Write query results to a GeoParquet or Arrow IPC file, incrementally.
+
+    Every ``write`` call appends the results as a new row group (or record batch),
+    so results of many searches can be saved as they arrive.
+
+    Args:
+        path: Output file. Format from the extension: .parquet or .arrow
+        format: (Optional) "parquet" or "arrow", overriding the extension
+        compression: Compression codec. Ex.: "zstd", "snappy", None
+    Examples:
+        - with CatalogWriter("catalog.parquet") as writer:
+              for path_row in path_rows:
+                  writer.write(Cbers4aAPI.query(path_row, ...))
+    """
+
+    def __init__(
+        self,
+        path: str,
+        format: Optional[Literal["parquet", "arrow"]] = None,
+        compression: Optional[str] = "zstd",
+    ):
+        _pyarrow()
+        self.path = path
+        self.format = _format(path, format)
+        self.rows = 0
+
+        if self.format == "parquet":
+            from pyarrow.parquet import ParquetWriter
+
+            self._writer = ParquetWriter(
+                path, catalog_schema(), compression=compression or "none"
+            )
+        else:
+            from pyarrow.ipc import IpcWriteOptions, new_file
+
+            self._writer = new_file(
+                path,
+                catalog_schema(),
+                options=IpcWriteOptions(compression=compression),
+            )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, products: Union[dict, ItemCollection]) -> None:
+        """
+        Append query results.
+        """
+        batch = to_arrow(products)
+        if not batch.num_rows:
+            return
+
+        self._writer.write_batch(batch)
+        self.rows += batch.num_rows
+
+    def close(self) -> None:
+        """
+        Finish the file.
+        """
+        self._writer.close()
+
+
+def write_catalog(
+    products: Union[dict, ItemCollection],
+    path: str,
+    format: Optional[Literal["parquet", "arrow"]] = None,
+) -> str:
+    """
+    Save query results as GeoParquet or Arrow IPC
+
+    Args:
+        products: Query result dictionary or ``ItemCollection``
+        path: Output file. Format from the extension: .parquet or .arrow
+        format: (Optional) "parquet" or "arrow", overriding the extension
+    Returns:
+        File path
+    """
+    with CatalogWriter(path, format) as writer:
+        writer.write(products)
+    return path
+
+
+def read_catalog(
+    path: str, format: Optional[Literal["parquet", "arrow"]] = None
+) -> dict:
+    """
+    Read query results saved by ``write_catalog`` or ``CatalogWriter``
+
+    The results keep the assets hrefs, so ``Cbers4aAPI.download`` does not search the
+    items again.
+
+    Args:
+        path: GeoParquet or Arrow IPC file
+        format: (Optional) "parquet" or "arrow", overriding the extension
+    Returns:
+        dict: Dict with GeoJSON-like format
+    """
+    _pyarrow()
+
+    if _format(path, format) == "parquet":
+        from pyarrow.parquet import read_table
+
+        table = read_table(path)
+    else:
+        from pyarrow.ipc import open_file
+
+        with open_file(path) as reader:
+            table = reader.read_all()
+
+    return from_arrow(table)
@@ -1,20 +1,99 @@
 # -*- coding: utf-8 -*-
 # Standard Libraries
-from os import makedirs
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from hashlib import new as new_hash
+from os import makedirs, remove, replace
 from os.path import join, basename, exists
+from threading import Event, Lock
+from typing import Optional
 
 # PyPi Packages
 from requests import Session, HTTPError
 from requests.adapters import HTTPAdapter
 from urllib3.util import Retry
 
+# Local Modules
+from .limiter import AdaptiveLimiter, slot
+from .monitor import Monitor, ProgressEvent, track, retries_of
+from .utils.lock import FileLock
+
+# Magic numbers of little/big endian TIFF and BigTIFF files.
+GEOTIFF_SIGNATURES = (b"II*\x00", b"MM\x00*", b"II+\x00", b"MM\x00+")
+
+# Bytes between two progress events.
+PROGRESS_INTERVAL = 2**20
+
+# Bytes read from the connection (and written to disk) at once.
+CHUNK_SIZE = 2**20
+
+
+class IntegrityError(Exception):
+    """
+    Raised when a downloaded asset fails the integrity verification.
+    """
+
+
+class RangesIgnored(Exception):
+    """
+    Raised when the server answers a byte range request with the whole file.
+    """
+
+
+@dataclass
+class DownloadedFile:
+    """
+    Represents an asset saved to disk and its verification data.
+    """
+
+    path: str
+    size: int
+    checksum: str
+    algorithm: str = "sha256"
+
 
 class Download:
     """
     Class to download assets from INPE STAC Catalog.
+
+    Every transfer is verified while it is streamed to disk: the checksum is computed
+    chunk by chunk, the number of bytes is compared against ``Content-Length`` and HTML
+    error pages are rejected. Files that fail verification are removed and downloaded
+    again.
+
+    Downloads are written to a ``.part`` file renamed when complete, under a lock shared
+    by processes: when many workers request the same file into the same directory,
+    only one downloads it while the others wait and reuse the result.
+
+    Large files are split in byte ranges downloaded over many connections at once and
+    written in place into a preallocated file, when the server accepts range requests.
+
+    Args:
+        verify_geotiff: Check the TIFF signature of ``.tif`` assets.
+        attempts: How many times a file is downloaded before giving up.
+        algorithm: Any hash algorithm name supported by ``hashlib``.
+        monitor: Receives the request and progress events of every download.
+        segments: Max of connections per file. 1 disables segmented downloads.
+        segment_threshold: Files smaller than this (bytes) use a single connection.
+        limiter: Adjusts how many connections (and segments) download at once.
     """
 
-    def __init__(self):
+    def __init__(
+        self,
+        verify_geotiff: bool = False,
+        attempts: int = 3,
+        algorithm: str = "sha256",
+        monitor: Optional[Monitor] = None,
+        segments: int = 4,
+        segment_threshold: int = 64 * 2**20,
+        limiter: Optional[AdaptiveLimiter] = None,
+    ):
+        if attempts <= 0:
+            raise ValueError("Attempts must be greater than 0.")
+        elif segments <= 0:
+            raise ValueError("Segments must be greater than 0.")
+
         retries = Retry(
             total=3,
             connect=3,
@@ -25,10 +104,21 @@ class Download:
             status_forcelist=[500, 501, 502, 503, 504],
             allowed_methods={"GET"},
         )
+        self.verify_geotiff = verify_geotiff
+        self.attempts = attempts
+        self.algorithm = algorithm
+        self.monitor = monitor
+        self.segments = segments
+        self.segment_threshold = segment_threshold
+        self.limiter = limiter
+        adapter = HTTPAdapter(pool_maxsize=segments, max_retries=retries)
         self.session = Session()
-        self.session.mount("http://", HTTPAdapter(max_retries=retries))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
 
-    def download(self, url: str, credential: str, outdir: str) -> None | Exception:
+    def download(
+        self, url: str, credential: str, outdir: str
+    ) -> DownloadedFile | Exception:
         """
         Download the asset.
 
@@ -36,8 +126,11 @@ class Download:
             url: URL pointing to asset/band .TIFF
             credential: e-mail used in the explorer inpe platform.
             outdir: Output directory
+        Return:
+            The downloaded file path, size and checksum.
         Raise:
             ``Exception`` if any http error occurs.
+            ``IntegrityError`` if the file is still corrupted after all attempts.
         """
         if not exists(outdir):
             makedirs(outdir, exist_ok=True)
@@ -45,8 +138,50 @@ class Download:
         geotiff = basename(url)
 
         outfile = join(outdir, geotiff)
+        partfile = f"{outfile}.part"
+
+        with FileLock(f"{outfile}.lock") as lock:
+            # Another worker downloaded it while this one was waiting.
+            if lock.waited and exists(outfile):
+                try:
+                    return self.__verified(outfile, *self.__read_back(outfile))
+                except IntegrityError:
+                    pass
 
-        with self.session as session:
+            with self.session as session:
+                for attempt in range(1, self.attempts + 1):
+                    try:
+                        downloaded = self.__fetch(session, url, credential, outfile)
+                        replace(partfile, outfile)
+                        return downloaded
+                    except IntegrityError as err:
+                        if exists(partfile):
+                            remove(partfile)
+                        if attempt == self.attempts:
+                            raise IntegrityError(
+                                f"ERROR in {url} after {attempt} attempt(s). Reason: {err}"
+                            )
+                    except BaseException:
+                        if exists(partfile):
+                            remove(partfile)
+                        raise
+
+    def __fetch(
+        self,
+        session: Session,
+        url: str,
+        credential: str,
+        outfile: str,
+        segmented: bool = True,
+    ) -> DownloadedFile | Exception:
+        """
+        Stream the asset to the ``.part`` file of ``outfile`` verifying it on the fly.
+        """
+        # The request is timed once it has a slot, so the limiter queue is left out
+        with (
+            slot(self.limiter, "download") as lease,
+            track(self.monitor, "download", url) as event,
+        ):
             try:
                 response = session.get(
                     url,
@@ -54,12 +189,212 @@ class Download:
                     stream=True,
                     allow_redirects=True,
                 )
+                lease.responded(response.status_code, retries_of(response))
+                event.status = response.status_code
+                event.retries = lease.retries
                 response.raise_for_status()
-                with open(outfile, "wb") as f:
-                    for chunk in response.iter_content(chunk_size=4096):
-                        if chunk:
-                            f.write(chunk)
             except HTTPError as err:
                 raise Exception(
                     f"{response.status_code} - ERROR in {url}. Reason: {response.reason}. Exception: {err}"
                 )
+
+            headers = getattr(response, "headers", None) or {}
+
+            content_type = headers.get("Content-Type", "")
+            if content_type.startswith("text/html"):
+                raise IntegrityError(f"Server answered with {content_type} content.")
+
+            # Compressed transfers are decoded by requests, so the header size is useless.
+            expected_size = None
+            if headers.get("Content-Length") and headers.get(
+                "Content-Encoding", "identity"
+            ) in ("identity", ""):
+                expected_size = int(headers["Content-Length"])
+
+            ranges = headers.get("Accept-Ranges", "").lower() == "bytes"
+            large = (expected_size or 0) >= max(self.segment_threshold, 1)
+            if not (segmented and ranges and large and self.segments > 1):
+                return self.__stream(response, url, outfile, expected_size, event)
+
+            # The first response only told the size. Ranges are requested apart.
+            response.close()
+
+        try:
+            return self.__fetch_segments(
+                session, url, credential, outfile, expected_size
+            )
+        except RangesIgnored:
+            # Accept-Ranges was advertised but not honored: one stream fetches it
+            return self.__fetch(session, url, credential, outfile, segmented=False)
+
+    def __stream(
+        self, response, url: str, outfile: str, expected_size: Optional[int], event
+    ) -> DownloadedFile | Exception:
+        """
+        Write the response body to the ``.part`` file of ``outfile``.
+        """
+        digest = new_hash(self.algorithm)
+        size = 0
+        reported = 0
+        signature = b""
+
+        with open(f"{outfile}.part", "wb") as f:
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                if chunk:
+                    if len(signature) < 4:
+                        signature += chunk[: 4 - len(signature)]
+                    digest.update(chunk)
+                    size += len(chunk)
+                    f.write(chunk)
+                    event.bytes = size
+                    if self.monitor and size - reported >= PROGRESS_INTERVAL:
+                        reported = size
+                        self.monitor.emit(ProgressEvent(url, size, expected_size))
+
+        if expected_size is not None and size != expected_size:
+            raise IntegrityError(
+                f"Truncated transfer: expected {expected_size} bytes, got {size}."
+            )
+
+        return self.__verified(outfile, size, digest.hexdigest(), signature)
+
+    def __verified(
+        self, outfile: str, size: int, checksum: str, signature: bytes
+    ) -> DownloadedFile | Exception:
+        """
+        Check the file signature and describe the downloaded file.
+        """
+        if self.verify_geotiff and outfile.lower().endswith((".tif", ".tiff")):
+            if signature not in GEOTIFF_SIGNATURES:
+                raise IntegrityError("File is not a valid GeoTIFF.")
+
+        return DownloadedFile(
+            path=outfile,
+            size=size,
+            checksum=checksum,
+            algorithm=self.algorithm,
+        )
+
+    def __fetch_segments(
+        self,
+        session: Session,
+        url: str,
+        credential: str,
+        outfile: str,
+        size: int,
+    ) -> DownloadedFile | Exception:
+        """
+        Download byte ranges concurrently into the preallocated ``.part`` file.
+
+        Every range is a request of its own, with its own event.
+        """
+        step = -(-size // self.segments)
+        ranges = [
+            (start, min(start + step, size) - 1) for start in range(0, size, step)
+        ]
+        progress = {"bytes": 0, "reported": 0}
+        lock = Lock()
+        # Set on the first failure: the other segments stop, the file is fetched again
+        abort = Event()
+
+        partfile = f"{outfile}.part"
+        with open(partfile, "wb") as f:
+            f.truncate(size)
+
+        fd = os.open(partfile, os.O_WRONLY | getattr(os, "O_BINARY", 0))
+
+        def write(data: bytes, offset: int) -> None:
+            if hasattr(os, "pwrite"):
+                os.pwrite(fd, data, offset)
+            else:  # Windows has no positional writes
+                with lock:
+                    os.lseek(fd, offset, os.SEEK_SET)
+                    os.write(fd, data)
+
+        def fetch(byte_range: tuple) -> None:
+            start, end = byte_range
+            if abort.is_set():
+                return
+            with (
+                slot(self.limiter, "download") as lease,
+                track(self.monitor, "download", url) as event,
+            ):
+                response = session.get(
+                    url,
+                    params={"email": credential},
+                    headers={"Range": f"bytes={start}-{end}"},
+                    stream=True,
+                    allow_redirects=True,
+                )
+                lease.responded(response.status_code, retries_of(response))
+                event.status = response.status_code
+                event.retries = lease.retries
+                try:
+                    response.raise_for_status()
+                    if response.status_code != 206:
+                        raise RangesIgnored("Server ignored the byte range request.")
+
+                    offset = start
+                    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                        if abort.is_set():
+                            return
+                        if not chunk:
+                            continue
+                        if offset + len(chunk) > end + 1:
+                            raise IntegrityError(
+                                "Server sent more bytes than requested."
+                            )
+                        write(chunk, offset)
+                        offset += len(chunk)
+                        event.bytes = offset - start
+
+                        with lock:
+                            progress["bytes"] += len(chunk)
+                            unreported = progress["bytes"] - progress["reported"]
+                            if self.monitor and unreported >= PROGRESS_INTERVAL:
+                                progress["reported"] = progress["bytes"]
+                                self.monitor.emit(
+                                    ProgressEvent(url, progress["bytes"], size)
+                                )
+
+                    if offset != end + 1:
+                        raise IntegrityError(
+                            f"Truncated range {start}-{end}: got {offset - start} bytes."
+                        )
+                except HTTPError as err:
+                    raise Exception(
+                        f"{response.status_code} - ERROR in {url}. Reason: {response.reason}. Exception: {err}"
+                    )
+                finally:
+                    response.close()
+
+        try:
+            with ThreadPoolExecutor(max_workers=len(ranges)) as t_pool:
+                futures = [t_pool.submit(fetch, r) for r in ranges]
+                try:
+                    for future in as_completed(futures):
+                        future.result()
+                except BaseException:
+                    abort.set()
+                    for future in futures:
+                        future.cancel()
+                    raise
+        finally:
+            os.close(fd)
+
+        # The segments arrive out of order, so the checksum is computed afterwards.
+        return self.__verified(outfile, *self.__read_back(partfile))
+
+    def __read_back(self, path: str) -> tuple:
+        """
+        Size, checksum and signature of a file on disk.
+        """
+        digest = new_hash(self.algorithm)
+        size = 0
+        with open(path, "rb") as f:
+            signature = f.read(4)
+            f.seek(0)
+            while chunk := f.read(CHUNK_SIZE):
+                digest.update(chunk)
+                size += len(chunk)
+        return size, digest.hexdigest(), signature
@@ -4,6 +4,8 @@ from dataclasses import dataclass
 from typing import Union, Optional, TypeVar
 
 # Local Modules
+from .limiter import AdaptiveLimiter
+from .monitor import Monitor
 from .search import SearchItem
 from .utils.dataclass import SerializationCapabilities, ignore_extras
 
@@ -103,19 +105,26 @@ class Item(SerializationCapabilities):
             self.assets = Assets(**self.assets)
 
     @staticmethod
-    def from_search(_id: str, collection: str) -> Item | Exception:
+    def from_search(
+        _id: str,
+        collection: str,
+        monitor: Optional[Monitor] = None,
+        limiter: Optional[AdaptiveLimiter] = None,
+    ) -> Item | Exception:
         """
         Create an Item by making a search by ID inside a collection.
 
         Args:
             _id: Item ID
             collection: Collection to search into.
+            monitor: Receives the lookup request event.
+            limiter: Shared concurrency limit of the requests.
         Return:
             Item object.
         Raise:
             ``Exception`` if item not found.
         """
-        search = SearchItem()
+        search = SearchItem(monitor, limiter)
         search.ids(
             list([_id]),
             collection=collection,
@@ -128,11 +137,21 @@ class Item(SerializationCapabilities):
 
         return Item(**features[0])
 
-    def get_assets(self) -> None:
+    def get_assets(
+        self,
+        monitor: Optional[Monitor] = None,
+        limiter: Optional[AdaptiveLimiter] = None,
+    ) -> None:
         """
         Get assets/bands of the object.
+
+        Args:
+            monitor: Receives the lookup request event.
+            limiter: Shared concurrency limit of the requests.
         """
-        self.assets = Item.from_search(self.id, self.collection).assets
+        self.assets = Item.from_search(
+            self.id, self.collection, monitor, limiter
+        ).assets
 
     def has_band(self, band: str) -> bool:
         """
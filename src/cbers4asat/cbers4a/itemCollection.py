@@ -1,10 +1,11 @@
 # -*- coding: utf-8 -*-
 # Standard Libraries
 from dataclasses import dataclass
-from typing import Iterable
+from typing import Iterable, Optional
 
 # Local Modules
 from .item import Item
+from .monitor import Monitor
 from .utils.dataclass import ignore_extras, SerializationCapabilities
 
 
@@ -45,10 +46,13 @@ class ItemCollection(SerializationCapabilities):
         for feature in self.features:
             yield feature
 
-    def get_features_assets(self) -> None:
+    def get_features_assets(self, monitor: Optional[Monitor] = None) -> None:
         """
         STAC API return the items without assets, so, when needed, call this
         function to load all the assets inside every item.
+
+        Args:
+            monitor: Receives the lookup request events.
         """
         for feature in self.features:
-            feature.get_assets()
+            feature.get_assets(monitor)
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+# Standard Libraries
+from collections import deque
+from contextlib import contextmanager
+from threading import Condition
+from time import perf_counter
+from typing import Iterator, Optional
+
+# HTTP status codes of an overloaded server
+OVERLOAD_STATUS = (429, 500, 502, 503, 504)
+
+
+class Lease:
+    """
+    A request running inside the limiter. Tell it when the server responded.
+    """
+
+    def __init__(self, endpoint: str, saturated: bool):
+        self.endpoint = endpoint
+        self.saturated = saturated
+        self.start = perf_counter()
+        self.latency: Optional[float] = None
+        self.status: Optional[int] = None
+        self.retries = 0
+
+    def responded(self, status: int, retries: int = 0) -> None:
+        """
+        Record the response status and the time to it (time to first byte).
+
+        Args:
+            status: HTTP status code
+            retries: How many times the request was retried before this response
+        """
+        self.latency = perf_counter() - self.start
+        self.status = status
+        self.retries = retries
+
+
+class AdaptiveLimiter:
+    """
+    Concurrency limit of the requests to INPE's servers, adjusted as they respond
+    (additive increase, multiplicative decrease).
+
+    While responses are fast and successful, the limit grows by about one request per
+    round trip. When the server answers 429 or 5xx, requests are retried or fail to
+    connect, or the time to respond grows above ``tolerance`` times the fastest recent
+    one, the limit is multiplied by ``backoff``. Share one limiter between searches,
+    item lookups and downloads so all of them back off together.
+
+    Args:
+        initial: Limit to start with.
+        min_limit: The limit is never below it.
+        max_limit: The limit is never above it.
+        backoff: Factor the limit is multiplied by on overload.
+        tolerance: Latency ratio (recent over fastest) considered overload.
+        window: Recent latencies kept per endpoint to find the fastest.
+    Examples:
+        - limiter = AdaptiveLimiter(max_limit=16)
+        - Cbers4aAPI("me@mail.com", limiter=limiter).download(...); limiter.limit
+    """
+
+    def __init__(
+        self,
+        initial: int = 4,
+        min_limit: int = 1,
+        max_limit: int = 32,
+        backoff: float = 0.5,
+        tolerance: float = 2.0,
+        window: int = 100,
+    ):
+        if not 0 < min_limit <= initial <= max_limit:
+            raise ValueError("Limits must be 0 < min_limit <= initial <= max_limit.")
+        elif not 0 < backoff < 1:
+            raise ValueError("Backoff must be between 0 and 1.")
+        elif tolerance <= 1:
+            raise ValueError("Tolerance must be greater than 1.")
+
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.tolerance = tolerance
+        self.window = window
+        self._limit = float(initial)
+        self._in_flight = 0
+        self._completed = 0
+        self._decreased_at: Optional[int] = None
+        self._latencies: dict[str, deque] = dict()
+        self._recent: dict[str, float] = dict()
+        self._condition = Condition()
+
+    @property
+    def limit(self) -> int:
+        """
+        Current max of concurrent requests.
+        """
+        return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        """
+        Requests running now.
+        """
+        return self._in_flight
+
+    def acquire(self, endpoint: str) -> Lease:
+        """
+        Wait until a request fits the limit.
+
+        Args:
+            endpoint: Endpoint name. Ex.: search
+        Return:
+            The lease to be released when the request is done.
+        """
+        with self._condition:
+            while self._in_flight >= int(self._limit):
+                self._condition.wait()
+            self._in_flight += 1
+            return Lease(endpoint, self._in_flight >= int(self._limit))
+
+    def release(self, lease: Lease, error: bool = False) -> None:
+        """
+        Finish a request and adjust the limit from its outcome.
+
+        Args:
+            lease: Lease returned by ``acquire``
+            error: The request raised an exception
+        """
+        if lease.latency is None:
+            lease.latency = perf_counter() - lease.start
+
+        with self._condition:
+            self._in_flight -= 1
+            self._completed += 1
+
+            if self.__overloaded(lease, error):
+                self.__decrease()
+            elif not error and lease.status is not None and lease.saturated:
+                # Only grow when the limit is being used
+                self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+
+            self._condition.notify_all()
+
+    @contextmanager
+    def slot(self, endpoint: str) -> Iterator[Lease]:
+        """
+        Run a request inside the limit.
+
+        Args:
+            endpoint: Endpoint name. Ex.: search
+        Return:
+            The lease, to call ``responded`` when the response arrives.
+        """
+        lease = self.acquire(endpoint)
+        try:
+            yield lease
+        except BaseException:
+            self.release(lease, error=True)
+            raise
+        else:
+            self.release(lease)
+
+    def __overloaded(self, lease: Lease, error: bool) -> bool:
+        """
+        Whether the request outcome tells the server is overloaded.
+        """
+        if lease.status is None:
+            # Failed before any response: connection errors and timeouts
+            return error
+        if lease.status in OVERLOAD_STATUS or lease.retries:
+            return True
+        if lease.status >= 400:
+            return False
+
+        latencies = self._latencies.setdefault(
+            lease.endpoint, deque(maxlen=self.window)
+        )
+        latencies.append(lease.latency)
+        recent = self._recent.get(lease.endpoint, lease.latency)
+        recent = self._recent[lease.endpoint] = 0.8 * recent + 0.2 * lease.latency
+
+        return len(latencies) >= 5 and recent > self.tolerance * min(latencies)
+
+    def __decrease(self) -> None:
+        """
+        Cut the limit, once per round of the requests running when it was last cut.
+        """
+        if self._decreased_at is not None:
+            if self._completed - self._decreased_at < int(self._limit):
+                return
+
+        self._limit = max(self.min_limit, self._limit * self.backoff)
+        self._decreased_at = self._completed
+
+
+@contextmanager
+def slot(limiter: Optional[AdaptiveLimiter], endpoint: str) -> Iterator[Lease]:
+    """
+    ``AdaptiveLimiter.slot`` that also works without a limiter.
+    """
+    if limiter is None:
+        yield Lease(endpoint, False)
+    else:
+        with limiter.slot(endpoint) as lease:
+            yield lease
@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+# Standard Libraries
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass
+from threading import Lock
+from time import perf_counter
+from typing import Callable, Iterator, Optional, Union
+
+
+@dataclass
+class RequestEvent:
+    """
+    Represents a finished HTTP request (a search, an item lookup or a file download).
+    """
+
+    endpoint: str
+    url: str
+    status: Optional[int] = None
+    bytes: int = 0
+    elapsed: float = 0.0
+    retries: int = 0
+    error: Optional[str] = None
+
+
+@dataclass
+class ProgressEvent:
+    """
+    Represents the progress of a file download.
+    """
+
+    url: str
+    bytes: int
+    total: Optional[int] = None
+
+
+Event = Union[RequestEvent, ProgressEvent]
+
+
+class Monitor:
+    """
+    Instrumentation hub for searches, item lookups and downloads.
+
+    Every callback receives each ``RequestEvent`` and ``ProgressEvent`` as they happen
+    and the monitor keeps aggregate statistics per endpoint (``search``, ``item`` and
+    ``download``).
+
+    Args:
+        callbacks: Functions called with every event.
+        window: How many recent latencies are kept per endpoint to compute percentiles.
+    Examples:
+        - monitor = Monitor([print])
+        - Cbers4aAPI("me@mail.com", monitor=monitor).download(...); monitor.stats()
+    """
+
+    def __init__(
+        self,
+        callbacks: Optional[list[Callable[[Event], None]]] = None,
+        window: int = 1000,
+    ):
+        self.callbacks = list(callbacks or [])
+        self.window = window
+        self._lock = Lock()
+        self._latencies: dict[str, deque] = dict()
+        self._totals: dict[str, dict] = dict()
+
+    def subscribe(self, callback: Callable[[Event], None]) -> None:
+        """
+        Add a function to be called with every event.
+
+        Args:
+            callback: Function that receives an event.
+        """
+        self.callbacks.append(callback)
+
+    def emit(self, event: Event) -> None:
+        """
+        Record the event and forward it to the callbacks.
+
+        Args:
+            event: Request or progress event.
+        """
+        if isinstance(event, RequestEvent):
+            now = perf_counter()
+            with self._lock:
+                totals = self._totals.setdefault(
+                    event.endpoint,
+                    {
+                        "requests": 0,
+                        "errors": 0,
+                        "retries": 0,
+                        "bytes": 0,
+                        "first": now - event.elapsed,
+                        "last": now,
+                    },
+                )
+                totals["requests"] += 1
+                totals["errors"] += event.error is not None
+                totals["retries"] += event.retries
+                totals["bytes"] += event.bytes
+                totals["first"] = min(totals["first"], now - event.elapsed)
+                totals["last"] = now
+
+                self._latencies.setdefault(
+                    event.endpoint, deque(maxlen=self.window)
+                ).append(event.elapsed)
+
+        for callback in self.callbacks:
+            callback(event)
+
+    @contextmanager
+    def track(self, endpoint: str, url: str) -> Iterator[RequestEvent]:
+        """
+        Time a request and emit its event when done. Exceptions are recorded as errors.
+
+        Args:
+            endpoint: Endpoint name. Ex.: search
+            url: Requested URL
+        Return:
+            The event to be filled with status, bytes and retries.
+        """
+        event = RequestEvent(endpoint=endpoint, url=url)
+        start = perf_counter()
+        try:
+            yield event
+        except BaseException as err:
+            event.error = str(err) or type(err).__name__
+            raise
+        finally:
+            event.elapsed = perf_counter() - start
+            self.emit(event)
+
+    def stats(self) -> dict[str, dict]:
+        """
+        Aggregate statistics per endpoint.
+
+        Return:
+            Dictionary like ``{"download": {"requests": 4, "errors": 0, "retries": 1,
+            "bytes": 1024, "mb_per_s": 0.5, "p50": 0.2, "p95": 0.4}}``. Throughput uses
+            the wall time between the first and the last request of the endpoint.
+        """
+        with self._lock:
+            result = dict()
+            for endpoint, totals in self._totals.items():
+                latencies = sorted(self._latencies[endpoint])
+                wall = totals["last"] - totals["first"]
+                result[endpoint] = {
+                    "requests": totals["requests"],
+                    "errors": totals["errors"],
+                    "retries": totals["retries"],
+                    "bytes": totals["bytes"],
+                    "mb_per_s": totals["bytes"] / 1e6 / wall if wall > 0 else 0.0,
+                    "p50": self.__percentile(latencies, 50),
+                    "p95": self.__percentile(latencies, 95),
+                }
+            return result
+
+    def reset(self) -> None:
+        """
+        Clear the aggregate statistics.
+        """
+        with self._lock:
+            self._latencies.clear()
+            self._totals.clear()
+
+    @staticmethod
+    def __percentile(values: list[float], percent: int) -> float:
+        """
+        Nearest-rank percentile of sorted values.
+        """
+        if not values:
+            return 0.0
+        rank = max(0, -(-percent * len(values) // 100) - 1)
+        return values[rank]
+
+
+def track(
+    monitor: Optional[Monitor], endpoint: str, url: str
+) -> Union[Iterator[RequestEvent], nullcontext]:
+    """
+    ``Monitor.track`` that also works without a monitor.
+    """
+    if monitor is None:
+        return nullcontext(RequestEvent(endpoint=endpoint, url=url))
+    return monitor.track(endpoint, url)
+
+
+def size_of(response) -> int:
+    """
+    Response size in bytes, from its ``Content-Length`` header.
+    """
+    headers = getattr(response, "headers", None) or {}
+    return int(headers.get("Content-Length", 0))
+
+
+def retries_of(response) -> int:
+    """
+    How many times urllib3 retried to get this response.
+    """
+    retries = getattr(getattr(response, "raw", None), "retries", None)
+    return len(getattr(retries, "history", None) or ())
+
+
+class PrometheusExporter:
+    """
+    Publish the monitor events as Prometheus metrics.
+
+    Requires ``prometheus-client`` (``pip install cbers4asat[metrics]``).
+
+    Args:
+        monitor: Monitor to subscribe.
+        registry: Prometheus registry. Default is the global registry.
+        namespace: Metrics name prefix.
+    """
+
+    def __init__(self, monitor: Monitor, registry=None, namespace: str = "cbers4asat"):
+        try:
+            from prometheus_client import Counter, Histogram, REGISTRY
+        except ImportError:
+            raise ImportError(
+                "PrometheusExporter requires prometheus-client. Install cbers4asat[metrics]."
+            )
+
+        registry = registry if registry is not None else REGISTRY
+
+        self.requests = Counter(
+            "requests",
+            "Requests to INPE's catalog",
+            ["endpoint", "status"],
+            namespace=namespace,
+            registry=registry,
+        )
+        self.retries = Counter(
+            "retries",
+            "Retried requests to INPE's catalog",
+            ["endpoint"],
+            namespace=namespace,
+            registry=registry,
+        )
+        self.bytes = Counter(
+            "transferred_bytes",
+            "Bytes received from INPE's catalog",
+            ["endpoint"],
+            namespace=namespace,
+            registry=registry,
+        )
+        self.latency = Histogram(
+            "request_duration_seconds",
+            "Requests latency",
+            ["endpoint"],
+            namespace=namespace,
+            registry=registry,
+        )
+
+        monitor.subscribe(self)
+
+    def __call__(self, event: Event) -> None:
+        if not isinstance(event, RequestEvent):
+            return
+
+        status = "error" if event.status is None else str(event.status)
+        self.requests.labels(event.endpoint, status).inc()
+        self.retries.labels(event.endpoint).inc(event.retries)
+        self.bytes.labels(event.endpoint).inc(event.bytes)
+        self.latency.labels(event.endpoint).observe(event.elapsed)
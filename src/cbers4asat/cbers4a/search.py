@@ -1,13 +1,17 @@
 # -*- coding: utf-8 -*-
 # Standard Libraries
+from contextlib import nullcontext
 from datetime import date
-from typing import Union
+from typing import Optional, Union
 
 # PyPi Packages
 from requests import Session, HTTPError
 
 # Local Modules
 from .collections import Collections
+from .limiter import AdaptiveLimiter, slot
+from .monitor import Monitor, track, retries_of, size_of
+from .search_cache import SearchCache
 from .request import (
     STACRequestBody,
     Providers,
@@ -24,8 +28,14 @@ class SearchItem:
     # INPE STAC search item in collection
     BASE_URL_SEARCH_ITEM: str = "https://www.dgi.inpe.br/lgi-stac/collections"
 
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        monitor: Optional[Monitor] = None,
+        limiter: Optional[AdaptiveLimiter] = None,
+    ) -> None:
         self.search_item_body: STACItemRequestBody = STACItemRequestBody()
+        self.monitor = monitor
+        self.limiter = limiter
 
     def __call__(self) -> dict | Exception:
         """
@@ -39,11 +49,18 @@ class SearchItem:
         features = list()
         with Session() as session:
             for id_ in self.search_item_body.ids:
+                url = self.item_url(id_)
                 try:
-                    response = session.get(
-                        f"{self.BASE_URL_SEARCH_ITEM}/{self.search_item_body.collection}/items/{id_}"
-                    )
-                    response.raise_for_status()
+                    with (
+                        slot(self.limiter, "item") as lease,
+                        track(self.monitor, "item", url) as event,
+                    ):
+                        response = session.get(url)
+                        lease.responded(response.status_code, retries_of(response))
+                        event.status = response.status_code
+                        event.retries = retries_of(response)
+                        event.bytes = size_of(response)
+                        response.raise_for_status()
                     feature = response.json()
                     if feature.get("type") == "Feature":
                         features.append(feature)
@@ -54,6 +71,12 @@ class SearchItem:
 
         return {"type": "FeatureCollection", "features": features}
 
+    def item_url(self, id_: str) -> str:
+        """
+        URL of an item of the searched collection.
+        """
+        return f"{self.BASE_URL_SEARCH_ITEM}/{self.search_item_body.collection}/items/{id_}"
+
     def ids(
         self, ids: list[str], collection: Union[str, Collections]
     ) -> None | Exception:
@@ -85,9 +108,20 @@ class Search:
     # INPE STAC Catalog
     BASE_URL_SEARCH: str = "https://www.dgi.inpe.br/stac-compose/stac/search/"
 
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        monitor: Optional[Monitor] = None,
+        session: Optional[Session] = None,
+        cache: Optional[SearchCache] = None,
+        limiter: Optional[AdaptiveLimiter] = None,
+    ) -> None:
         self.stac_request_body = STACRequestBody()
         self.providers_body = Providers()
+        self.monitor = monitor
+        # Shared (pooled) session of batch queries. Default is one session per call.
+        self.session = session
+        self.cache = cache
+        self.limiter = limiter
 
     def __call__(self) -> dict | Exception:
         """
@@ -98,35 +132,70 @@ class Search:
         Raise:
             ``Exception`` if any http error.
         """
-        self.stac_request_body.providers.append(self.providers_body)
-        with Session() as session:
+        body = self.request_body()
+
+        if self.cache is None:
+            return self.__post(body)
+        return self.cache.get_or_fetch(body, lambda: self.__post(body))
+
+    def request_body(self) -> dict:
+        """
+        Request body of the search parameters.
+        """
+        # The providers body is set (not appended), so calling again sends the same body
+        self.stac_request_body.providers = [self.providers_body]
+        return self.stac_request_body.asdict(exclude_none=True)
+
+    @staticmethod
+    def features(response: dict) -> dict:
+        """
+        Merge the features of every collection in the search response.
+
+        Args:
+            response: Search response JSON
+        Return:
+            GeoJson-like dictionary.
+        """
+        # Response Root Keys are the providers, like: "LGI-CDSR', "DATA-INPE"...
+        # Get the only provider that will be supported by cbers4asat lib.
+        collections = response.get("LGI-CDSR", None)
+        # Second level of keys are the collections, like "AMAZONIA1_WFI_L2_DN".
+        # Every collection will be grouped inside this variable bellow.
+        feature_collection = {"type": "FeatureCollection", "features": []}
+
+        if not collections:
+            return feature_collection
+
+        # For every collection...
+        for name, content in collections.items():
+            if not isinstance(content, dict):
+                continue
+
+            if not content.get("features", None):
+                continue
+
+            # Append all collection features in one
+            feature_collection["features"].extend(content["features"])
+        return feature_collection
+
+    def __post(self, body: dict) -> dict | Exception:
+        """
+        Post the request body to INPE's catalog and merge the collections features.
+        """
+        shared = self.session is not None
+        with nullcontext(self.session) if shared else Session() as session:
             try:
-                response = session.post(
-                    self.BASE_URL_SEARCH,
-                    json=self.stac_request_body.asdict(exclude_none=True),
-                )
-                response.raise_for_status()
-                # Response Root Keys are the providers, like: "LGI-CDSR', "DATA-INPE"...
-                # Get the only provider that will be supported by cbers4asat lib.
-                collections = response.json().get("LGI-CDSR", None)
-                # Second level of keys are the collections, like "AMAZONIA1_WFI_L2_DN".
-                # Every collection will be grouped inside this variable bellow.
-                feature_collection = {"type": "FeatureCollection", "features": []}
-
-                if not collections:
-                    return feature_collection
-
-                # For every collection...
-                for name, content in collections.items():
-                    if not isinstance(content, dict):
-                        continue
-
-                    if not content.get("features", None):
-                        continue
-
-                    # Append all collection features in one
-                    feature_collection["features"].extend(content["features"])
-                return feature_collection
+                with (
+                    slot(self.limiter, "search") as lease,
+                    track(self.monitor, "search", self.BASE_URL_SEARCH) as event,
+                ):
+                    response = session.post(self.BASE_URL_SEARCH, json=body)
+                    lease.responded(response.status_code, retries_of(response))
+                    event.status = response.status_code
+                    event.retries = retries_of(response)
+                    event.bytes = size_of(response)
+                    response.raise_for_status()
+                return self.features(response.json())
             except HTTPError as err:
                 raise Exception(
                     f"{response.status_code} - ERROR in query. Reason: {response.reason}. Exception: {err}"
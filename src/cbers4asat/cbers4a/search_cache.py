@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+# Standard Libraries
+from copy import deepcopy
+from datetime import date
+from hashlib import sha256
+from json import dumps, load, dump
+from os import makedirs, remove
+from os.path import exists, join
+from threading import Event, Lock
+from time import time
+from typing import Callable, Optional
+
+# Local Modules
+from .utils.cache import LRUCache
+from .utils.files import atomic_write
+
+
+class SearchCache:
+    """
+    Cache of search results, keyed by the hash of the normalized request body.
+
+    Results live in an in-memory LRU cache and, optionally, in a disk cache directory
+    shared by processes and runs. Searches whose date interval reaches today expire
+    sooner, since new scenes may still be published. Concurrent identical searches
+    share a single request to INPE's catalog.
+
+    Args:
+        max_items: Max number of results kept in memory.
+        cache_dir: (Optional) Directory to also cache results on disk.
+        ttl: Seconds to keep results of past date intervals.
+        recent_ttl: Seconds to keep results of date intervals that reach today.
+    Examples:
+        - cache = SearchCache(cache_dir="./searches")
+        - Cbers4aAPI.query(..., cache=cache)
+    """
+
+    def __init__(
+        self,
+        max_items: int = 256,
+        cache_dir: Optional[str] = None,
+        ttl: float = 24 * 3600,
+        recent_ttl: float = 300,
+    ):
+        self.memory = LRUCache(max_items=max_items)
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.recent_ttl = recent_ttl
+        self._flights: dict = dict()
+        self._lock = Lock()
+
+        if self.cache_dir is not None:
+            makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(body: dict) -> str:
+        """
+        Hash of the request body, regardless of keys and collections order.
+        """
+        body = deepcopy(body)
+        for provider in body.get("providers", []):
+            provider["collections"] = sorted(
+                provider.get("collections") or [], key=lambda c: str(c.get("name"))
+            )
+        canonical = dumps(body, sort_keys=True, separators=(",", ":"), default=str)
+        return sha256(canonical.encode()).hexdigest()
+
+    def expiration(self, body: dict) -> float:
+        """
+        Seconds the result of a request body is kept.
+        """
+        interval = body.get("datetime")
+        if not interval:
+            return self.recent_ttl
+
+        end = interval.split("/")[-1][:10]
+        try:
+            reaches_today = date.fromisoformat(end) >= date.today()
+        except ValueError:
+            reaches_today = True
+
+        return self.recent_ttl if reaches_today else self.ttl
+
+    def get_or_fetch(self, body: dict, fetch: Callable[[], dict]) -> dict:
+        """
+        Cached result of a request body, or the result of ``fetch`` (then cached).
+
+        Args:
+            body: Search request body
+            fetch: Makes the request. Called once for concurrent identical searches.
+        Return:
+            GeoJson-like dictionary.
+        """
+        key = self.key(body)
+
+        result = self.__lookup(key)
+        if result is not None:
+            return deepcopy(result)
+
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = {"done": Event()}
+
+        if not leader:
+            flight["done"].wait()
+            if "error" in flight:
+                raise flight["error"]
+            return deepcopy(flight["result"])
+
+        try:
+            # A previous flight may have finished since the first lookup
+            result = self.__lookup(key)
+            if result is None:
+                result = fetch()
+                self.__store(key, result, time() + self.expiration(body))
+            flight["result"] = result
+        except Exception as err:
+            flight["error"] = err
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight["done"].set()
+
+        return deepcopy(result)
+
+    def clear(self) -> None:
+        """
+        Remove all cached results from memory. The disk cache is kept.
+        """
+        self.memory.clear()
+
+    def __lookup(self, key: str) -> Optional[dict]:
+        """
+        Unexpired result from memory or disk.
+        """
+        entry = self.memory.get(key)
+        if entry is not None:
+            result, expires = entry
+            if expires > time():
+                return result
+            self.memory.pop(key)
+
+        if self.cache_dir is None:
+            return None
+
+        path = join(self.cache_dir, f"{key}.json")
+        if not exists(path):
+            return None
+
+        try:
+            with open(path) as f:
+                entry = load(f)
+        except (OSError, ValueError):
+            return None
+
+        if entry["expires"] <= time():
+            try:
+                remove(path)
+            except OSError:
+                pass
+            return None
+
+        self.memory.set(key, (entry["result"], entry["expires"]))
+        return entry["result"]
+
+    def __store(self, key: str, result: dict, expires: float) -> None:
+        """
+        Keep a result in memory and disk.
+        """
+        self.memory.set(key, (result, expires))
+
+        if self.cache_dir is None:
+            return
+
+        path = join(self.cache_dir, f"{key}.json")
+        with atomic_write(path, "w") as f:
+            dump({"expires": expires, "result": result}, f)
@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+# Standard Libraries
+from collections import Counter
+from hashlib import sha256
+from json import load as json_load, dump as json_dump
+from os import link, makedirs, remove, replace
+from os.path import basename, exists, join
+from shutil import copyfile, rmtree
+from tempfile import mkdtemp
+from threading import Lock
+from time import time
+from typing import Optional
+
+# Local Modules
+from .download import Download, DownloadedFile
+from .utils.lock import FileLock
+
+# Linux ioctl request to share the extents of a file (copy-on-write clone).
+FICLONE = 0x40049409
+
+
+class AssetStore:
+    """
+    Content-addressable local store of downloaded assets.
+
+    Assets are kept once per content (by checksum) inside ``root/objects`` and the
+    ``manifest.json`` maps every ``collection/scene/file`` key to its content. When an
+    asset is requested again, no matter the output directory, it is hard linked (or
+    reflinked/copied when linking is not possible) from the store instead of being
+    downloaded. A store directory can be shared by many processes: an asset is
+    downloaded by only one of them and the manifest updates are merged.
+
+    Args:
+        root: Store directory
+        max_size: Maximum size in bytes. Least recently used assets are evicted above it.
+    Notes:
+        Hard linked files share the content with the store, so edit copies, not the
+        downloaded files.
+    """
+
+    MANIFEST: str = "manifest.json"
+
+    def __init__(self, root: str, max_size: Optional[int] = None):
+        if max_size is not None and max_size <= 0:
+            raise ValueError("Max size must be greater than 0.")
+
+        self.root = root
+        self.max_size = max_size
+        self._lock = Lock()
+        self._key_locks: dict[str, Lock] = dict()
+        # Contents being placed, which eviction skips
+        self._placing: Counter = Counter()
+
+        makedirs(join(self.root, "objects"), exist_ok=True)
+        makedirs(join(self.root, "tmp"), exist_ok=True)
+
+        self._manifest = self.__read_manifest()
+
+    @staticmethod
+    def key(collection: str, scene_id: str, url: str) -> str:
+        """
+        Store key of an asset.
+
+        Args:
+            collection: Collection name
+            scene_id: Item ID
+            url: Asset URL
+        Return:
+            ``collection/scene_id/filename`` key.
+        """
+        return f"{collection}/{scene_id}/{basename(url)}"
+
+    @property
+    def size(self) -> int:
+        """
+        Bytes used by the stored assets.
+        """
+        with self._lock:
+            return sum(obj["size"] for obj in self.__objects().values())
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            entry = self._manifest["entries"].get(key)
+            return entry is not None and exists(self.__object_path(entry["checksum"]))
+
+    def download(
+        self,
+        url: str,
+        credential: str,
+        outdir: str,
+        collection: str,
+        scene_id: str,
+        downloader: Optional[Download] = None,
+    ) -> str | Exception:
+        """
+        Place the asset inside the output directory, downloading it only if the store
+        does not have it yet.
+
+        Args:
+            url: URL pointing to asset/band .TIFF
+            credential: e-mail used in the explorer inpe platform.
+            outdir: Output directory
+            collection: Collection name
+            scene_id: Item ID
+            downloader: ``Download`` instance used on store misses.
+        Return:
+            Output file path.
+        Raise:
+            ``Exception`` if any http error occurs.
+        """
+        key = self.key(collection, scene_id, url)
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, Lock())
+
+        lockfile = join(self.root, "tmp", f"{sha256(key.encode()).hexdigest()}.lock")
+
+        makedirs(outdir, exist_ok=True)
+        outfile = join(outdir, basename(url))
+
+        # Concurrent requests of the same asset, from any process, wait for the first
+        # download. The file is placed before the lock is released.
+        with key_lock, FileLock(lockfile):
+            downloader = downloader or Download()
+            checksum = self.__lookup(key)
+            if checksum is None:
+                self.__reload()
+                checksum = self.__lookup(key)
+            if checksum is None:
+                checksum = self.__store(key, url, credential, downloader)
+            held = [checksum]
+
+            try:
+                try:
+                    self.__place(self.__object_path(checksum), outfile)
+                except FileNotFoundError:
+                    # Evicted by another process meanwhile: store it again
+                    checksum = self.__store(key, url, credential, downloader)
+                    held.append(checksum)
+                    self.__place(self.__object_path(checksum), outfile)
+            finally:
+                with self._lock:
+                    for placed in held:
+                        self._placing[placed] -= 1
+                        if self._placing[placed] <= 0:
+                            del self._placing[placed]
+
+        self.evict()
+
+        return outfile
+
+    def evict(self) -> None:
+        """
+        Remove the least recently used assets until the store fits ``max_size``.
+        """
+        if self.max_size is None:
+            return
+
+        with self._lock:
+            objects = self.__objects()
+            total = sum(obj["size"] for obj in objects.values())
+            evicted = False
+
+            for checksum, obj in sorted(
+                objects.items(), key=lambda item: item[1]["accessed"]
+            ):
+                if total <= self.max_size:
+                    break
+                if checksum in self._placing:
+                    continue
+
+                if exists(self.__object_path(checksum)):
+                    remove(self.__object_path(checksum))
+                total -= obj["size"]
+                evicted = True
+
+                self._manifest["entries"] = {
+                    key: entry
+                    for key, entry in self._manifest["entries"].items()
+                    if entry["checksum"] != checksum
+                }
+
+            if evicted:
+                self.__write_manifest()
+
+    def __reload(self) -> None:
+        """
+        Take the entries stored by other processes.
+        """
+        with self._lock:
+            self.__merge(self.__read_manifest())
+
+    def __merge(self, manifest: dict) -> None:
+        """
+        Add the entries of another manifest whose content is still stored.
+        """
+        entries = self._manifest["entries"]
+        for key, entry in manifest["entries"].items():
+            if not exists(self.__object_path(entry["checksum"])):
+                continue
+            if key not in entries or entries[key]["accessed"] < entry["accessed"]:
+                entries[key] = entry
+
+    def __lookup(self, key: str) -> Optional[str]:
+        """
+        Content checksum of the key, if it is still stored. The content is kept from
+        eviction until placed.
+        """
+        with self._lock:
+            entry = self._manifest["entries"].get(key)
+            if entry is None or not exists(self.__object_path(entry["checksum"])):
+                return None
+
+            # Saved with the next manifest change, not on every hit
+            entry["accessed"] = time()
+            self._placing[entry["checksum"]] += 1
+            return entry["checksum"]
+
+    def __store(
+        self, key: str, url: str, credential: str, downloader: Download
+    ) -> str | Exception:
+        """
+        Download the asset into the store and register it in the manifest. The
+        content is kept from eviction until placed.
+        """
+        tmpdir = mkdtemp(dir=join(self.root, "tmp"))
+        try:
+            downloaded: DownloadedFile = downloader.download(url, credential, tmpdir)
+            object_path = self.__object_path(downloaded.checksum)
+
+            makedirs(join(self.root, "objects", downloaded.checksum[:2]), exist_ok=True)
+
+            if exists(object_path):  # Same content under another key.
+                remove(downloaded.path)
+            else:
+                replace(downloaded.path, object_path)
+        finally:
+            rmtree(tmpdir, ignore_errors=True)
+
+        with self._lock:
+            self._manifest["entries"][key] = {
+                "checksum": downloaded.checksum,
+                "size": downloaded.size,
+                "accessed": time(),
+            }
+            self._placing[downloaded.checksum] += 1
+            self.__write_manifest()
+
+        return downloaded.checksum
+
+    @staticmethod
+    def __place(source: str, outfile: str) -> None:
+        """
+        Hard link the stored file into output path. Fallback to reflink or copy.
+        """
+        if exists(outfile):
+            remove(outfile)
+
+        try:
+            link(source, outfile)
+        except OSError:
+            try:
+                from fcntl import ioctl
+
+                with open(source, "rb") as src, open(outfile, "wb") as dst:
+                    ioctl(dst.fileno(), FICLONE, src.fileno())
+            except (ImportError, OSError):
+                copyfile(source, outfile)
+
+    def __objects(self) -> dict[str, dict]:
+        """
+        Stored contents with their size and most recent access time.
+        """
+        objects = dict()
+        for entry in self._manifest["entries"].values():
+            obj = objects.setdefault(
+                entry["checksum"], {"size": entry["size"], "accessed": 0}
+            )
+            obj["accessed"] = max(obj["accessed"], entry["accessed"])
+        return objects
+
+    def __object_path(self, checksum: str) -> str:
+        return join(self.root, "objects", checksum[:2], checksum)
+
+    def __read_manifest(self) -> dict:
+        path = join(self.root, self.MANIFEST)
+        if not exists(path):
+            return {"version": 1, "entries": {}}
+
+        with open(path) as f:
+            return json_load(f)
+
+    def __write_manifest(self) -> None:
+        path = join(self.root, self.MANIFEST)
+        with FileLock(f"{path}.lock"):
+            self.__merge(self.__read_manifest())
+            with open(f"{path}.tmp", "w") as f:
+                json_dump(self._manifest, f)
+            replace(f"{path}.tmp", path)
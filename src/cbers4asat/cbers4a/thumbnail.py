@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+# Standard Libraries
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha256
+from os import makedirs
+from os.path import exists, join
+from typing import Optional, Union
+
+# PyPi Packages
+from requests import Session, RequestException
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+
+# Local Modules
+from .itemCollection import ItemCollection
+from .monitor import Monitor, track, retries_of
+from .utils.cache import LRUCache
+from .utils.files import atomic_write
+
+
+class ThumbnailFetcher:
+    """
+    Fetch scene thumbnails concurrently, with a pooled session and a content cache.
+
+    Thumbnails are kept in a size-bounded in-memory LRU cache and, optionally, in a disk
+    cache directory, so browsing the same results again does not reach INPE's servers.
+
+    Args:
+        max_workers: Max of concurrent downloads (and pooled connections).
+        cache_bytes: Max bytes kept in the memory cache.
+        cache_dir: (Optional) Directory to also cache thumbnails on disk.
+        monitor: Receives the request event of every thumbnail download.
+    Examples:
+        - fetcher = ThumbnailFetcher(cache_dir="./thumbnails")
+        - images = fetcher.fetch(Cbers4aAPI.query(...))
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 16,
+        cache_bytes: int = 64 * 2**20,
+        cache_dir: Optional[str] = None,
+        monitor: Optional[Monitor] = None,
+    ):
+        if max_workers <= 0:
+            raise ValueError("Max workers must be greater than 0.")
+
+        retries = Retry(
+            total=3,
+            backoff_factor=0.5,
+            status_forcelist=[500, 502, 503, 504],
+            allowed_methods={"GET"},
+        )
+        adapter = HTTPAdapter(
+            pool_connections=max_workers, pool_maxsize=max_workers, max_retries=retries
+        )
+
+        self.max_workers = max_workers
+        self.cache = LRUCache(max_bytes=cache_bytes)
+        self.cache_dir = cache_dir
+        self.monitor = monitor
+        self.session = Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        if self.cache_dir is not None:
+            makedirs(self.cache_dir, exist_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self) -> None:
+        """
+        Close the pooled connections.
+        """
+        self.session.close()
+
+    def fetch(self, products, decode: bool = False) -> dict[str, Union[bytes, None]]:
+        """
+        Fetch the thumbnails of all given scenes at once.
+
+        Args:
+            products: Query result dictionary, ``ItemCollection`` or GeoDataFrame from ``to_geodataframe``
+            decode: Return arrays (bands, height, width) instead of PNG bytes. Requires cbers4asat[tools].
+        Return:
+            Dictionary of scene id and thumbnail. Thumbnails that could not be fetched are None.
+        """
+        hrefs = self.__hrefs(products)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as t_pool:
+            images = dict(zip(hrefs, t_pool.map(self.get, hrefs.values())))
+
+        if decode:
+            return {
+                id_: None if image is None else self.decode(image)
+                for id_, image in images.items()
+            }
+        return images
+
+    def get(self, href: str) -> Optional[bytes]:
+        """
+        Get one thumbnail from the memory cache, the disk cache or INPE's server.
+
+        Args:
+            href: Thumbnail URL
+        Return:
+            PNG bytes or None if the download failed.
+        """
+        image = self.cache.get(href)
+        if image is not None:
+            return image
+
+        path = None
+        if self.cache_dir is not None:
+            path = join(self.cache_dir, sha256(href.encode()).hexdigest())
+            if exists(path):
+                with open(path, "rb") as f:
+                    image = f.read()
+                self.cache.set(href, image)
+                return image
+
+        try:
+            with track(self.monitor, "thumbnail", href) as event:
+                response = self.session.get(href)
+                event.status = response.status_code
+                event.retries = retries_of(response)
+                response.raise_for_status()
+                image = response.content
+                event.bytes = len(image)
+        except RequestException:
+            return None
+
+        self.cache.set(href, image)
+
+        if path is not None:
+            with atomic_write(path) as f:
+                f.write(image)
+
+        return image
+
+    @staticmethod
+    def decode(image: bytes):
+        """
+        Decode thumbnail bytes into an array with shape (bands, height, width).
+        """
+        from rasterio.io import MemoryFile
+
+        with MemoryFile(image) as memfile, memfile.open() as dataset:
+            return dataset.read()
+
+    @staticmethod
+    def __hrefs(products) -> dict[str, str]:
+        """
+        Scene id and thumbnail URL of every product.
+        """
+        if hasattr(products, "columns"):  # GeoDataFrame
+            if "thumbnail" not in products.columns:
+                raise Exception("GeoDataFrame must have the thumbnail column.")
+            return dict(zip(products["id"], products["thumbnail"]))
+
+        if isinstance(products, dict):
+            products = ItemCollection(**products)
+
+        if not isinstance(products, ItemCollection):
+            raise Exception("Bad Arguments.")
+
+        return {item.id: item.assets.thumbnail.href for item in products}
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Callable, Hashable, Optional
+
+
+class LRUCache:
+    """
+    Thread-safe least recently used cache, bounded by number of entries and/or bytes.
+
+    Args:
+        max_items: Max number of entries.
+        max_bytes: Max sum of entries size.
+        sizeof: Function that returns an entry size in bytes. Default is ``len``.
+    """
+
+    def __init__(
+        self,
+        max_items: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        sizeof: Callable[[Any], int] = len,
+    ):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.bytes = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Entry value, marking it as the most recently used.
+        """
+        with self._lock:
+            if key not in self._entries:
+                return default
+            self._entries.move_to_end(key)
+            return self._entries[key][0]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """
+        Add or replace an entry, evicting the least recently used ones above the limits.
+        """
+        size = self.sizeof(value) if self.max_bytes is not None else 0
+
+        with self._lock:
+            if key in self._entries:
+                self.bytes -= self._entries.pop(key)[1]
+
+            # Entries bigger than the whole cache are not kept.
+            if self.max_bytes is not None and size > self.max_bytes:
+                return
+
+            self._entries[key] = (value, size)
+            self.bytes += size
+
+            while (
+                self.max_items is not None and len(self._entries) > self.max_items
+            ) or (self.max_bytes is not None and self.bytes > self.max_bytes):
+                self.bytes -= self._entries.popitem(last=False)[1][1]
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Remove an entry and return its value.
+        """
+        with self._lock:
+            if key not in self._entries:
+                return default
+            value, size = self._entries.pop(key)
+            self.bytes -= size
+            return value
+
+    def clear(self) -> None:
+        """
+        Remove all entries.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
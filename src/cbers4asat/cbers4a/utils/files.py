@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from contextlib import contextmanager
+from os import remove, replace
+from os.path import dirname
+from tempfile import mkstemp
+from typing import IO, Iterator
+
+
+@contextmanager
+def atomic_write(path: str, mode: str = "wb") -> Iterator[IO]:
+    """
+    Write a file through a temporary file renamed over ``path`` when done.
+
+    The temporary file is unique in the directory, so processes and threads writing
+    the same path never write the same file. It is removed if the write fails.
+
+    Args:
+        path: File path
+        mode: ``"wb"`` or ``"w"``
+    Examples:
+        - with atomic_write("grid.kmz") as f:
+              f.write(data)
+    """
+    fd, tmpfile = mkstemp(suffix=".tmp", dir=dirname(path) or ".")
+    try:
+        with open(fd, mode) as f:
+            yield f
+        replace(tmpfile, path)
+    except BaseException:
+        remove(tmpfile)
+        raise
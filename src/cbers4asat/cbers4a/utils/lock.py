@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+import os
+from time import sleep
+
+try:
+    from fcntl import flock, LOCK_EX, LOCK_NB, LOCK_UN
+except ImportError:  # Windows
+    flock = None
+    import msvcrt
+
+
+class FileLock:
+    """
+    Exclusive lock shared by processes (and threads), held on a sidecar lock file.
+
+    The lock file is removed on release. On POSIX, a lock taken on a file removed
+    meanwhile is taken again on the new one.
+
+    Args:
+        path: Lock file path. Ex.: ``"image.tif.lock"``
+    Examples:
+        - with FileLock("image.tif.lock") as lock:
+              if not lock.waited: ...
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.waited = False
+        self._fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+    def acquire(self) -> None:
+        """
+        Block until the lock is held. ``waited`` tells if another holder was waited.
+        """
+        self.waited = False
+
+        while True:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                if not self.__lock(fd, blocking=False):
+                    self.waited = True
+                    self.__lock(fd, blocking=True)
+            except BaseException:
+                os.close(fd)
+                raise
+
+            if flock is None:
+                break
+
+            # The previous holder removed the file: lock the one now at the path.
+            try:
+                if os.fstat(fd).st_ino == os.stat(self.path).st_ino:
+                    break
+            except FileNotFoundError:
+                pass
+            os.close(fd)
+
+        self._fd = fd
+
+    def release(self) -> None:
+        """
+        Release the lock and remove the lock file.
+        """
+        if self._fd is None:
+            return
+
+        fd, self._fd = self._fd, None
+        try:
+            if flock is not None:
+                os.remove(self.path)
+                flock(fd, LOCK_UN)
+            else:
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(fd)
+
+        if flock is None:
+            try:  # Fails while other processes have it open, which is fine
+                os.remove(self.path)
+            except OSError:
+                pass
+
+    @staticmethod
+    def __lock(fd: int, blocking: bool) -> bool:
+        if flock is not None:
+            try:
+                flock(fd, LOCK_EX if blocking else LOCK_EX | LOCK_NB)
+            except BlockingIOError:
+                return False
+            return True
+
+        # msvcrt.LK_LOCK gives up after 10 seconds, so keep trying.
+        while True:
+            try:
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+                return True
+            except OSError:
+                if not blocking:
+                    return False
+                sleep(0.1)
@@ -1,15 +1,23 @@
 # -*- coding: utf-8 -*-
 # Standard Libraries
-from concurrent.futures import ThreadPoolExecutor
+from __future__ import annotations
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import date
+from itertools import product
 from os import getcwd, cpu_count
 from os.path import isdir, join
-from typing import List, Dict, Union, Optional
+from typing import List, Dict, Union, Optional, TYPE_CHECKING
 
 # PyPi Packages
-from geopandas import GeoDataFrame
-from pandas import concat
-from shapely.geometry import Polygon
+# geopandas, pandas and shapely are imported when needed: they take longer to import
+# than all the rest, and searching does not need them.
+from requests import Session
+from requests.adapters import HTTPAdapter
+
+if TYPE_CHECKING:
+    from geopandas import GeoDataFrame
+    from shapely.geometry import Polygon
 
 # Local Modules
 from .cbers4a import (
@@ -19,8 +27,24 @@ from .cbers4a import (
     ItemCollection,
     Item,
     Collections,
+    AssetStore,
+    Monitor,
+    SearchCache,
+    AdaptiveLimiter,
 )
 
+# Band assets of the products
+BANDS = ("red", "green", "blue", "nir", "pan")
+
+
+def is_instance(value, module: str, name: str) -> bool:
+    """
+    ``isinstance`` that does not import the class module. If the module was not
+    imported yet, the value cannot be an instance of its class.
+    """
+    module = sys.modules.get(module)
+    return module is not None and isinstance(value, getattr(module, name))
+
 
 class Cbers4aAPI:
     """
@@ -28,10 +52,19 @@ class Cbers4aAPI:
 
     Args:
         email: Sign-in e-mail used at https://www.dgi.inpe.br/catalogo/explore
+        monitor: Receives the request and progress events of downloads
+        limiter: Concurrency limit of item lookups and downloads, adjusted as INPE's servers respond. Default is a new ``AdaptiveLimiter``
     """
 
-    def __init__(self, email: Optional[str] = None):
+    def __init__(
+        self,
+        email: Optional[str] = None,
+        monitor: Optional[Monitor] = None,
+        limiter: Optional[AdaptiveLimiter] = None,
+    ):
         self._email = email
+        self.monitor = monitor
+        self.limiter = AdaptiveLimiter() if limiter is None else limiter
 
     @property
     def email(self):
@@ -49,6 +82,9 @@ class Cbers4aAPI:
         cloud: int,
         limit: int,
         collections: Union[list[str], list[Collections]],
+        monitor: Optional[Monitor] = None,
+        cache: Optional[SearchCache] = None,
+        limiter: Optional[AdaptiveLimiter] = None,
     ) -> dict:
         """
         Query Images from INPE's catalog
@@ -60,6 +96,9 @@ class Cbers4aAPI:
             cloud: Percentage of cloud coverage
             limit: Limit of returned images
             collections: Collection's name(s)
+            monitor: Receives the search request event
+            cache: (Optional) Reuse the results of identical searches
+            limiter: (Optional) Shared concurrency limit of the requests
         Notes:
             Location:
                 - Bounding box: `location=[-0.5, 1.0, 0.5, -0.5]`
@@ -87,11 +126,11 @@ class Cbers4aAPI:
         Raises:
             Exception: If any input is invalid.
         """
-        search = Search()
+        search = Search(monitor, cache=cache, limiter=limiter)
 
         if isinstance(location, list):
             search.bbox(location)
-        elif isinstance(location, Polygon):
+        elif is_instance(location, "shapely.geometry", "Polygon"):
             search.bbox(list(location.bounds))
         elif isinstance(location, tuple):
             search.path_row(*location)
@@ -107,9 +146,103 @@ class Cbers4aAPI:
 
         return search()
 
+    @staticmethod
+    def query_path_rows(
+        path_rows: Union[List[tuple], tuple],
+        initial_date: date,
+        end_date: date,
+        cloud: int,
+        limit: int,
+        collections: Union[list[str], list[Collections]],
+        group: bool = False,
+        workers: int = 8,
+        monitor: Optional[Monitor] = None,
+        cache: Optional[SearchCache] = None,
+        limiter: Optional[AdaptiveLimiter] = None,
+    ) -> dict:
+        """
+        Query Images of many path and rows at once
+
+        One query per path and row runs concurrently, all over the same pooled
+        connections.
+
+        Args:
+            path_rows: List of path and row tuples, or a tuple of path and row ranges
+            initial_date: Images from this date
+            end_date: Images to this date
+            cloud: Percentage of cloud coverage
+            limit: Limit of returned images per path and row
+            collections: Collection's name(s)
+            group: Return the results of every path and row apart
+            workers: Max of concurrent queries
+            monitor: Receives the search request events
+            cache: (Optional) Reuse the results of identical searches
+            limiter: (Optional) Adjusts how many of the workers query at once
+        Notes:
+            Path and rows:
+                - Pairs (list or tuple): `path_rows=[(225, 75), (226, 75)]`
+                - Ranges (every combination): `path_rows=(range(225, 230), range(110, 115))`. Both must be ``range`` objects
+        Examples:
+            - query_path_rows(grid_lookup(area), date(2021, 1, 1), date(2021, 2, 1), 100, 25, ["CBERS4A_WPM_L4_DN"])
+        Returns:
+            dict: Dict with GeoJSON-like format, without duplicated products. If grouped, one per (path, row)
+        Raises:
+            Exception: If any input is invalid.
+        """
+        if isinstance(path_rows, tuple) and len(path_rows) == 2:
+            if all(isinstance(value, int) for value in path_rows):
+                path_rows = [path_rows]
+            elif all(isinstance(value, range) for value in path_rows):
+                path_rows = list(product(*path_rows))
+
+        for path_row in path_rows:
+            pair = isinstance(path_row, (tuple, list)) and len(path_row) == 2
+            if not pair or not all(isinstance(v, int) for v in path_row):
+                raise Exception(
+                    "Provide path and row pairs, like [(225, 75)], or a tuple of path and row ranges."
+                )
+
+        path_rows = list(dict.fromkeys(tuple(path_row) for path_row in path_rows))
+
+        if not len(path_rows):
+            raise Exception("Path and rows cannot be empty.")
+        elif workers <= 0:
+            raise Exception("Workers must be greater than 0.")
+
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+
+        with Session() as session:
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+
+            def search_path_row(path_row: tuple) -> dict:
+                search = Search(monitor, session, cache, limiter)
+                search.path_row(*path_row)
+                search.date_interval(initial_date, end_date)
+                search.cloud_cover(cloud)
+                search.limit(limit)
+                search.collections(collections)
+                return search()
+
+            with ThreadPoolExecutor(max_workers=workers) as t_pool:
+                results = dict(zip(path_rows, t_pool.map(search_path_row, path_rows)))
+
+        if group:
+            return results
+
+        features = dict()
+        for result in results.values():
+            for feature in result["features"]:
+                features.setdefault(feature["id"], feature)
+
+        return {"type": "FeatureCollection", "features": list(features.values())}
+
     @staticmethod
     def query_by_id(
-        scene_id: Union[List[str], str], collection: Union[str, Collections]
+        scene_id: Union[List[str], str],
+        collection: Union[str, Collections],
+        monitor: Optional[Monitor] = None,
+        limiter: Optional[AdaptiveLimiter] = None,
     ):
         """
         Search a product by id
@@ -117,10 +250,12 @@ class Cbers4aAPI:
         Args:
             scene_id: One or more scene's id
             collection: Collection's name
+            monitor: Receives the item lookup request events
+            limiter: (Optional) Shared concurrency limit of the requests
         Returns:
             dict: Dict with GeoJSON-like format
         """
-        search = SearchItem()
+        search = SearchItem(monitor, limiter)
         search.ids(
             scene_id if isinstance(scene_id, list) else list([scene_id]),
             collection=collection,
@@ -135,6 +270,8 @@ class Cbers4aAPI:
         outdir: str = getcwd(),
         with_folder: bool = False,
         with_metadata: bool = False,
+        verify_geotiff: bool = False,
+        store: Optional[AssetStore] = None,
     ):
         try:
             products = ItemCollection(**products)
@@ -143,29 +280,23 @@ class Cbers4aAPI:
                 "Check your product structure. It must be a GeoJSON like dictionary."
             )
 
-        products.get_features_assets()
-
-        tasks = list()
-        root = outdir
-        for product in products:
-            if with_folder:
-                outdir = join(root, product.id)
-
-            for band in bands:
-                tasks.append(
-                    (Download().download, product.band_url(band), self.email, outdir)
-                )
-                if with_metadata:
-                    url_xml = product.band_url(band).replace('.tif', '.xml')
-                    tasks.append(
-                        (Download().download, url_xml, self.email, outdir)
-                    )
-
-        with ThreadPoolExecutor(max_workers=threads) as t_pool:
-            for task in tasks:
-                f = t_pool.submit(*task)
-                if f.exception():
-                    raise f.exception()
+        # Items read from a catalog file (read_catalog) already have the assets
+        for item in products:
+            if not all(item.has_band(band) for band in bands):
+                item.get_assets(self.monitor, self.limiter)
+
+        self.__run_tasks(
+            [
+                (item.id, item.collection, [item.band_url(band) for band in bands])
+                for item in products
+            ],
+            threads,
+            outdir,
+            with_folder,
+            with_metadata,
+            verify_geotiff,
+            store,
+        )
 
     def __download_gdf(
         self,
@@ -175,35 +306,111 @@ class Cbers4aAPI:
         outdir: str = getcwd(),
         with_folder: bool = False,
         with_metadata: bool = False,
+        verify_geotiff: bool = False,
+        store: Optional[AssetStore] = None,
     ):
-        features = list()
-        for index, row in products.iterrows():
-            features.append(Item.from_search(row.id, row.collection))
+        from pandas import Series
+
+        # Rows with the band columns of to_geodataframe(with_assets=True) are ready
+        scenes = list()
+        if all(band in products.columns for band in bands):
+            complete = products[bands].notna().all(axis=1)
+            known = products[complete]
+            scenes = [
+                (id_, collection, list(urls))
+                for id_, collection, *urls in zip(
+                    known["id"], known["collection"], *(known[band] for band in bands)
+                )
+            ]
+        else:
+            complete = Series(False, index=products.index)
+
+        # The others are searched concurrently
+        missing = products[~complete]
+        if len(missing):
+            with ThreadPoolExecutor(max_workers=threads) as t_pool:
+                items = t_pool.map(
+                    lambda row: Item.from_search(*row, self.monitor, self.limiter),
+                    zip(missing["id"], missing["collection"]),
+                )
+                scenes.extend(
+                    (item.id, item.collection, [item.band_url(band) for band in bands])
+                    for item in items
+                )
 
-        # GeoDataFrame is not needed anymore
-        products = ItemCollection(type="FeatureCollection", features=features)
+        self.__run_tasks(
+            scenes,
+            threads,
+            outdir,
+            with_folder,
+            with_metadata,
+            verify_geotiff,
+            store,
+        )
 
+    def __run_tasks(
+        self,
+        scenes: List[tuple],
+        threads: int,
+        outdir: str,
+        with_folder: bool,
+        with_metadata: bool,
+        verify_geotiff: bool,
+        store: Optional[AssetStore],
+    ):
         tasks = list()
         root = outdir
-        for product in products:
+        # Scenes are (id, collection, bands urls)
+        for id_, collection, bands_urls in scenes:
             if with_folder:
-                outdir = join(root, product.id)
-            for band in bands:
-                tasks.append(
-                    (Download().download, product.band_url(band), self.email, outdir)
-                )
+                outdir = join(root, id_)
+
+            urls = list()
+            for url in bands_urls:
+                urls.append(url)
                 if with_metadata:
-                    url_xml = product.band_url(band).replace('.tif', '.xml')
+                    urls.append(url.replace(".tif", ".xml"))
+
+            for url in urls:
+                if store is not None:
                     tasks.append(
-                        (Download().download, url_xml, self.email, outdir)
+                        (
+                            store.download,
+                            url,
+                            self.email,
+                            outdir,
+                            collection,
+                            id_,
+                            Download(
+                                verify_geotiff,
+                                monitor=self.monitor,
+                                limiter=self.limiter,
+                            ),
+                        )
+                    )
+                else:
+                    tasks.append(
+                        (
+                            Download(
+                                verify_geotiff,
+                                monitor=self.monitor,
+                                limiter=self.limiter,
+                            ).download,
+                            url,
+                            self.email,
+                            outdir,
+                        )
                     )
-
 
         with ThreadPoolExecutor(max_workers=threads) as t_pool:
-            for task in tasks:
-                f = t_pool.submit(*task)
-                if f.exception():
-                    raise f.exception()
+            futures = [t_pool.submit(*task) for task in tasks]
+            try:
+                for future in as_completed(futures):
+                    future.result()
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
 
     def download(
         self,
@@ -213,6 +420,8 @@ class Cbers4aAPI:
         outdir: str = getcwd(),
         with_folder: bool = False,
         with_metadata: bool = False,
+        verify_geotiff: bool = False,
+        store: Optional[AssetStore] = None,
     ):
         """
         Download bands from all given scenes
@@ -220,14 +429,18 @@ class Cbers4aAPI:
         Args:
             products: Data returned from API
             bands: List of band color's name. "red", "green", "blue", "nir", "pan"
-            threads: Max of cpu threads
+            threads: Max of concurrent downloads. How many run at once is set by the limiter
             outdir: Output path
             with_folder: Group scene bands in a sub folder
             with_metadata: Download band's metadata (XML)
+            verify_geotiff: Check if every band file has a valid GeoTIFF header
+            store: Local asset store. Bands already stored are linked instead of downloaded.
         Examples:
             - download(my_query_result, ['red', 'green'], 3, './downlaods', true)
             - download(my_query_result, ['red'], outdir='./downloads', with_folder=true)
             - download(my_query_result, ['blue'], with_metadata=True)
+            - download(my_query_result, ['nir'], verify_geotiff=True)
+            - download(my_query_result, ['red'], store=AssetStore('./store', 50 * 2**30))
         Returns:
             GeoTIFF files
         """
@@ -241,46 +454,67 @@ class Cbers4aAPI:
         if isinstance(products, dict):
             if not products:  # Check if dictionary is empty
                 raise Exception("No product to download.")
-            return self.__download(products, bands, threads, outdir, with_folder, with_metadata)
-        elif isinstance(products, GeoDataFrame):
+            return self.__download(
+                products,
+                bands,
+                threads,
+                outdir,
+                with_folder,
+                with_metadata,
+                verify_geotiff,
+                store,
+            )
+        elif is_instance(products, "geopandas", "GeoDataFrame"):
             if products.empty:  # Check if data frame is empty
                 raise Exception("No product to download.")
-            return self.__download_gdf(products, bands, threads, outdir, with_folder, with_metadata)
+            return self.__download_gdf(
+                products,
+                bands,
+                threads,
+                outdir,
+                with_folder,
+                with_metadata,
+                verify_geotiff,
+                store,
+            )
         else:
             raise Exception("Bad Arguments.")
 
     @staticmethod
-    def to_geodataframe(products: dict) -> GeoDataFrame:
+    def to_geodataframe(products: dict, with_assets: bool = False) -> GeoDataFrame:
         """
         Transform products list to a GeoDataFrame
 
         Args:
             products: GeoJSON-like dictionary returned from API
+            with_assets: Add a column with the href of every band ("red", "green", "blue", "nir" and "pan"). Unknown hrefs are empty.
+        Notes:
+            Downloading from a GeoDataFrame with the band columns does not search the scenes again.
         Returns:
             GeoDataFrame of products.
         """
+        from geopandas import GeoDataFrame
+
         if not products or not isinstance(products, dict):
             raise Exception("Provide a valid product structure.")
 
         item_collection = ItemCollection(**products)
-        processed = list()
+        features = list()
         for item in item_collection:
-            extras = {
-                "properties": {
-                    **item.properties.asdict(),
-                    "id": item.id,
-                    "bbox": item.bbox,
-                    "collection": item.collection,
-                    "thumbnail": item.assets.thumbnail.href,
-                }
+            properties = {
+                **item.properties.asdict(),
+                "id": item.id,
+                "bbox": item.bbox,
+                "collection": item.collection,
+                "thumbnail": item.assets.thumbnail.href,
             }
-            gdf = GeoDataFrame.from_features(
-                {
-                    "type": "FeatureCollection",
-                    "features": [item.asdict() | extras],
-                },
-                crs="EPSG:4326",
-            )
-            processed.append(gdf)
+            if with_assets:
+                for band in BANDS:
+                    asset = getattr(item.assets, band)
+                    properties[band] = asset.href if asset is not None else None
+
+            features.append(item.asdict() | {"properties": properties})
 
-        return concat(processed, ignore_index=True).set_index("id", drop=False)
+        # One frame for all products, instead of one frame per product
+        gdf = GeoDataFrame.from_features(features, crs="EPSG:4326")
+        return gdf.set_index("id", drop=False)
@@ -0,0 +1,339 @@
+# -*- coding: utf-8 -*-
+# Standard Libraries
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from csv import DictReader
+from datetime import date, datetime, timezone
+from json import dumps, load, loads
+from os import environ, getcwd, makedirs, replace
+from os.path import exists, isdir, join
+import sys
+from threading import Lock
+from typing import Dict, List, Optional
+
+# Local Modules
+from .cbers4asat import Cbers4aAPI
+
+STAGES = ("search", "download", "process")
+
+# Manifest columns with many values, separated by ";" in CSV files
+LIST_COLUMNS = ("collections", "bands", "bbox")
+
+
+class Progress:
+    """
+    Machine-readable progress: one JSON object per line, and the state file of
+    completed stages used by ``--resume``.
+
+    Args:
+        state: State file path (JSON lines of completed job stages)
+        stream: Where progress lines are written. Default is stdout
+    """
+
+    def __init__(self, state: str, stream=None):
+        self.state = state
+        self.stream = stream
+        self._lock = Lock()
+
+    def completed(self) -> set:
+        """
+        (job, stage) pairs already completed.
+        """
+        if not exists(self.state):
+            return set()
+
+        done = set()
+        with open(self.state) as f:
+            for line in f:
+                try:
+                    entry = loads(line)
+                except ValueError:  # Line cut by an interrupted run
+                    continue
+                done.add((entry["job"], entry["stage"]))
+        return done
+
+    def emit(self, job: str, stage: str, status: str, **fields) -> None:
+        """
+        Write a progress line. Completed stages are also recorded in the state file.
+        """
+        event = {
+            "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "job": job,
+            "stage": stage,
+            "status": status,
+            **fields,
+        }
+        with self._lock:
+            stream = self.stream or sys.stdout
+            stream.write(dumps(event) + "\n")
+            stream.flush()
+            if status == "done":
+                with open(self.state, "a") as f:
+                    f.write(dumps({"job": job, "stage": stage}) + "\n")
+
+
+def read_manifest(manifest: str) -> List[Dict]:
+    """
+    Read the jobs of a CSV or JSON manifest.
+
+    Every job has: id, collections, start, end and one location (bbox, path and row or
+    aoi GeoJSON file). Optional: cloud, limit, bands and operation.
+
+    Args:
+        manifest: .csv file (list values separated by ";") or .json file (list of objects)
+    Returns:
+        List of jobs
+    """
+    with open(manifest, newline="") as f:
+        if manifest.lower().endswith(".json"):
+            jobs = load(f)
+        else:
+            jobs = [
+                {key: value for key, value in row.items() if value not in ("", None)}
+                for row in DictReader(f)
+            ]
+
+    for position, job in enumerate(jobs):
+        for column in LIST_COLUMNS:
+            if isinstance(job.get(column), str):
+                job[column] = [
+                    value.strip() for value in job[column].split(";") if value.strip()
+                ]
+
+        job["id"] = str(job.get("id", f"job-{position}"))
+
+        if "collections" not in job or "start" not in job or "end" not in job:
+            raise ValueError(f"Job {job['id']} needs collections, start and end")
+
+        if not ("bbox" in job or "aoi" in job or ("path" in job and "row" in job)):
+            raise ValueError(f"Job {job['id']} needs a bbox, aoi or path and row")
+
+    ids = [job["id"] for job in jobs]
+    if len(set(ids)) != len(ids):
+        raise ValueError("Job ids must be unique")
+
+    return jobs
+
+
+def job_location(job: Dict):
+    """
+    Query location of a job: bounding box, AOI bounds or path and row.
+    """
+    if "bbox" in job:
+        return [float(coord) for coord in job["bbox"]]
+
+    if "aoi" in job:
+        from shapely.geometry import shape
+
+        with open(job["aoi"]) as f:
+            geojson = load(f)
+
+        features = geojson.get("features", [geojson])
+        bounds = [
+            shape(feature.get("geometry", feature)).bounds for feature in features
+        ]
+        return [
+            float(min(b[0] for b in bounds)),
+            float(min(b[1] for b in bounds)),
+            float(max(b[2] for b in bounds)),
+            float(max(b[3] for b in bounds)),
+        ]
+
+    return int(job["path"]), int(job["row"])
+
+
+def run_job(
+    job: Dict, api: Cbers4aAPI, outdir: str, stages, threads: int, progress, done: set
+) -> bool:
+    """
+    Run the stages of one job. Stages completed in a previous run are skipped.
+
+    Returns:
+        True if every stage succeeded
+    """
+    jobdir = join(outdir, job["id"])
+    makedirs(jobdir, exist_ok=True)
+    results = join(jobdir, "search.json")
+
+    stage = None
+    try:
+        stage = "search"
+        if (job["id"], stage) in done and exists(results):
+            with open(results) as f:
+                products = load(f)
+        else:
+            progress.emit(job["id"], stage, "started")
+            products = api.query(
+                location=job_location(job),
+                initial_date=date.fromisoformat(job["start"]),
+                end_date=date.fromisoformat(job["end"]),
+                cloud=int(job.get("cloud", 100)),
+                limit=int(job.get("limit", 100)),
+                collections=job["collections"],
+                limiter=api.limiter,
+            )
+            with open(f"{results}.tmp", "w") as f:
+                f.write(dumps(products))
+            replace(f"{results}.tmp", results)
+            progress.emit(
+                job["id"], stage, "done", scenes=len(products.get("features", []))
+            )
+
+        stage = "download"
+        if stage in stages and (job["id"], stage) not in done:
+            progress.emit(job["id"], stage, "started")
+            if products.get("features") and job.get("bands"):
+                api.download(
+                    products,
+                    job["bands"],
+                    threads=threads,
+                    outdir=jobdir,
+                    with_folder=True,
+                )
+            progress.emit(
+                job["id"], stage, "done", scenes=len(products.get("features", []))
+            )
+
+        stage = "process"
+        if stage in stages and job.get("operation") and (job["id"], stage) not in done:
+            from .tools.batch import process_scene, scene_bands
+
+            progress.emit(job["id"], stage, "started")
+            options = dict()
+            if job["operation"] == "clip":
+                from .tools import read_geojson
+
+                options["mask"] = read_geojson(job["aoi"])
+
+            errors = list()
+            for feature in products.get("features", []):
+                folder = join(jobdir, feature["id"])
+                if not isdir(folder):
+                    continue
+                result = process_scene(
+                    job["operation"],
+                    feature["id"],
+                    scene_bands(folder),
+                    join(jobdir, "processed"),
+                    options,
+                )
+                if result["error"] is not None:
+                    errors.append(f"{feature['id']}: {result['error']}")
+
+            if errors:
+                raise Exception("; ".join(errors))
+            progress.emit(job["id"], stage, "done")
+    except Exception as err:
+        progress.emit(job["id"], stage, "failed", error=f"{type(err).__name__}: {err}")
+        return False
+
+    return True
+
+
+def run(
+    manifest: str,
+    email: Optional[str] = None,
+    outdir: str = getcwd(),
+    stages=STAGES,
+    jobs: int = 4,
+    threads: int = 4,
+    resume: bool = False,
+    state: Optional[str] = None,
+    stream=None,
+) -> bool:
+    """
+    Run every job of a manifest, many at once
+
+    Args:
+        manifest: CSV or JSON manifest (see ``read_manifest``)
+        email: Sign-in e-mail used to download
+        outdir: Output path. Every job is saved in a sub folder
+        stages: Stages to run: "search", "download" and "process"
+        jobs: Max of concurrent jobs
+        threads: Download threads per job
+        resume: Skip the stages completed by previous runs
+        state: State file. Default is ".cbers4asat-state.jsonl" inside outdir
+        stream: Where progress lines are written. Default is stdout
+    Returns:
+        True if every job succeeded
+    """
+    for stage in stages:
+        if stage not in STAGES:
+            raise ValueError(f"Stages available: {', '.join(STAGES)}")
+
+    if jobs <= 0 or threads <= 0:
+        raise ValueError("Jobs and threads must be greater than 0.")
+
+    batch = read_manifest(manifest)
+    makedirs(outdir, exist_ok=True)
+
+    progress = Progress(state or join(outdir, ".cbers4asat-state.jsonl"), stream)
+    done = progress.completed() if resume else set()
+    api = Cbers4aAPI(email)
+
+    with ThreadPoolExecutor(max_workers=jobs) as t_pool:
+        succeeded = list(
+            t_pool.map(
+                lambda job: run_job(job, api, outdir, stages, threads, progress, done),
+                batch,
+            )
+        )
+
+    return all(succeeded)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    ``cbers4asat`` console script.
+    """
+    parser = ArgumentParser(
+        prog="cbers4asat",
+        description="Search, download and process CBERS-04A and AMAZONIA-1 scenes",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    batch = commands.add_parser("run", help="Run the jobs of a manifest file")
+    batch.add_argument("manifest", help="CSV or JSON manifest of jobs")
+    batch.add_argument(
+        "--email",
+        default=environ.get("CBERS4ASAT_EMAIL"),
+        help="Sign-in e-mail (default: CBERS4ASAT_EMAIL environment variable)",
+    )
+    batch.add_argument("--outdir", default=getcwd(), help="Output directory")
+    batch.add_argument(
+        "--stages",
+        default=",".join(STAGES),
+        help="Comma separated stages (default: search,download,process)",
+    )
+    batch.add_argument("--jobs", type=int, default=4, help="Concurrent jobs")
+    batch.add_argument("--threads", type=int, default=4, help="Downloads per job")
+    batch.add_argument(
+        "--resume", action="store_true", help="Skip stages completed before"
+    )
+    batch.add_argument("--state", help="State file of completed stages")
+
+    args = parser.parse_args(argv)
+
+    stages = [stage.strip() for stage in args.stages.split(",") if stage.strip()]
+    if "download" in stages and not args.email:
+        parser.error("--email is required to download")
+
+    try:
+        succeeded = run(
+            args.manifest,
+            args.email,
+            args.outdir,
+            stages,
+            args.jobs,
+            args.threads,
+            args.resume,
+            args.state,
+        )
+    except (OSError, ValueError) as err:
+        parser.error(str(err))
+
+    return 0 if succeeded else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
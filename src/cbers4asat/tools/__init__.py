@@ -1,3 +1,41 @@
-from .image import rgbn_composite, pansharpening, clip
-from .grid import grid_download
-from .geometry import read_geojson
+from importlib import import_module
+
+# Tools are imported on first use (PEP 562), so importing the package does not load
+# rasterio, scikit-image, shapely and geopandas until a tool needs them.
+_TOOLS = {
+    "rgbn_composite": ".image",
+    "pansharpening": ".image",
+    "clip": ".image",
+    "preview": ".previews",
+    "grid_download": ".grid",
+    "grid_lookup": ".grid",
+    "load_grid": ".grid",
+    "GridIndex": ".grid",
+    "read_geojson": ".geometry",
+    "reproject": ".warp",
+    "mosaic": ".mosaics",
+    "spectral_indices": ".indices",
+    "batch_process": ".batch",
+    "scene_bands": ".batch",
+    "temporal_stack": ".stack",
+    "temporal_reduce": ".stack",
+    "open_stack": ".stack",
+    "zonal_stats": ".zonal",
+    "select_scenes": ".selection",
+    "Profiler": ".profiling",
+}
+
+__all__ = list(_TOOLS)
+
+
+def __getattr__(name: str):
+    if name not in _TOOLS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    value = getattr(import_module(_TOOLS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
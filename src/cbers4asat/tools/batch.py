@@ -0,0 +1,221 @@
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from os import cpu_count, getcwd, listdir
+from os.path import basename, isdir, join, normpath
+from re import search
+from typing import Dict, List, Literal, Optional, Union
+from rasterio import open as rasterio_open
+from .image import rgbn_composite, pansharpening, clip
+
+# Band number of every color in INPE's file names (..._BAND3.tif), per sensor.
+SENSOR_BANDS = {
+    "WPM": {"pan": 0, "blue": 1, "green": 2, "red": 3, "nir": 4},
+    "MUX": {"blue": 5, "green": 6, "red": 7, "nir": 8},
+    "WFI": {"blue": 13, "green": 14, "red": 15, "nir": 16},
+    "AWFI": {"blue": 13, "green": 14, "red": 15, "nir": 16},
+    "PAN5M": {"pan": 1},
+    "PAN10M": {"green": 2, "red": 3, "nir": 4},
+    "AMAZONIA_1_WFI": {"blue": 1, "green": 2, "red": 3, "nir": 4},
+}
+
+# Rough bytes held in memory per output pixel (all bands) by each operation.
+BYTES_PER_PIXEL = {"composite": 16, "pansharpening": 96, "clip": 8}
+
+
+def scene_bands(folder: str) -> Dict[str, str]:
+    """
+    Find the band files of a scene folder, as created by ``download(with_folder=True)``.
+
+    Args:
+        folder: Scene folder
+    Returns:
+        Dictionary of band color and file path. Ex.: {"red": ".../..._BAND3.tif"}
+    """
+    bands = dict()
+    for filename in sorted(listdir(folder)):
+        number = search(r"_BAND(\d+)\.tif$", filename)
+        if number is None:
+            continue
+
+        if filename.startswith("AMAZONIA_1_WFI"):
+            sensor = "AMAZONIA_1_WFI"
+        else:
+            sensor = next(
+                (name for name in SENSOR_BANDS if f"_{name}_" in filename), None
+            )
+
+        for color, band in SENSOR_BANDS.get(sensor, {}).items():
+            if band == int(number.group(1)):
+                bands[color] = join(folder, filename)
+
+    return bands
+
+
+def available_memory() -> int:
+    """
+    Physical memory available now, in bytes.
+    """
+    try:
+        # os.sysconf does not exist on Windows
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        return 2**32
+
+
+def estimate_memory(operation: str, bands: Dict[str, str]) -> int:
+    """
+    Estimate the peak memory of processing a scene, from its rasters dimensions.
+    """
+    if not bands:
+        raise FileNotFoundError("No band files found")
+
+    main = bands.get("pan") if operation == "pansharpening" else None
+    main = main or next(iter(bands.values()))
+    with rasterio_open(main) as raster:
+        pixels = raster.width * raster.height
+    return (
+        pixels * BYTES_PER_PIXEL[operation] * (1 if operation != "clip" else len(bands))
+    )
+
+
+def process_scene(
+    operation: str, name: str, bands: Dict[str, str], outdir: str, options: Dict
+) -> Dict:
+    """
+    Run one operation over one scene. Errors are returned instead of raised.
+    """
+    scene_outdir = join(outdir, name)
+    try:
+        if operation == "composite":
+            rgbn_composite(
+                bands["red"],
+                bands["green"],
+                bands["blue"],
+                bands.get("nir") if options.get("with_nir", True) else None,
+                outdir=scene_outdir,
+                filename=options.get("filename", "rgbn_composite.tif"),
+            )
+            outputs = [
+                join(scene_outdir, options.get("filename", "rgbn_composite.tif"))
+            ]
+        elif operation == "pansharpening":
+            rgbn_composite(
+                bands["red"],
+                bands["green"],
+                bands["blue"],
+                outdir=scene_outdir,
+                filename="rgb_composite.tif",
+            )
+            pansharpening(
+                bands["pan"],
+                join(scene_outdir, "rgb_composite.tif"),
+                outdir=scene_outdir,
+                filename=options.get("filename", "pansharp.tif"),
+            )
+            outputs = [join(scene_outdir, options.get("filename", "pansharp.tif"))]
+        else:
+            outputs = list()
+            for raster in bands.values():
+                clip(
+                    raster,
+                    options["mask"],
+                    outdir=scene_outdir,
+                    filename=basename(raster),
+                )
+                outputs.append(join(scene_outdir, basename(raster)))
+    except Exception as err:
+        return {"scene": name, "outputs": [], "error": f"{type(err).__name__}: {err}"}
+
+    return {"scene": name, "outputs": outputs, "error": None}
+
+
+def batch_process(
+    scenes: Union[str, List[str], Dict[str, Dict[str, str]]],
+    operation: Literal["composite", "pansharpening", "clip"] = "composite",
+    outdir: str = getcwd(),
+    workers: int = cpu_count(),
+    memory_limit: Optional[int] = None,
+    **options,
+) -> List[Dict]:
+    """
+    Process many scenes in parallel, one scene per process
+
+    Scenes are only started while their estimated memory fits in the memory limit, so
+    big pansharpening jobs do not run all at once. A failed scene does not stop the
+    others.
+
+    Args:
+        scenes: Folder with one sub folder per scene (``download(with_folder=True)``), list of scene folders or dictionary of scene name and bands paths
+        operation: "composite", "pansharpening" or "clip"
+        outdir: Output path. Every scene is saved in a sub folder
+        workers: Max of processes
+        memory_limit: (Optional) Max bytes used by running scenes. Default is the available memory
+        options: "filename" of composite/pansharpening output, "with_nir" for composite and "mask" for clip
+    Examples:
+        - batch_process("./downloads", "pansharpening", "./output", workers=8)
+        - batch_process(["./downloads/SCENE_A"], "clip", mask=read_geojson("area.geojson"))
+    Returns:
+        One dictionary per scene with its name, output files and error (None if succeeded)
+    """
+    if operation not in BYTES_PER_PIXEL:
+        raise ValueError("Operations available: composite, pansharpening and clip")
+    elif operation == "clip" and "mask" not in options:
+        raise ValueError("Provide the clip mask")
+
+    if isinstance(scenes, str):
+        if not isdir(scenes):
+            raise NotADirectoryError("Choose a valid scenes directory.")
+        scenes = [
+            join(scenes, folder)
+            for folder in sorted(listdir(scenes))
+            if isdir(join(scenes, folder))
+        ]
+
+    if isinstance(scenes, list):
+        scenes = {basename(normpath(folder)): scene_bands(folder) for folder in scenes}
+
+    if memory_limit is None:
+        memory_limit = int(available_memory() * 0.8)
+
+    results = dict()
+    pending = list()
+    for name, bands in scenes.items():
+        try:
+            pending.append((name, bands, estimate_memory(operation, bands)))
+        except Exception as err:
+            results[name] = {
+                "scene": name,
+                "outputs": [],
+                "error": f"{type(err).__name__}: {err}",
+            }
+
+    with ProcessPoolExecutor(max_workers=workers) as p_pool:
+        running = dict()
+        in_use = 0
+        while pending or running:
+            # Start scenes while they fit. One scene always runs, even if it does not.
+            while pending and len(running) < workers:
+                name, bands, memory = pending[0]
+                if running and in_use + memory > memory_limit:
+                    break
+                pending.pop(0)
+                future = p_pool.submit(
+                    process_scene, operation, name, bands, outdir, options
+                )
+                running[future] = (name, memory)
+                in_use += memory
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, memory = running.pop(future)
+                in_use -= memory
+                if future.exception() is not None:
+                    results[name] = {
+                        "scene": name,
+                        "outputs": [],
+                        "error": f"{type(future.exception()).__name__}: {future.exception()}",
+                    }
+                else:
+                    results[name] = future.result()
+
+    return [results[name] for name in scenes]
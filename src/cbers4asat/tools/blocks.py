@@ -0,0 +1,23 @@
+from typing import Iterator
+from rasterio.windows import Window
+
+
+def block_windows(width: int, height: int, block_size: int = 1024) -> Iterator[Window]:
+    """
+    Split a raster grid in square windows, row by row.
+
+    Args:
+        width: Raster width
+        height: Raster height
+        block_size: Window side length in pixels
+    Returns:
+        Windows covering the whole grid
+    """
+    if block_size <= 0:
+        raise ValueError("Block size must be greater than 0.")
+
+    for row in range(0, height, block_size):
+        for col in range(0, width, block_size):
+            yield Window(
+                col, row, min(block_size, width - col), min(block_size, height - row)
+            )
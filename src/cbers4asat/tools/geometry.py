@@ -1,4 +1,8 @@
+from typing import Dict, Optional
 from geojson import load as geojson_load
+from rasterio.crs import CRS
+from rasterio.warp import transform_geom
+from shapely.geometry import mapping, shape
 
 
 def read_geojson(geojson_file: str):
@@ -12,3 +16,51 @@ def read_geojson(geojson_file: str):
     """
     with open(geojson_file) as f:
         return geojson_load(f)
+
+
+def geojson_crs(geojson: Dict) -> Optional[str]:
+    """
+    Coordinate reference system of a GeoJSON object.
+
+    Uses the legacy "crs" member when present. Otherwise, GeoJSON coordinates are
+    longitude and latitude (EPSG:4326), as long as they fit in that range.
+
+    Args:
+        geojson: GeoJSON object
+    Returns:
+        CRS string or None if unknown
+    """
+    crs = geojson.get("crs")
+    if crs is not None:
+        return crs.get("properties", {}).get("name")
+
+    geometries = [feature["geometry"] for feature in geojson.get("features", [])]
+    if geojson.get("type") == "Feature":
+        geometries = [geojson["geometry"]]
+    elif "coordinates" in geojson:
+        geometries = [geojson]
+
+    for geometry in geometries:
+        minx, miny, maxx, maxy = shape(geometry).bounds
+        if minx < -180 or maxx > 180 or miny < -90 or maxy > 90:
+            return None
+
+    return "EPSG:4326"
+
+
+def transform_geometry(geometry, src_crs, dst_crs):
+    """
+    Transform a shapely geometry between coordinate reference systems.
+
+    Args:
+        geometry: Shapely geometry
+        src_crs: Geometry CRS
+        dst_crs: Target CRS
+    Returns:
+        Shapely geometry
+    """
+    if src_crs is None or dst_crs is None:
+        return geometry
+    if CRS.from_user_input(src_crs) == CRS.from_user_input(dst_crs):
+        return geometry
+    return shape(transform_geom(src_crs, dst_crs, mapping(geometry)))
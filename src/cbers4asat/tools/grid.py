@@ -1,14 +1,56 @@
-from os import getcwd
-from os.path import basename, join
-from typing import Literal
+from functools import lru_cache
+from os import getcwd, makedirs
+from os.path import basename, exists, expanduser, join
+from re import search
+from threading import Lock
+from typing import List, Literal, Optional, Tuple
+from xml.etree.ElementTree import fromstring
+from zipfile import ZipFile
 from requests import Session, HTTPError
+from shapely import STRtree, box
+from shapely.geometry import MultiPolygon, Polygon, shape
+from ..cbers4a.utils.files import atomic_write
+
+GRIDS = {
+    "cbers4a": {
+        "mux": "http://www.obt.inpe.br/OBT/assuntos/catalogo-cbers-amz-1/grid_cbers4a_mux.kmz",
+        "wfi": "http://www.obt.inpe.br/OBT/assuntos/catalogo-cbers-amz-1/grid_cbers4a_wfi.kmz",
+    },
+    "amazonia1": {
+        "wfi": "http://www.obt.inpe.br/OBT/assuntos/catalogo-cbers-amz-1/grid_amazonia1_wfi_sa.kmz"
+    },
+}
+
+# Where load_grid keeps the downloaded grids
+CACHE_DIR = join(expanduser("~"), ".cache", "cbers4asat")
+
+# One lock per grid, so concurrent first lookups download and parse it only once
+_grid_locks: dict = dict()
+_grid_locks_lock = Lock()
+
+
+def grid_url(satellite: str, sensor: str) -> str:
+    """
+    URL of a satellite and sensor grid.
+    """
+    get_satellite = GRIDS.get(satellite.lower(), None)
+
+    if get_satellite:
+        get_sensor = get_satellite.get(sensor.lower(), None)
+
+        if get_sensor:
+            return get_sensor
+        else:
+            raise ValueError("Sensors available: mux and wfi")
+    else:
+        raise ValueError("Satellites available: cbers4a and amazonia1")
 
 
 def grid_download(
     satellite: Literal["cbers4a", "amazonia1"] = "cbers4a",
     sensor: Literal["mux", "wfi"] = "mux",
     outdir: str = getcwd(),
-) -> None:
+) -> str:
     """
     Download path and row grid from CBERS-04A and AMAZONIA1
 
@@ -20,38 +62,224 @@ def grid_download(
         - grid_download("cbers4a", "mux")
         - grid_download(satellite="amazonia1", "wfi", outdir="./downloads")
     Returns:
-        .kmz file
+        .kmz file path
     """
-    grids = {
-        "cbers4a": {
-            "mux": "http://www.obt.inpe.br/OBT/assuntos/catalogo-cbers-amz-1/grid_cbers4a_mux.kmz",
-            "wfi": "http://www.obt.inpe.br/OBT/assuntos/catalogo-cbers-amz-1/grid_cbers4a_wfi.kmz",
-        },
-        "amazonia1": {
-            "wfi": "http://www.obt.inpe.br/OBT/assuntos/catalogo-cbers-amz-1/grid_amazonia1_wfi_sa.kmz"
-        },
-    }
+    url = grid_url(satellite, sensor)
+    path = join(outdir, basename(url))
 
-    get_satellite = grids.get(satellite.lower(), None)
+    with Session() as session:
+        try:
+            req = session.get(url=url, stream=True, allow_redirects=True)
+            req.raise_for_status()
 
-    if get_satellite:
-        get_sensor = get_satellite.get(sensor.lower(), None)
+            with atomic_write(path) as f:
+                for chunk in req.iter_content(chunk_size=2**20):
+                    if chunk:
+                        f.write(chunk)
 
-        if get_sensor:
-            with Session() as session:
-                try:
-                    req = session.get(url=get_sensor, stream=True, allow_redirects=True)
-                    req.raise_for_status()
-
-                    filename = basename(get_sensor)
-                    with open(join(outdir, filename), "wb") as f:
-                        for chunk in req.iter_content(chunk_size=1024):
-                            if chunk:
-                                f.write(chunk)
-
-                except HTTPError as err:
-                    raise Exception(f"Download unavailable. Error: {err}")
+        except HTTPError as err:
+            raise Exception(f"Download unavailable. Error: {err}")
+
+    return path
+
+
+class GridIndex:
+    """
+    Spatial index of a path and row grid.
+
+    Args:
+        path_rows: (path, row) of every grid cell
+        geometries: Shapely polygon (EPSG:4326) of every grid cell
+    Examples:
+        - grid = GridIndex.from_kmz("grid_cbers4a_mux.kmz")
+        - grid.lookup(box(-63.9, -8.8, -63.7, -8.6))
+    """
+
+    def __init__(self, path_rows: List[Tuple[int, int]], geometries: List):
+        if len(path_rows) != len(geometries):
+            raise ValueError("Every path and row must have a geometry")
+
+        self.path_rows = path_rows
+        self.geometries = geometries
+        self.tree = STRtree(geometries)
+
+    def __len__(self) -> int:
+        return len(self.path_rows)
+
+    @classmethod
+    def from_kmz(cls, kmz: str) -> "GridIndex":
+        """
+        Parse the placemarks of INPE's grid file (.kmz or .kml).
+        """
+        if kmz.lower().endswith(".kmz"):
+            with ZipFile(kmz) as archive:
+                name = next(n for n in archive.namelist() if n.endswith(".kml"))
+                document = fromstring(archive.read(name))
         else:
-            raise ValueError("Sensors available: mux and wfi")
-    else:
-        raise ValueError("Satellites available: cbers4a and amazonia1")
+            with open(kmz, "rb") as f:
+                document = fromstring(f.read())
+
+        path_rows, geometries = list(), list()
+        for placemark in document.iter():
+            if not placemark.tag.endswith("Placemark"):
+                continue
+
+            path_row = cls.__path_row(placemark)
+            rings = [
+                element.text.split()
+                for element in placemark.iter()
+                if element.tag.endswith("coordinates") and element.text
+            ]
+            polygons = [
+                Polygon(cls.__coordinates(ring)) for ring in rings if len(ring) >= 3
+            ]
+            if path_row is None or not polygons:
+                continue
+
+            path_rows.append(path_row)
+            geometries.append(
+                polygons[0] if len(polygons) == 1 else MultiPolygon(polygons)
+            )
+
+        if not path_rows:
+            raise ValueError("No path and row found in the grid file")
+
+        return cls(path_rows, geometries)
+
+    def lookup(self, geometry) -> List[Tuple[int, int]]:
+        """
+        Path and row of the grid cells covering a geometry.
+
+        Args:
+            geometry: Shapely geometry, GeoJSON geometry/Feature/FeatureCollection or bounding box [min_lon, min_lat, max_lon, max_lat] in EPSG:4326
+        Returns:
+            Sorted list of (path, row)
+        """
+        if isinstance(geometry, (list, tuple)):
+            geometry = box(*geometry)
+        elif isinstance(geometry, dict):
+            if geometry.get("type") == "FeatureCollection":
+                geometry = MultiPolygon(
+                    [
+                        part
+                        for feature in geometry["features"]
+                        for part in getattr(
+                            shape(feature["geometry"]),
+                            "geoms",
+                            [shape(feature["geometry"])],
+                        )
+                    ]
+                )
+            elif geometry.get("type") == "Feature":
+                geometry = shape(geometry["geometry"])
+            else:
+                geometry = shape(geometry)
+
+        found = self.tree.query(geometry, predicate="intersects")
+        return sorted(self.path_rows[i] for i in found)
+
+    def geometry(self, path: int, row: int):
+        """
+        Polygon of a grid cell.
+        """
+        try:
+            return self.geometries[self.path_rows.index((path, row))]
+        except ValueError:
+            raise ValueError(f"Path {path} and row {row} not in the grid")
+
+    @staticmethod
+    def __path_row(placemark) -> Optional[Tuple[int, int]]:
+        """
+        Path and row from the placemark extended data or, else, from its name.
+        """
+        values = dict()
+        for element in placemark.iter():
+            name = element.get("name")
+            if name is not None and element.tag.endswith(("Data", "SimpleData")):
+                text = element.text
+                if text is None or not text.strip():
+                    text = next(
+                        (v.text for v in element if v.tag.endswith("value")), None
+                    )
+                if text is not None:
+                    values[name.strip().lower()] = text.strip()
+
+        if "path" in values and "row" in values:
+            return int(float(values["path"])), int(float(values["row"]))
+
+        name = next((e.text for e in placemark if e.tag.endswith("name")), None)
+        if name is not None:
+            numbers = search(r"(\d{1,3})\D+(\d{1,3})", name)
+            if numbers is not None:
+                return int(numbers.group(1)), int(numbers.group(2))
+
+        return None
+
+    @staticmethod
+    def __coordinates(points: List[str]) -> List[Tuple[float, float]]:
+        """
+        KML "lon,lat[,alt]" points.
+        """
+        return [
+            tuple(float(value) for value in point.split(",")[:2]) for point in points
+        ]
+
+
+def load_grid(
+    satellite: Literal["cbers4a", "amazonia1"] = "cbers4a",
+    sensor: Literal["mux", "wfi"] = "mux",
+    cache_dir: str = CACHE_DIR,
+) -> GridIndex:
+    """
+    Grid index of a satellite and sensor, loaded only once.
+
+    The grid file is downloaded to the cache directory only if not there yet, so
+    later lookups do not reach INPE's server.
+
+    Args:
+        satellite: "cbers4a" or "amazonia1"
+        sensor: "mux" or "wfi"
+        cache_dir: Directory of the downloaded grid files
+    Returns:
+        GridIndex
+    """
+    key = (satellite.lower(), sensor.lower(), cache_dir)
+    with _grid_locks_lock:
+        lock = _grid_locks.setdefault(key, Lock())
+
+    with lock:
+        return _load_grid(*key)
+
+
+@lru_cache(maxsize=None)
+def _load_grid(satellite: str, sensor: str, cache_dir: str) -> GridIndex:
+    path = join(cache_dir, basename(grid_url(satellite, sensor)))
+
+    if not exists(path):
+        makedirs(cache_dir, exist_ok=True)
+        grid_download(satellite, sensor, cache_dir)
+
+    return GridIndex.from_kmz(path)
+
+
+def grid_lookup(
+    geometry,
+    satellite: Literal["cbers4a", "amazonia1"] = "cbers4a",
+    sensor: Literal["mux", "wfi"] = "mux",
+    cache_dir: str = CACHE_DIR,
+) -> List[Tuple[int, int]]:
+    """
+    Which path and rows cover an area
+
+    Args:
+        geometry: Shapely geometry, GeoJSON object or bounding box [min_lon, min_lat, max_lon, max_lat] in EPSG:4326
+        satellite: "cbers4a" or "amazonia1"
+        sensor: "mux" or "wfi"
+        cache_dir: Directory of the downloaded grid files
+    Examples:
+        - grid_lookup([-63.9, -8.8, -63.7, -8.6], "cbers4a", "wfi")
+        - grid_lookup(read_geojson("area.geojson"), "amazonia1", "wfi")
+    Returns:
+        Sorted list of (path, row)
+    """
+    return load_grid(satellite, sensor, cache_dir).lookup(geometry)
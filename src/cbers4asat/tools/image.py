@@ -7,8 +7,13 @@ from skimage.transform import resize
 from skimage.color import rgb2hsv, hsv2rgb
 from shapely import from_wkt
 from shapely.geometry import Polygon
-from typing import Dict, Union
+from typing import Dict, List, Optional, Union
 from geomet import wkt
+from .blocks import block_windows
+from .geometry import geojson_crs, transform_geometry
+from .masking import invalid_pixels
+from .previews import build_overviews
+from .profiling import Profiler, span
 
 
 def rgbn_composite(
@@ -18,6 +23,11 @@ def rgbn_composite(
     nir: str = None,
     outdir: str = getcwd(),
     filename: str = "rgbn_composite.tif",
+    cloud_mask: Optional[str] = None,
+    cloud_threshold: Optional[int] = None,
+    block_size: int = 1024,
+    overviews: Optional[List[int]] = None,
+    profiler: Optional[Profiler] = None,
 ):
     """
     Stack bands
@@ -29,37 +39,70 @@ def rgbn_composite(
         nir: (Optional) Nir channel
         outdir: Output path
         filename: Output filename
+        cloud_mask: (Optional) Mask raster aligned with the bands. Non zero pixels are saved as nodata
+        cloud_threshold: (Optional) Pixels with red, green and blue at or above it are saved as nodata
+        block_size: Block side length in pixels
+        overviews: (Optional) Build internal overviews with these factors. Ex.: [2, 4, 8]
+        profiler: (Optional) Collects the read, mask and write timing spans
     Returns:
         GeoTIFF file
     """
     if isfile(red) and isfile(green) and isfile(blue):
+        if nir is not None and not isfile(nir):
+            raise FileNotFoundError("Check band's file path")
+        if cloud_mask is not None and not isfile(cloud_mask):
+            raise FileNotFoundError("Check cloud mask's file path")
+
         bands = [
             rasterio_open(red),
             rasterio_open(green),
             rasterio_open(blue),
         ]
 
-        if nir is not None and isfile(nir):
+        if nir is not None:
             bands.append(rasterio_open(nir))
-        elif nir is not None and not isfile(nir):
-            raise FileNotFoundError("Check band's file path")
 
-        if not exists(outdir):
-            makedirs(outdir)
+        mask = rasterio_open(cloud_mask) if cloud_mask is not None else None
 
-        bands_metadata = bands[0].meta.copy()
+        try:
+            if mask is not None and mask.shape != bands[0].shape:
+                raise ValueError("Cloud mask must have the same dimensions of bands")
 
-        merged = stack([band.read(1) for band in bands])
+            if not exists(outdir):
+                makedirs(outdir)
 
-        for band in bands:
-            band.close()
+            bands_metadata = bands[0].meta.copy()
 
-        count, height, width = merged.shape
+            height, width = bands[0].shape
 
-        bands_metadata.update(width=width, height=height, count=count, nodata=0)
+            bands_metadata.update(
+                width=width, height=height, count=len(bands), nodata=0
+            )
 
-        with rasterio_open(join(outdir, filename), "w", **bands_metadata) as raster:
-            raster.write(merged)
+            with rasterio_open(join(outdir, filename), "w", **bands_metadata) as raster:
+                for window in block_windows(width, height, block_size):
+                    with span(profiler, "read"):
+                        merged = stack([band.read(1, window=window) for band in bands])
+
+                    if mask is not None or cloud_threshold is not None:
+                        with span(profiler, "mask"):
+                            block_mask = None
+                            if mask is not None:
+                                block_mask = mask.read(1, window=window)
+                            invalid = invalid_pixels(
+                                merged, block_mask, cloud_threshold
+                            )
+                            merged[:, invalid] = 0
+
+                    with span(profiler, "write"):
+                        raster.write(merged, window=window)
+
+                build_overviews(raster, overviews)
+        finally:
+            for band in bands:
+                band.close()
+            if mask is not None:
+                mask.close()
 
     else:
         raise FileNotFoundError("Check band's file path")
@@ -70,6 +113,8 @@ def pansharpening(
     multispectral: str = None,
     outdir: str = getcwd(),
     filename: str = "pansharp.tif",
+    overviews: Optional[List[int]] = None,
+    profiler: Optional[Profiler] = None,
 ):
     """
     Pansharpen multispectral file
@@ -79,6 +124,8 @@ def pansharpening(
         multispectral: Multispectral band
         outdir: Output Directory
         filename: Output file name
+        overviews: (Optional) Build internal overviews with these factors. Ex.: [2, 4, 8]
+        profiler: (Optional) Collects the read, rgb2hsv, resize, hsv2rgb and write timing spans
     Returns:
         GeoTIFF file
     """
@@ -89,34 +136,38 @@ def pansharpening(
 
         BIT_DEPTH = 65535
 
-        with rasterio_open(multispectral) as multispectral_file:
-            multispectral_array = multispectral_file.read().astype(
-                dtype=float32, copy=False
-            )
+        with span(profiler, "read"):
+            with rasterio_open(multispectral) as multispectral_file:
+                multispectral_array = multispectral_file.read().astype(
+                    dtype=float32, copy=False
+                )
 
-        # Normalize RGB to 0..1 interval
-        multispectral_array = multispectral_array / BIT_DEPTH
+        with span(profiler, "rgb2hsv"):
+            # Normalize RGB to 0..1 interval
+            multispectral_array = multispectral_array / BIT_DEPTH
 
-        multispectral_hsv = rgb2hsv(multispectral_array, channel_axis=0)
+            multispectral_hsv = rgb2hsv(multispectral_array, channel_axis=0)
 
         del multispectral_array
 
-        with rasterio_open(panchromatic) as panchromatic_file:
-            # Create metadata copy and add expected output data
-            panchromatic_metadata = panchromatic_file.meta.copy()
-            panchromatic_metadata.update(count=3, dtype="float32")
+        with span(profiler, "read"):
+            with rasterio_open(panchromatic) as panchromatic_file:
+                # Create metadata copy and add expected output data
+                panchromatic_metadata = panchromatic_file.meta.copy()
+                panchromatic_metadata.update(count=3, dtype="float32")
 
-            # Get matrix data
-            panchromatic_array = panchromatic_file.read(1).astype(
-                dtype=float32, copy=False
-            )
+                # Get matrix data
+                panchromatic_array = panchromatic_file.read(1).astype(
+                    dtype=float32, copy=False
+                )
 
         height, width = panchromatic_array.shape
 
-        # Resizing all bands to pansharp dimensions
-        multispectral_hsv = resize(
-            multispectral_hsv, (3, height, width), anti_aliasing=False
-        )
+        with span(profiler, "resize"):
+            # Resizing all bands to pansharp dimensions
+            multispectral_hsv = resize(
+                multispectral_hsv, (3, height, width), anti_aliasing=False
+            )
 
         # normalize pan to 0..1 interval
         panchromatic_array = panchromatic_array / BIT_DEPTH
@@ -126,10 +177,17 @@ def pansharpening(
 
         del panchromatic_array
 
-        with rasterio_open(
-            join(outdir, filename), "w", **panchromatic_metadata
-        ) as raster:
-            raster.write(hsv2rgb(multispectral_hsv, channel_axis=0))
+        with span(profiler, "hsv2rgb"):
+            pansharp = hsv2rgb(multispectral_hsv, channel_axis=0)
+
+        del multispectral_hsv
+
+        with span(profiler, "write"):
+            with rasterio_open(
+                join(outdir, filename), "w", **panchromatic_metadata
+            ) as raster:
+                raster.write(pansharp)
+                build_overviews(raster, overviews)
 
     else:
         raise FileNotFoundError("Invalid files")
@@ -140,6 +198,9 @@ def clip(
     mask: Union[Dict, Polygon],
     outdir: str = getcwd(),
     filename: str = "raster_clip.tif",
+    mask_crs: Optional[str] = None,
+    overviews: Optional[List[int]] = None,
+    profiler: Optional[Profiler] = None,
     **kwargs,
 ):
     """
@@ -150,12 +211,21 @@ def clip(
         mask: Area to use as clip mask
         outdir: Output Directory
         filename: Output file name
+        mask_crs: (Optional) Mask CRS. Default is the GeoJSON CRS (EPSG:4326) or the raster CRS for Polygons
+        overviews: (Optional) Build internal overviews with these factors. Ex.: [2, 4, 8]
+        profiler: (Optional) Collects the mask and write timing spans
         kwargs: Any option you want to add in rasterio mask method
     Returns:
         GeoTIFF file
     """
     if isfile(raster):
         if isinstance(mask, Dict):
+            if mask_crs is None and mask.get("type") in [
+                "Feature",
+                "FeatureCollection",
+            ]:
+                mask_crs = geojson_crs(mask)
+
             if mask.get("type") in ["Feature", "FeatureCollection"]:
                 # Converting to Shapely Polygon to assure crop method will recognize the coordinates
                 if mask.get("type") == "Feature":
@@ -176,16 +246,24 @@ def clip(
         with rasterio_open(raster) as raster_file:
             raster_metadata = raster_file.meta.copy()
 
-            masked, transform = rasterio_mask(
-                dataset=raster_file, shapes=[mask], crop=True, **kwargs
-            )
+            # Masks in another CRS (like GeoJSON in EPSG:4326) are moved to the raster CRS
+            mask = transform_geometry(mask, mask_crs, raster_file.crs)
+
+            with span(profiler, "mask"):
+                masked, transform = rasterio_mask(
+                    dataset=raster_file, shapes=[mask], crop=True, **kwargs
+                )
 
             count, height, width = masked.shape
 
             raster_metadata.update(transform=transform, height=height, width=width)
 
-            with rasterio_open(join(outdir, filename), "w", **raster_metadata) as dst:
-                dst.write(masked)
+            with span(profiler, "write"):
+                with rasterio_open(
+                    join(outdir, filename), "w", **raster_metadata
+                ) as dst:
+                    dst.write(masked)
+                    build_overviews(dst, overviews)
 
     else:
         raise FileNotFoundError("Invalid Raster File")
@@ -0,0 +1,142 @@
+from os import getcwd, makedirs
+from os.path import isfile, join, exists
+from typing import List, Optional
+from numpy import errstate, float32, nan, zeros
+from rasterio import open as rasterio_open
+from .blocks import block_windows
+from .previews import build_overviews
+from .profiling import Profiler, span
+
+try:
+    from numexpr import evaluate as numexpr_evaluate
+except ImportError:
+    numexpr_evaluate = None
+
+# Index expressions and the bands they need
+INDICES = {
+    "ndvi": ("(nir - red) / (nir + red)", ("red", "nir")),
+    "ndwi": ("(green - nir) / (green + nir)", ("green", "nir")),
+    "evi": (
+        "2.5 * (nir - red) / (nir + 6.0 * red - 7.5 * blue + 1.0)",
+        ("red", "blue", "nir"),
+    ),
+    "savi": ("1.5 * (nir - red) / (nir + red + 0.5)", ("red", "nir")),
+}
+
+
+def evaluate(expression: str, bands: dict):
+    """
+    Evaluate an index expression over band arrays.
+
+    Uses numexpr (when installed) to compute the whole expression in one fused pass,
+    without the intermediate arrays created by NumPy.
+    """
+    if numexpr_evaluate is not None:
+        return numexpr_evaluate(expression, local_dict=bands)
+
+    with errstate(divide="ignore", invalid="ignore"):
+        return eval(expression, {"__builtins__": {}}, bands)
+
+
+def spectral_indices(
+    red: str = None,
+    green: str = None,
+    blue: str = None,
+    nir: str = None,
+    indices: List[str] = ("ndvi",),
+    outdir: str = getcwd(),
+    filename: str = "indices.tif",
+    scale: float = 1.0,
+    nodata: float = nan,
+    block_size: int = 1024,
+    overviews: Optional[List[int]] = None,
+    profiler: Optional[Profiler] = None,
+):
+    """
+    Compute spectral indices in a single pass over the bands, one block at a time
+
+    Args:
+        red: Red channel
+        green: Green channel
+        blue: Blue channel
+        nir: Nir channel
+        indices: Indices to compute. "ndvi", "ndwi", "evi" and "savi"
+        outdir: Output path
+        filename: Output filename
+        scale: Factor to convert digital numbers to reflectance (used by evi and savi)
+        nodata: Value of the pixels without data in any band
+        block_size: Block side length in pixels
+        overviews: (Optional) Build internal overviews with these factors. Ex.: [2, 4, 8]
+        profiler: (Optional) Collects the read, compute and write timing spans
+    Notes:
+        Only the bands needed by the chosen indices are required.
+        Install numexpr to compute the expressions without NumPy temporaries.
+    Examples:
+        - spectral_indices(red="BAND3.tif", nir="BAND4.tif")
+        - spectral_indices("BAND3.tif", "BAND2.tif", "BAND1.tif", "BAND4.tif", ["ndvi", "ndwi"])
+    Returns:
+        GeoTIFF file with one float32 band per index
+    """
+    if not len(indices):
+        raise ValueError("Choose indices to compute.")
+
+    for index in indices:
+        if index not in INDICES:
+            raise ValueError(f"Indices available: {', '.join(INDICES)}")
+
+    paths = {"red": red, "green": green, "blue": blue, "nir": nir}
+    needed = sorted({band for index in indices for band in INDICES[index][1]})
+
+    for band in needed:
+        if paths[band] is None or not isfile(paths[band]):
+            raise FileNotFoundError(f"Check {band} band's file path")
+
+    bands = {band: rasterio_open(paths[band]) for band in needed}
+
+    try:
+        reference = bands[needed[0]]
+        for dataset in bands.values():
+            if dataset.shape != reference.shape:
+                raise ValueError("All bands must have the same dimensions")
+
+        if not exists(outdir):
+            makedirs(outdir)
+
+        metadata = reference.meta.copy()
+        metadata.update(
+            driver="GTiff", count=len(indices), dtype="float32", nodata=nodata
+        )
+
+        with rasterio_open(join(outdir, filename), "w", **metadata) as dst:
+            for window in block_windows(reference.width, reference.height, block_size):
+                with span(profiler, "read"):
+                    arrays = dict()
+                    invalid = zeros((window.height, window.width), dtype=bool)
+                    for band, dataset in bands.items():
+                        array = dataset.read(1, window=window)
+                        if dataset.nodata is not None:
+                            invalid |= array == dataset.nodata
+                        arrays[band] = array.astype(float32, copy=False)
+                        if scale != 1.0:
+                            arrays[band] *= float32(scale)
+
+                with span(profiler, "compute"):
+                    results = list()
+                    for index in indices:
+                        result = evaluate(INDICES[index][0], arrays).astype(
+                            float32, copy=False
+                        )
+                        result[invalid] = nodata
+                        results.append(result)
+
+                with span(profiler, "write"):
+                    for position, result in enumerate(results, start=1):
+                        dst.write(result, position, window=window)
+
+            for position, index in enumerate(indices, start=1):
+                dst.set_band_description(position, index.upper())
+
+            build_overviews(dst, overviews)
+    finally:
+        for dataset in bands.values():
+            dataset.close()
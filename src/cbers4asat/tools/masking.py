@@ -0,0 +1,48 @@
+from typing import Optional, Sequence
+from numpy import ndarray, zeros
+
+
+def bright_pixels(
+    data: ndarray, threshold: float, bands: Sequence[int] = (0, 1, 2)
+) -> ndarray:
+    """
+    Cheap cloud mask: pixels where all the given bands are at or above the threshold.
+
+    Args:
+        data: Block with shape (bands, height, width)
+        threshold: Brightness (digital number) of clouds
+        bands: Band positions to test. Default is red, green and blue of a composite
+    Returns:
+        Boolean array with shape (height, width). True where it is cloudy
+    """
+    # Single band rasters test the bands they have
+    bands = [band for band in bands if band < data.shape[0]]
+    mask = data[bands[0]] >= threshold
+    for band in bands[1:]:
+        mask &= data[band] >= threshold
+    return mask
+
+
+def invalid_pixels(
+    data: ndarray,
+    mask: Optional[ndarray] = None,
+    threshold: Optional[float] = None,
+    bands: Sequence[int] = (0, 1, 2),
+) -> ndarray:
+    """
+    Combine a mask raster block and the brightness mask of a block.
+
+    Args:
+        data: Block with shape (bands, height, width)
+        mask: (Optional) Mask raster block. Non zero pixels are invalid
+        threshold: (Optional) Brightness threshold of clouds
+        bands: Band positions tested by the brightness threshold
+    Returns:
+        Boolean array with shape (height, width). True where the pixel must be nodata
+    """
+    invalid = zeros(data.shape[1:], dtype=bool)
+    if mask is not None:
+        invalid |= mask != 0
+    if threshold is not None:
+        invalid |= bright_pixels(data, threshold, bands)
+    return invalid
@@ -0,0 +1,235 @@
+from math import ceil
+from os import getcwd, makedirs
+from os.path import isfile, join, exists
+from typing import List, Literal, Optional
+from numpy import errstate, full, float32, inf, nan_to_num, zeros
+from rasterio import open as rasterio_open
+from rasterio.transform import from_origin
+from rasterio.windows import Window
+from .blocks import block_windows
+from .masking import invalid_pixels
+from .previews import build_overviews
+from .profiling import Profiler, span
+
+
+def mosaic(
+    rasters: List[str],
+    outdir: str = getcwd(),
+    filename: str = "mosaic.tif",
+    method: Literal["first", "last", "least-cloud", "max-ndvi"] = "first",
+    nodata: Optional[float] = None,
+    cloud_cover: Optional[List[float]] = None,
+    cloud_masks: Optional[List[Optional[str]]] = None,
+    cloud_threshold: Optional[int] = None,
+    red_band: int = 1,
+    nir_band: int = 4,
+    block_size: int = 1024,
+    overviews: Optional[List[int]] = None,
+    profiler: Optional[Profiler] = None,
+):
+    """
+    Merge adjacent scenes in a single raster, one block at a time
+
+    Only one output block of every scene is in memory at once, so the memory used
+    does not depend on the mosaic size.
+
+    Args:
+        rasters: Scenes (e.g. rgbn_composite outputs) with same CRS, resolution and bands
+        outdir: Output path
+        filename: Output filename
+        method: Which scene wins in overlapping pixels
+        nodata: (Optional) Nodata value. Default is the first scene nodata or 0
+        cloud_cover: (Optional) Cloud cover of every scene. Required by "least-cloud"
+        cloud_masks: (Optional) Mask raster of every scene (or None). Non zero pixels are not used
+        cloud_threshold: (Optional) Pixels with red, green and blue at or above it are not used. Skipped in scenes with 0% cloud cover
+        red_band: Red band index, used by "max-ndvi"
+        nir_band: Nir band index, used by "max-ndvi"
+        block_size: Block side length in pixels
+        overviews: (Optional) Build internal overviews with these factors. Ex.: [2, 4, 8]
+        profiler: (Optional) Collects the read, mask, merge and write timing spans
+    Notes:
+        Methods:
+            - first: first valid pixel in the given scenes order
+            - last: last valid pixel in the given scenes order
+            - least-cloud: first valid pixel of the scenes sorted by cloud cover
+            - max-ndvi: the pixel with the highest NDVI
+        Cloud cover from Items:
+            - `cloud_cover=[item.properties.cloud_cover for item in items]`
+    Examples:
+        - mosaic(["206_133.tif", "206_134.tif"], method="least-cloud", cloud_cover=[10, 2.5])
+    Returns:
+        GeoTIFF file
+    """
+    if not rasters or not all(isfile(raster) for raster in rasters):
+        raise FileNotFoundError("Check raster's file path")
+
+    if method not in ("first", "last", "least-cloud", "max-ndvi"):
+        raise ValueError("Methods available: first, last, least-cloud and max-ndvi")
+
+    order = list(range(len(rasters)))
+    if method == "last":
+        order.reverse()
+    elif method == "least-cloud":
+        if cloud_cover is None or len(cloud_cover) != len(rasters):
+            raise ValueError("Provide the cloud cover of every raster")
+        order.sort(key=lambda index: cloud_cover[index])
+
+    if cloud_masks is not None:
+        if len(cloud_masks) != len(rasters):
+            raise ValueError("Provide the cloud mask of every raster (or None)")
+        for cloud_mask in cloud_masks:
+            if cloud_mask is not None and not isfile(cloud_mask):
+                raise FileNotFoundError("Check cloud mask's file path")
+
+    sources = [rasterio_open(rasters[index]) for index in order]
+    masks = [
+        (
+            rasterio_open(cloud_masks[index])
+            if cloud_masks and cloud_masks[index]
+            else None
+        )
+        for index in order
+    ]
+    # Scenes without clouds, according to the catalog, skip the brightness mask.
+    thresholds = [
+        None if cloud_cover is not None and cloud_cover[index] == 0 else cloud_threshold
+        for index in order
+    ]
+
+    try:
+        reference = sources[0]
+        for source in sources[1:]:
+            if source.crs != reference.crs:
+                raise ValueError("All rasters must have the same CRS")
+            if source.count != reference.count:
+                raise ValueError("All rasters must have the same number of bands")
+            if source.res != reference.res:
+                raise ValueError("All rasters must have the same resolution")
+
+        if method == "max-ndvi" and reference.count < max(red_band, nir_band):
+            raise ValueError("Rasters must have red and nir bands to use max-ndvi")
+
+        if not exists(outdir):
+            makedirs(outdir)
+
+        xres, yres = reference.res
+        left = min(source.bounds.left for source in sources)
+        bottom = min(source.bounds.bottom for source in sources)
+        right = max(source.bounds.right for source in sources)
+        top = max(source.bounds.top for source in sources)
+
+        width = ceil(round((right - left) / xres, 6))
+        height = ceil(round((top - bottom) / yres, 6))
+
+        if nodata is None:
+            nodata = reference.nodata if reference.nodata is not None else 0
+
+        # Scenes position inside the mosaic grid
+        offsets = [
+            (
+                round((source.bounds.top - top) / -yres),
+                round((source.bounds.left - left) / xres),
+            )
+            for source in sources
+        ]
+
+        metadata = reference.meta.copy()
+        metadata.update(
+            driver="GTiff",
+            width=width,
+            height=height,
+            transform=from_origin(left, top, xres, yres),
+            nodata=nodata,
+            BIGTIFF="IF_SAFER",
+        )
+
+        with rasterio_open(join(outdir, filename), "w", **metadata) as dst:
+            for window in block_windows(width, height, block_size):
+                merged = full(
+                    (reference.count, window.height, window.width),
+                    nodata,
+                    dtype=reference.dtypes[0],
+                )
+                filled = zeros((window.height, window.width), dtype=bool)
+                best_ndvi = full((window.height, window.width), -inf, dtype=float32)
+
+                for source, mask, threshold, (row_off, col_off) in zip(
+                    sources, masks, thresholds, offsets
+                ):
+                    # Block intersection with the scene, in mosaic pixels
+                    row_start = max(window.row_off, row_off)
+                    col_start = max(window.col_off, col_off)
+                    row_stop = min(
+                        window.row_off + window.height, row_off + source.height
+                    )
+                    col_stop = min(
+                        window.col_off + window.width, col_off + source.width
+                    )
+
+                    if row_start >= row_stop or col_start >= col_stop:
+                        continue
+
+                    scene_window = Window(
+                        col_start - col_off,
+                        row_start - row_off,
+                        col_stop - col_start,
+                        row_stop - row_start,
+                    )
+
+                    with span(profiler, "read"):
+                        data = source.read(window=scene_window)
+
+                    invalid = None
+                    if mask is not None or threshold is not None:
+                        with span(profiler, "mask"):
+                            block_mask = None
+                            if mask is not None:
+                                block_mask = mask.read(1, window=scene_window)
+                            invalid = invalid_pixels(data, block_mask, threshold)
+
+                    with span(profiler, "merge"):
+                        rows = slice(
+                            row_start - window.row_off, row_stop - window.row_off
+                        )
+                        cols = slice(
+                            col_start - window.col_off, col_stop - window.col_off
+                        )
+
+                        if source.nodata is not None:
+                            valid = (data != source.nodata).any(axis=0)
+                        else:
+                            valid = full(data.shape[1:], True)
+
+                        if invalid is not None:
+                            valid &= ~invalid
+
+                        if method == "max-ndvi":
+                            red = data[red_band - 1].astype(float32)
+                            nir = data[nir_band - 1].astype(float32)
+                            with errstate(divide="ignore", invalid="ignore"):
+                                ndvi = (nir - red) / (nir + red)
+                            # Undefined NDVI (0/0) loses to any other pixel
+                            nan_to_num(ndvi, copy=False, nan=-2.0)
+                            take = valid & (
+                                (ndvi > best_ndvi[rows, cols]) | ~filled[rows, cols]
+                            )
+                            best_ndvi[rows, cols][take] = ndvi[take]
+                        else:
+                            take = valid & ~filled[rows, cols]
+
+                        merged[:, rows, cols][:, take] = data[:, take]
+                        filled[rows, cols] |= take
+
+                    if method != "max-ndvi" and filled.all():
+                        break
+
+                with span(profiler, "write"):
+                    dst.write(merged, window=window)
+
+            build_overviews(dst, overviews)
+    finally:
+        for source in sources:
+            source.close()
+        for mask in masks:
+            if mask is not None:
+                mask.close()
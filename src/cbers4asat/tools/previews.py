@@ -0,0 +1,99 @@
+from math import ceil
+from os.path import isfile
+from typing import List, Optional
+from numpy import clip as numpy_clip, nanpercentile, ndarray, uint8
+from numpy.ma import getmaskarray
+from rasterio import open as rasterio_open
+from rasterio.enums import Resampling
+
+
+def build_overviews(dataset, factors: Optional[List[int]]) -> None:
+    """
+    Build internal overviews (pyramid) of a dataset opened in write mode.
+
+    Args:
+        dataset: rasterio dataset
+        factors: Decimation factors. Ex.: [2, 4, 8, 16]
+    """
+    if not factors:
+        return
+
+    if any(factor <= 1 for factor in factors):
+        raise ValueError("Overview factors must be greater than 1.")
+
+    dataset.build_overviews(sorted(factors), Resampling.average)
+    dataset.update_tags(ns="rio_overview", resampling="average")
+
+
+def preview(
+    raster: str,
+    max_size: int = 512,
+    bands: Optional[List[int]] = None,
+    outfile: Optional[str] = None,
+) -> ndarray:
+    """
+    Read a reduced resolution version of a raster
+
+    The decimated read uses the raster overviews when available, so only a small
+    fraction of the file is read.
+
+    Args:
+        raster: Image to preview
+        max_size: Largest side of the preview in pixels
+        bands: (Optional) Bands to read. Default is the first three bands (or the only band)
+        outfile: (Optional) Save the preview as a contrast stretched 8-bit PNG
+    Examples:
+        - preview("pansharp.tif", 256, outfile="pansharp.png")
+        - array = preview("rgbn_composite.tif", bands=[4, 1, 2])
+    Returns:
+        Array with shape (bands, height, width)
+    """
+    if not isfile(raster):
+        raise FileNotFoundError("Invalid Raster File")
+
+    if max_size <= 0:
+        raise ValueError("Max size must be greater than 0.")
+
+    with rasterio_open(raster) as src:
+        if bands is None:
+            bands = [1, 2, 3] if src.count >= 3 else [1]
+
+        decimation = max(1, ceil(max(src.width, src.height) / max_size))
+
+        array = src.read(
+            bands,
+            out_shape=(
+                len(bands),
+                ceil(src.height / decimation),
+                ceil(src.width / decimation),
+            ),
+            resampling=Resampling.nearest,
+            masked=True,
+        )
+
+        crs = src.crs
+        transform = src.transform * src.transform.scale(
+            src.width / array.shape[2], src.height / array.shape[1]
+        )
+
+    if outfile is not None:
+        stretched = array.astype("float32").filled(float("nan"))
+        low, high = nanpercentile(stretched, (2, 98))
+        scaled = (stretched - low) / ((high - low) or 1) * 255
+        image = numpy_clip(scaled, 0, 255)
+        image[getmaskarray(array)] = 0
+
+        with rasterio_open(
+            outfile,
+            "w",
+            driver="PNG",
+            width=array.shape[2],
+            height=array.shape[1],
+            count=array.shape[0],
+            dtype="uint8",
+            crs=crs,
+            transform=transform,
+        ) as dst:
+            dst.write(image.astype(uint8))
+
+    return array.data
@@ -0,0 +1,91 @@
+from contextlib import contextmanager, nullcontext
+from time import perf_counter
+from typing import Callable, Dict, Iterator, List, Optional
+import tracemalloc
+
+
+class Profiler:
+    """
+    Collect timing spans (and optionally peak memory) of each phase of the tools.
+
+    Spans with the same name are accumulated, so block by block phases are reported
+    once with the total time.
+
+    Args:
+        hook: Function called at the end of every span with its name, seconds and peak memory
+        memory: Track peak memory (bytes) with tracemalloc. Slows down the tools.
+    Examples:
+        - profiler = Profiler()
+        - pansharpening("BAND0.tif", "RGB.tif", profiler=profiler)
+        - profiler.report()
+    """
+
+    def __init__(
+        self, hook: Optional[Callable[[Dict], None]] = None, memory: bool = False
+    ):
+        self.hook = hook
+        self.memory = memory
+        self._spans: Dict[str, Dict] = dict()
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        """
+        Measure the code inside the context.
+
+        Args:
+            name: Phase name. Ex.: read
+        """
+        started_tracing = False
+        baseline = 0
+        if self.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            seconds = perf_counter() - start
+            peak = None
+            if self.memory:
+                peak = tracemalloc.get_traced_memory()[1] - baseline
+                if started_tracing:
+                    tracemalloc.stop()
+
+            record = self._spans.setdefault(
+                name, {"name": name, "calls": 0, "seconds": 0.0, "peak_memory": None}
+            )
+            record["calls"] += 1
+            record["seconds"] += seconds
+            if peak is not None:
+                record["peak_memory"] = max(record["peak_memory"] or 0, peak)
+
+            if self.hook is not None:
+                self.hook({"name": name, "seconds": seconds, "peak_memory": peak})
+
+    def report(self) -> List[Dict]:
+        """
+        Spans in the order they first happened.
+
+        Returns:
+            List of dictionaries with name, calls, seconds and peak_memory
+        """
+        return [record.copy() for record in self._spans.values()]
+
+    def reset(self) -> None:
+        """
+        Discard the collected spans.
+        """
+        self._spans.clear()
+
+
+def span(profiler: Optional[Profiler], name: str):
+    """
+    ``Profiler.span`` that also works without a profiler.
+    """
+    if profiler is None:
+        return nullcontext()
+    return profiler.span(name)
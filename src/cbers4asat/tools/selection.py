@@ -0,0 +1,147 @@
+from datetime import datetime
+from typing import List, Tuple
+from numpy import argmax, array, asarray, float64, where, zeros
+from shapely import area, box, difference, intersection, intersects, union_all
+from shapely.geometry import shape
+from ..cbers4a import ItemCollection
+
+
+def aoi_geometry(aoi):
+    """
+    Shapely geometry (EPSG:4326) of an area of interest.
+
+    Args:
+        aoi: Shapely geometry, GeoJSON geometry/Feature/FeatureCollection, bounding box [min_lon, min_lat, max_lon, max_lat] or GeoDataFrame/GeoSeries
+    Returns:
+        Shapely geometry
+    """
+    if isinstance(aoi, (list, tuple)):
+        return box(*aoi)
+
+    if hasattr(aoi, "to_crs"):  # GeoDataFrame or GeoSeries
+        if aoi.crs is not None:
+            aoi = aoi.to_crs("EPSG:4326")
+        return union_all(asarray(aoi.geometry if hasattr(aoi, "columns") else aoi))
+
+    if isinstance(aoi, dict):
+        if aoi.get("type") == "FeatureCollection":
+            return union_all([shape(f["geometry"]) for f in aoi["features"]])
+        if aoi.get("type") == "Feature":
+            return shape(aoi["geometry"])
+        return shape(aoi)
+
+    return aoi
+
+
+def scene_footprints(products) -> Tuple[List, List[float], List[str]]:
+    """
+    Footprints, cloud cover and datetime of query results.
+
+    Args:
+        products: Query result dictionary, ``ItemCollection`` or GeoDataFrame (``to_geodataframe``)
+    Returns:
+        Footprints (shapely geometries), cloud covers and datetimes, in the products order
+    """
+    if hasattr(products, "geometry") and hasattr(products, "columns"):
+        if products.crs is not None:
+            products = products.to_crs("EPSG:4326")
+        return (
+            list(products.geometry),
+            list(products["cloud_cover"]),
+            list(products["datetime"]),
+        )
+
+    if isinstance(products, dict):
+        products = ItemCollection(**products)
+
+    if not isinstance(products, ItemCollection):
+        raise ValueError(
+            "Products must be a query result, ItemCollection or GeoDataFrame"
+        )
+
+    items = list(products)
+    return (
+        [shape(vars(item.geometry)) for item in items],
+        [item.properties.cloud_cover for item in items],
+        [item.properties.datetime for item in items],
+    )
+
+
+def select_scenes(
+    products,
+    aoi,
+    coverage: float = 0.99,
+    cloud_weight: float = 1.0,
+    recency_weight: float = 0.5,
+):
+    """
+    Smallest set of scenes covering an area of interest
+
+    Scenes are picked one at a time (greedy set cover): each step takes the scene
+    adding the most uncovered area per cost, until ``coverage`` of the area is covered
+    or no scene adds any. The cost of a scene grows with its cloud cover and its age,
+    so clear and recent scenes are preferred among those covering about the same area.
+    The intersections of all footprints are computed at once (shapely array
+    operations) at every step.
+
+    Args:
+        products: Query result dictionary, ``ItemCollection`` or GeoDataFrame (``to_geodataframe``)
+        aoi: Shapely geometry, GeoJSON object, bounding box [min_lon, min_lat, max_lon, max_lat] (EPSG:4326) or GeoDataFrame
+        coverage: Fraction of the area to cover, between 0 and 1
+        cloud_weight: Cost of a fully cloudy scene, over the cost of a clear one
+        recency_weight: Cost of the oldest scene, over the cost of the most recent one
+    Examples:
+        - select_scenes(Cbers4aAPI.query(aoi_bbox, ...), aoi_bbox)
+        - api.download(select_scenes(gdf, read_geojson("area.geojson"), 0.95), ["red"])
+    Returns:
+        The selected scenes, in the same type as products, in the order they were picked
+    Notes:
+        Areas are computed in longitude and latitude degrees.
+    """
+    if not 0 < coverage <= 1:
+        raise ValueError("Coverage must be between 0 and 1")
+
+    geometry = aoi_geometry(aoi)
+    if geometry.is_empty or area(geometry) == 0:
+        raise ValueError("Area of interest must be a polygon")
+
+    footprints, clouds, dates = scene_footprints(products)
+    footprints = asarray(footprints, dtype=object)
+
+    costs = zeros(len(footprints), dtype=float64)
+    if len(footprints):
+        times = array(
+            [datetime.fromisoformat(str(d)).timestamp() for d in dates],
+            dtype=float64,
+        )
+        span = times.max() - times.min()
+        age = (times.max() - times) / span if span > 0 else zeros(len(times))
+        cloud = array(clouds, dtype=float64) / 100
+        costs = 1 + cloud_weight * cloud + recency_weight * age
+
+    # Only the scenes touching the area are candidates
+    candidates = where(intersects(footprints, geometry))[0]
+    target = area(geometry) * coverage
+    remaining = geometry
+    selected = list()
+
+    while len(candidates) and area(geometry) - area(remaining) < target:
+        gains = area(intersection(footprints[candidates], remaining))
+        best = argmax(gains / costs[candidates])
+        if gains[best] <= 0:
+            break
+
+        selected.append(int(candidates[best]))
+        remaining = difference(remaining, footprints[candidates[best]])
+        candidates = candidates[gains > 0]
+        candidates = candidates[candidates != selected[-1]]
+
+    if hasattr(products, "iloc"):
+        return products.iloc[selected]
+
+    if isinstance(products, ItemCollection):
+        items = list(products)
+        return ItemCollection(features=[items[i] for i in selected])
+
+    features = products["features"]
+    return {**products, "features": [features[i] for i in selected]}
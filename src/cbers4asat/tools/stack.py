@@ -0,0 +1,310 @@
+from json import dump, load
+from os import getcwd, listdir, makedirs
+from os.path import basename, isdir, isfile, join, exists, normpath, splitext
+from re import search
+from warnings import catch_warnings, simplefilter
+from typing import Dict, List, Literal, Optional, Tuple, Union
+from numpy import (
+    argmax,
+    errstate,
+    float32,
+    isnan,
+    load as numpy_load,
+    nan,
+    nan_to_num,
+    nanmedian,
+    take_along_axis,
+    where,
+)
+from numpy.lib.format import open_memmap
+from rasterio import open as rasterio_open
+from rasterio.crs import CRS
+from rasterio.enums import Resampling
+from rasterio.transform import Affine
+from rasterio.vrt import WarpedVRT
+from ..cbers4a import ItemCollection
+from .batch import scene_bands
+from .blocks import block_windows
+from .previews import build_overviews
+from .profiling import Profiler, span
+
+
+def scene_date(filename: str) -> Optional[str]:
+    """
+    Acquisition date in INPE's file names. Ex.: CBERS_4A_WPM_20211228_209_129_L4_BAND3.tif
+
+    Returns:
+        ISO date (2021-12-28) or None
+    """
+    date = search(r"_(\d{8})_", filename)
+    if date is None:
+        return None
+    date = date.group(1)
+    return f"{date[:4]}-{date[4:6]}-{date[6:]}"
+
+
+def stack_scenes(scenes, datadir: Optional[str] = None) -> List[Tuple[str, str, Dict]]:
+    """
+    Find the acquisition time and band files of every scene.
+
+    Returns:
+        List of (scene, time, bands) sorted by time
+    """
+    found = list()
+
+    if isinstance(scenes, str):
+        if not isdir(scenes):
+            raise NotADirectoryError("Choose a valid scenes directory.")
+        scenes = [
+            join(scenes, folder)
+            for folder in sorted(listdir(scenes))
+            if isdir(join(scenes, folder))
+        ]
+
+    if isinstance(scenes, list):
+        for folder in scenes:
+            bands = scene_bands(folder)
+            time = next(filter(None, map(scene_date, bands.values())), None)
+            if time is None:
+                raise ValueError(f"Acquisition date not found in {folder}")
+            found.append((basename(normpath(folder)), time, bands))
+        return sorted(found, key=lambda scene: scene[1])
+
+    if isinstance(scenes, dict):
+        scenes = ItemCollection(**scenes)
+
+    if not isinstance(scenes, ItemCollection):
+        raise Exception("Bad Arguments.")
+
+    if datadir is None:
+        raise ValueError("Provide the folder where the scenes were downloaded")
+
+    for item in scenes:
+        found.append(
+            (item.id, item.properties.datetime, scene_bands(join(datadir, item.id)))
+        )
+
+    return sorted(found, key=lambda scene: scene[1])
+
+
+def temporal_stack(
+    scenes: Union[str, List[str], Dict],
+    outdir: str = getcwd(),
+    filename: str = "stack.npy",
+    bands: List[str] = ("red", "green", "blue", "nir"),
+    datadir: Optional[str] = None,
+    reference: Optional[str] = None,
+    resampling: str = "nearest",
+    block_size: int = 1024,
+    profiler: Optional[Profiler] = None,
+) -> str:
+    """
+    Build a (time, band, y, x) cube from many acquisitions of the same path/row
+
+    The cube is a memory-mapped NumPy file written one scene block at a time, so it
+    may be much larger than the memory. Every scene is warped to the reference grid.
+    A JSON sidecar (same name, .json) keeps the times, bands, CRS and transform.
+
+    Args:
+        scenes: Folder with one sub folder per scene, list of scene folders, or query result (dictionary or ``ItemCollection``) downloaded with ``with_folder=True``
+        outdir: Output path
+        filename: Output filename (.npy)
+        bands: Band colors to stack, in order
+        datadir: Download folder of the query result scenes
+        reference: (Optional) Raster with the target grid. Default is the first scene's grid
+        resampling: Resampling method name of the scenes out of the reference grid
+        block_size: Block side length in pixels
+        profiler: (Optional) Collects the read and write timing spans
+    Examples:
+        - temporal_stack("./downloads", "./cube", bands=["red", "nir"])
+        - temporal_stack(Cbers4aAPI.query(...), datadir="./downloads", bands=["red", "nir"])
+    Returns:
+        Path of the cube file
+    """
+    if not len(bands):
+        raise ValueError("Choose bands to stack.")
+
+    try:
+        resampling_method = Resampling[resampling]
+    except KeyError:
+        raise ValueError(f"Invalid resampling method: {resampling}")
+
+    found = stack_scenes(scenes, datadir)
+    if not found:
+        raise ValueError("No scenes to stack.")
+
+    for name, _, paths in found:
+        for band in bands:
+            if band not in paths or not isfile(paths[band]):
+                raise FileNotFoundError(f"Check {band} band's file of {name}")
+
+    with rasterio_open(reference or found[0][2][bands[0]]) as grid:
+        crs, transform = grid.crs, grid.transform
+        width, height = grid.width, grid.height
+
+    with rasterio_open(found[0][2][bands[0]]) as first:
+        dtype, nodata = first.dtypes[0], first.nodata
+
+    if not exists(outdir):
+        makedirs(outdir)
+
+    path = join(outdir, filename)
+    cube = open_memmap(
+        path, mode="w+", dtype=dtype, shape=(len(found), len(bands), height, width)
+    )
+
+    try:
+        for time, (_, _, paths) in enumerate(found):
+            for position, band in enumerate(bands):
+                with (
+                    rasterio_open(paths[band]) as src,
+                    WarpedVRT(
+                        src,
+                        crs=crs,
+                        transform=transform,
+                        width=width,
+                        height=height,
+                        resampling=resampling_method,
+                        nodata=nodata if nodata is not None else 0,
+                    ) as vrt,
+                ):
+                    for window in block_windows(width, height, block_size):
+                        with span(profiler, "read"):
+                            data = vrt.read(1, window=window)
+
+                        with span(profiler, "write"):
+                            rows, cols = window.toslices()
+                            cube[time, position, rows, cols] = data
+            cube.flush()
+    finally:
+        del cube
+
+    with open(f"{splitext(path)[0]}.json", "w") as f:
+        dump(
+            {
+                "scenes": [name for name, _, _ in found],
+                "times": [time for _, time, _ in found],
+                "bands": list(bands),
+                "crs": crs.to_wkt(),
+                "transform": list(transform)[:6],
+                "nodata": nodata if nodata is not None else 0,
+            },
+            f,
+            indent=2,
+        )
+
+    return path
+
+
+def open_stack(path: str):
+    """
+    Open a cube built by ``temporal_stack`` without reading it into memory
+
+    Args:
+        path: Cube file (.npy)
+    Returns:
+        Read only memory-mapped array (time, band, y, x) and its metadata dictionary
+    """
+    if not isfile(path):
+        raise FileNotFoundError("Invalid Stack File")
+
+    with open(f"{splitext(path)[0]}.json") as f:
+        metadata = load(f)
+
+    metadata["crs"] = CRS.from_wkt(metadata["crs"])
+    metadata["transform"] = Affine(*metadata["transform"])
+
+    return numpy_load(path, mmap_mode="r"), metadata
+
+
+def temporal_reduce(
+    stack: str,
+    outdir: str = getcwd(),
+    filename: str = "reduced.tif",
+    method: Literal["median", "max-ndvi"] = "median",
+    red_band: str = "red",
+    nir_band: str = "nir",
+    block_size: int = 512,
+    overviews: Optional[List[int]] = None,
+    profiler: Optional[Profiler] = None,
+):
+    """
+    Reduce the time axis of a cube to a single image, one block at a time
+
+    Pixels without data in an acquisition (e.g. out of the scene) are ignored.
+
+    Args:
+        stack: Cube file built by ``temporal_stack``
+        outdir: Output path
+        filename: Output filename
+        method: "median" of every band, or every band of the acquisition with the highest NDVI
+        red_band: Red band name in the cube (max-ndvi)
+        nir_band: Nir band name in the cube (max-ndvi)
+        block_size: Block side length in pixels. Every block reads all acquisitions
+        overviews: (Optional) Build internal overviews with these factors. Ex.: [2, 4, 8]
+        profiler: (Optional) Collects the read, reduce and write timing spans
+    Examples:
+        - temporal_reduce("./cube/stack.npy", "./cube", method="max-ndvi")
+    Returns:
+        GeoTIFF file with the cube bands
+    """
+    if method not in ("median", "max-ndvi"):
+        raise ValueError("Methods available: median and max-ndvi")
+
+    cube, metadata = open_stack(stack)
+    _, count, height, width = cube.shape
+    nodata = metadata["nodata"]
+
+    if method == "max-ndvi":
+        for band in (red_band, nir_band):
+            if band not in metadata["bands"]:
+                raise ValueError(f"The stack has no {band} band")
+        red = metadata["bands"].index(red_band)
+        nir = metadata["bands"].index(nir_band)
+
+    if not exists(outdir):
+        makedirs(outdir)
+
+    with rasterio_open(
+        join(outdir, filename),
+        "w",
+        driver="GTiff",
+        width=width,
+        height=height,
+        count=count,
+        dtype=cube.dtype,
+        crs=metadata["crs"],
+        transform=metadata["transform"],
+        nodata=nodata,
+    ) as dst:
+        for window in block_windows(width, height, block_size):
+            with span(profiler, "read"):
+                rows, cols = window.toslices()
+                block = cube[:, :, rows, cols].astype(float32)
+                block[block == nodata] = nan
+
+            with (
+                span(profiler, "reduce"),
+                errstate(divide="ignore", invalid="ignore"),
+                catch_warnings(),
+            ):
+                # Pixels without data in every acquisition stay nodata
+                simplefilter("ignore", RuntimeWarning)
+                if method == "median":
+                    reduced = nanmedian(block, axis=0)
+                else:
+                    ndvi = (block[:, nir] - block[:, red]) / (
+                        block[:, nir] + block[:, red]
+                    )
+                    best = argmax(nan_to_num(ndvi, nan=-2.0), axis=0)
+                    reduced = take_along_axis(block, best[None, None], axis=0)[0]
+
+                reduced = where(isnan(reduced), nodata, reduced)
+
+            with span(profiler, "write"):
+                dst.write(reduced.astype(cube.dtype), window=window)
+
+        for position, band in enumerate(metadata["bands"], start=1):
+            dst.set_band_description(position, band.upper())
+
+        build_overviews(dst, overviews)
@@ -0,0 +1,100 @@
+from os import getcwd, makedirs
+from os.path import isfile, join, exists
+from typing import List, Optional, Tuple, Union
+from rasterio import open as rasterio_open
+from rasterio.enums import Resampling
+from rasterio.vrt import WarpedVRT
+from rasterio.warp import aligned_target, calculate_default_transform
+from .blocks import block_windows
+from .previews import build_overviews
+from .profiling import Profiler, span
+
+
+def reproject(
+    raster: str,
+    dst_crs: str,
+    outdir: str = getcwd(),
+    filename: str = "reprojected.tif",
+    resolution: Optional[Union[float, Tuple[float, float]]] = None,
+    snap: bool = False,
+    resampling: str = "nearest",
+    block_size: int = 1024,
+    overviews: Optional[List[int]] = None,
+    profiler: Optional[Profiler] = None,
+):
+    """
+    Reproject raster, warping one block at a time
+
+    Args:
+        raster: Image to reproject
+        dst_crs: Target CRS. Ex.: "EPSG:31983"
+        outdir: Output path
+        filename: Output filename
+        resolution: (Optional) Target pixel size in dst_crs units. Default keeps the pixel count
+        snap: Align the pixels to a grid of the resolution size, starting at the CRS origin
+        resampling: Resampling method name. Ex.: "nearest", "bilinear", "cubic", "average"
+        block_size: Block side length in pixels
+        overviews: (Optional) Build internal overviews with these factors. Ex.: [2, 4, 8]
+        profiler: (Optional) Collects the warp and write timing spans
+    Examples:
+        - reproject("rgbn_composite.tif", "EPSG:31983", resolution=8, snap=True)
+    Returns:
+        GeoTIFF file
+    """
+    if not isfile(raster):
+        raise FileNotFoundError("Invalid Raster File")
+
+    if snap and resolution is None:
+        raise ValueError("Snapping to a grid requires the resolution")
+
+    try:
+        resampling_method = Resampling[resampling]
+    except KeyError:
+        raise ValueError(f"Invalid resampling method: {resampling}")
+
+    if not exists(outdir):
+        makedirs(outdir)
+
+    with rasterio_open(raster) as src:
+        transform, width, height = calculate_default_transform(
+            src.crs,
+            dst_crs,
+            src.width,
+            src.height,
+            *src.bounds,
+            resolution=resolution,
+        )
+
+        if snap:
+            transform, width, height = aligned_target(
+                transform, width, height, resolution
+            )
+
+        metadata = src.meta.copy()
+        metadata.update(
+            driver="GTiff",
+            crs=dst_crs,
+            transform=transform,
+            width=width,
+            height=height,
+        )
+
+        with (
+            WarpedVRT(
+                src,
+                crs=dst_crs,
+                transform=transform,
+                width=width,
+                height=height,
+                resampling=resampling_method,
+            ) as vrt,
+            rasterio_open(join(outdir, filename), "w", **metadata) as dst,
+        ):
+            for window in block_windows(width, height, block_size):
+                with span(profiler, "warp"):
+                    data = vrt.read(window=window)
+
+                with span(profiler, "write"):
+                    dst.write(data, window=window)
+
+            build_overviews(dst, overviews)
@@ -0,0 +1,177 @@
+from os.path import isfile
+from typing import List, Optional, Sequence
+from numpy import (
+    bincount,
+    digitize,
+    errstate,
+    float64,
+    full,
+    inf,
+    maximum,
+    minimum,
+    nan,
+    sort,
+    sqrt,
+    zeros,
+)
+from numpy.ma import getmaskarray
+from pandas import DataFrame
+from rasterio import open as rasterio_open
+from rasterio.features import rasterize
+from rasterio.windows import bounds as window_bounds, transform as window_transform
+from shapely import STRtree, box
+from shapely.geometry import shape
+from .blocks import block_windows
+from .geometry import geojson_crs, transform_geometry
+from .profiling import Profiler, span
+
+
+def zone_geometries(zones, zone_id: str, zones_crs, raster_crs):
+    """
+    Ids and geometries (in the raster CRS) of GeoJSON features or GeoDataFrame rows.
+    """
+    if hasattr(zones, "geometry") and hasattr(zones, "columns"):  # GeoDataFrame
+        if zones.crs is not None and raster_crs is not None:
+            zones = zones.to_crs(raster_crs)
+        ids = zones[zone_id] if zone_id in zones.columns else zones.index
+        return list(ids), list(zones.geometry)
+
+    if zones.get("type") == "FeatureCollection":
+        features = zones["features"]
+    elif zones.get("type") == "Feature":
+        features = [zones]
+    else:
+        raise ValueError("Zones must be a GeoJSON Feature(Collection) or GeoDataFrame")
+
+    crs = zones_crs or geojson_crs(zones)
+    ids = [
+        (feature.get("properties") or {}).get(zone_id, feature.get("id", position))
+        for position, feature in enumerate(features)
+    ]
+    geometries = [
+        transform_geometry(shape(feature["geometry"]), crs, raster_crs)
+        for feature in features
+    ]
+    return ids, geometries
+
+
+def zonal_stats(
+    raster: str,
+    zones,
+    bands: Optional[List[int]] = None,
+    zone_id: str = "id",
+    zones_crs: Optional[str] = None,
+    histogram: Optional[Sequence[float]] = None,
+    all_touched: bool = False,
+    block_size: int = 1024,
+    profiler: Optional[Profiler] = None,
+) -> DataFrame:
+    """
+    Statistics of many polygons in a single pass over the raster
+
+    Polygons are rasterized into a label grid one block at a time (only the polygons
+    touching the block) and the statistics of all zones are accumulated together, so
+    the cost follows the raster size instead of polygons × raster.
+
+    Args:
+        raster: Image (e.g. rgbn_composite or spectral_indices outputs)
+        zones: GeoJSON object (``read_geojson``) or GeoDataFrame with the polygons
+        bands: (Optional) Bands to summarize. Default is all bands
+        zone_id: Feature property (or GeoDataFrame column) with the zone name. Default is the feature position
+        zones_crs: (Optional) Zones CRS. Default is the GeoJSON "crs" member, or EPSG:4326
+        histogram: (Optional) Bin edges of a histogram per zone. Ex.: numpy.linspace(-1, 1, 21)
+        all_touched: Include every pixel touched by the polygons, not only the pixels whose center is inside
+        block_size: Block side length in pixels
+        profiler: (Optional) Collects the rasterize, read and reduce timing spans
+    Notes:
+        Pixels without data are ignored. Where zones overlap, pixels go to the last zone.
+    Examples:
+        - zonal_stats("indices.tif", read_geojson("farms.geojson"), zone_id="name")
+    Returns:
+        DataFrame with one row per zone and band: count, sum, mean, std, min, max (and histogram)
+    """
+    if not isfile(raster):
+        raise FileNotFoundError("Invalid Raster File")
+
+    with rasterio_open(raster) as src:
+        bands = list(bands or src.indexes)
+        ids, geometries = zone_geometries(zones, zone_id, zones_crs, src.crs)
+        tree = STRtree(geometries)
+
+        # Label 0 means "no zone"
+        size = len(geometries) + 1
+        accumulator = (len(bands), size)
+        count = zeros(accumulator, dtype="int64")
+        total = zeros(accumulator, dtype=float64)
+        squares = zeros(accumulator, dtype=float64)
+        lowest = full(accumulator, inf)
+        highest = full(accumulator, -inf)
+        if histogram is not None:
+            bins = len(histogram) - 1
+            frequencies = zeros((len(bands), size, bins), dtype="int64")
+
+        for window in block_windows(src.width, src.height, block_size):
+            with span(profiler, "rasterize"):
+                # The tree answers in its own order; burn the zones in input order
+                # so the last one wins the overlaps
+                touching = sort(tree.query(box(*window_bounds(window, src.transform))))
+                if not len(touching):
+                    continue
+                labels = rasterize(
+                    ((geometries[i], i + 1) for i in touching),
+                    out_shape=(window.height, window.width),
+                    transform=window_transform(window, src.transform),
+                    fill=0,
+                    all_touched=all_touched,
+                    dtype="int32",
+                )
+
+            with span(profiler, "read"):
+                data = src.read(bands, window=window, masked=True)
+                mask = getmaskarray(data)
+
+            with span(profiler, "reduce"):
+                for position in range(len(bands)):
+                    valid = (labels != 0) & ~mask[position]
+                    label = labels[valid]
+                    values = data.data[position][valid].astype(float64)
+
+                    count[position] += bincount(label, minlength=size)
+                    total[position] += bincount(label, values, minlength=size)
+                    squares[position] += bincount(label, values**2, minlength=size)
+                    minimum.at(lowest[position], label, values)
+                    maximum.at(highest[position], label, values)
+
+                    if histogram is not None:
+                        # Values out of the edges are not counted
+                        bin_ = digitize(values, histogram) - 1
+                        bin_[values == histogram[-1]] = bins - 1
+                        inside = (bin_ >= 0) & (bin_ < bins)
+                        frequencies[position] += bincount(
+                            label[inside] * bins + bin_[inside],
+                            minlength=size * bins,
+                        ).reshape(size, bins)
+
+    rows = list()
+    with errstate(divide="ignore", invalid="ignore"):
+        mean = total / count
+        std = sqrt(maximum(squares / count - mean**2, 0))
+
+    for position, band in enumerate(bands):
+        for label, id_ in enumerate(ids, start=1):
+            empty = count[position, label] == 0
+            row = {
+                "zone": id_,
+                "band": band,
+                "count": int(count[position, label]),
+                "sum": total[position, label],
+                "mean": mean[position, label],
+                "std": std[position, label],
+                "min": nan if empty else lowest[position, label],
+                "max": nan if empty else highest[position, label],
+            }
+            if histogram is not None:
+                row["histogram"] = frequencies[position, label].tolist()
+            rows.append(row)
+
+    return DataFrame(rows)
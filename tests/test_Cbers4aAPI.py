@@ -1,8 +1,34 @@
 # -*- coding: utf-8 -*-
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date
+from copy import deepcopy
+from hashlib import sha256
+from json import loads
 from os import remove
+from os.path import exists
+from subprocess import run
+import asyncio
+import sys
+from threading import Lock
+from time import sleep
 import pytest
 from cbers4asat import Cbers4aAPI, Collections as col
+from cbers4asat.cli import main as cli
+from cbers4asat.cbers4a import (
+    AdaptiveLimiter,
+    AssetStore,
+    AsyncSearch,
+    AsyncSearchItem,
+    CatalogWriter,
+    Download,
+    IntegrityError,
+    Monitor,
+    read_catalog,
+    RequestEvent,
+    Search,
+    SearchCache,
+    ThumbnailFetcher,
+)
 from shapely.geometry import Polygon
 from mocks import (
     MockStacFeatureCollectionResponse,
@@ -13,6 +39,34 @@ from mocks import (
 )
 
 
+class MockDownloadResponse:
+    def __init__(self, content=b"dummydata", headers=None, status_code=200):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        yield self.content
+
+    def close(self):
+        pass
+
+
+def png_bytes():
+    from numpy import ones
+    from rasterio.io import MemoryFile
+
+    with MemoryFile() as memfile:
+        with memfile.open(
+            driver="PNG", width=4, height=2, count=3, dtype="uint8"
+        ) as dataset:
+            dataset.write(ones((3, 2, 4), dtype="uint8"))
+        return memfile.read()
+
+
 class TestCbers4aAPI:
     api = Cbers4aAPI("test@test.com")
 
@@ -31,6 +85,23 @@ class TestCbers4aAPI:
         "features": [feature_with_bands],
     }
 
+    def test_import_is_lazy(self):
+        # Guards the import time: searching must not load the raster/vector stack
+        heavy = ["geopandas", "pandas", "shapely", "rasterio", "skimage", "geomet"]
+        result = run(
+            [
+                sys.executable,
+                "-c",
+                "import sys, cbers4asat, cbers4asat.tools; "
+                f"print([m for m in {heavy} if m in sys.modules])",
+            ],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+
+        assert result.stdout.strip() == "[]"
+
     def test_email(self):
         assert "test@test.com" in self.api.email
 
@@ -102,6 +173,132 @@ class TestCbers4aAPI:
 
         assert self.expected_result_from_query == result
 
+    def test_query_path_rows(self, monkeypatch):
+        bodies = list()
+
+        def mock_post(self, url, json):
+            bodies.append(json)
+            return MockStacFeatureCollectionResponse()
+
+        monkeypatch.setattr("requests.Session.post", mock_post)
+
+        arguments = dict(
+            initial_date=date(2021, 1, 1),
+            end_date=date(2021, 2, 1),
+            cloud=100,
+            limit=1,
+            collections=["CBERS4A_WPM_L4_DN"],
+        )
+
+        # Every path and row returns the same products
+        result = self.api.query_path_rows(
+            (range(206, 208), range(133, 135)), **arguments
+        )
+
+        assert self.expected_result_from_query == result
+        assert len(bodies) == 4
+        assert sorted(
+            (
+                body["providers"][0]["query"]["path"]["eq"],
+                body["providers"][0]["query"]["row"]["eq"],
+            )
+            for body in bodies
+        ) == [(206, 133), (206, 134), (207, 133), (207, 134)]
+
+        grouped = self.api.query_path_rows(
+            [(206, 133), (207, 133)], group=True, **arguments
+        )
+
+        assert list(grouped) == [(206, 133), (207, 133)]
+        assert grouped[(207, 133)] == self.expected_result_from_query
+
+        # A tuple of pairs is not read as ranges
+        bodies.clear()
+        self.api.query_path_rows(((206, 133), (207, 134)), **arguments)
+        assert sorted(
+            (
+                body["providers"][0]["query"]["path"]["eq"],
+                body["providers"][0]["query"]["row"]["eq"],
+            )
+            for body in bodies
+        ) == [(206, 133), (207, 134)]
+
+        with pytest.raises(Exception):
+            self.api.query_path_rows((range(206, 208), [133, 134]), **arguments)
+
+    def test_search_called_twice(self, monkeypatch):
+        bodies = list()
+
+        def mock_post(self, url, json):
+            bodies.append(json)
+            return MockStacFeatureCollectionResponse()
+
+        monkeypatch.setattr("requests.Session.post", mock_post)
+
+        search = Search()
+        search.path_row(206, 133)
+        search()
+        search()
+
+        assert bodies[0] == bodies[1]
+        assert len(bodies[1]["providers"]) == 1
+
+    def test_query_cache(self, monkeypatch, tmp_path):
+        calls = list()
+
+        def mock_post(*args, **kwargs):
+            calls.append(1)
+            sleep(0.1)
+            return MockStacFeatureCollectionResponse()
+
+        monkeypatch.setattr("requests.Session.post", mock_post)
+
+        arguments = dict(
+            location=(206, 133),
+            initial_date=date(2021, 1, 1),
+            end_date=date(2021, 2, 1),
+            cloud=100,
+            limit=1,
+            collections=["CBERS4A_WPM_L4_DN"],
+        )
+        cache = SearchCache(cache_dir=tmp_path.as_posix())
+
+        # Concurrent identical searches share one request
+        with ThreadPoolExecutor(max_workers=4) as t_pool:
+            results = list(
+                t_pool.map(lambda _: self.api.query(**arguments, cache=cache), range(4))
+            )
+
+        assert len(calls) == 1
+        assert all(result == self.expected_result_from_query for result in results)
+
+        # Results are copies, the cached one is kept intact
+        results[0]["features"].clear()
+        assert (
+            self.api.query(**arguments, cache=cache) == self.expected_result_from_query
+        )
+
+        # The disk cache survives a new cache object
+        assert (
+            self.api.query(
+                **arguments, cache=SearchCache(cache_dir=tmp_path.as_posix())
+            )
+            == self.expected_result_from_query
+        )
+        assert len(calls) == 1
+        assert not list(tmp_path.glob("*.tmp"))
+
+        # Searches reaching today expire sooner
+        assert (
+            cache.expiration({"datetime": "2021-01-01T00:00:00/2021-02-01T23:59:00"})
+            == cache.ttl
+        )
+        today = date.today().isoformat()
+        assert (
+            cache.expiration({"datetime": f"2021-01-01T00:00:00/{today}T23:59:00"})
+            == cache.recent_ttl
+        )
+
     def test_query_collections_with_enum(self, monkeypatch):
         def mock_post(*args, **kwargs):
             return MockStacFeatureCollectionResponse()
@@ -192,6 +389,34 @@ class TestCbers4aAPI:
         assert gdf.crs == "EPSG:4326"
         assert len(gdf) == 1
 
+    def test_download_gdf_with_assets(self, monkeypatch, tmp_path):
+        urls = list()
+
+        def mock_get(self, url, *args, **kwargs):
+            urls.append(url)
+            return MockStacFeatureResponse()
+
+        monkeypatch.setattr("requests.Session.get", mock_get)
+
+        other = deepcopy(feature_without_bands)
+        other["id"] = "DEF456"
+        gdf = self.api.to_geodataframe(
+            {"type": "FeatureCollection", "features": [feature_with_bands, other]},
+            with_assets=True,
+        )
+
+        assert gdf["blue"].iloc[0] == "http://test.dev/image.tif"
+        assert gdf["blue"].isna().iloc[1]
+        assert gdf["red"].isna().all()
+
+        # Both rows save the same file: one at a time, so none reuses the other
+        self.api.download(gdf, ["blue"], threads=1, outdir=tmp_path.as_posix())
+
+        # Only the row without the band href is searched again
+        lookups = [url for url in urls if "/items/" in url]
+        assert len(lookups) == 1 and lookups[0].endswith("/items/DEF456")
+        assert urls.count("http://test.dev/image.tif") == 2
+
     def test_missing_credentials_exception(self):
         with pytest.raises(Exception):
             api = Cbers4aAPI()
@@ -247,3 +472,613 @@ class TestCbers4aAPI:
             assert f.read() == b"dummydata"
 
         remove(f"{tmp_path.as_posix()}/ABC123/image.tif")
+
+    def test_download_checksum(self, monkeypatch, tmp_path):
+        def mock_get(*args, **kwargs):
+            return MockDownloadResponse(headers={"Content-Length": "9"})
+
+        monkeypatch.setattr("requests.Session.get", mock_get)
+
+        downloaded = Download().download(
+            "http://test.dev/image.tif", "test@test.com", tmp_path.as_posix()
+        )
+
+        assert downloaded.size == 9
+        assert downloaded.checksum == sha256(b"dummydata").hexdigest()
+
+    def test_download_segments(self, monkeypatch, tmp_path):
+        content = bytes(range(256)) * 40
+        ranges = list()
+
+        def mock_get(*args, **kwargs):
+            byte_range = kwargs.get("headers", {}).get("Range")
+            if byte_range is None:
+                return MockDownloadResponse(
+                    content,
+                    {"Content-Length": str(len(content)), "Accept-Ranges": "bytes"},
+                )
+            ranges.append(byte_range)
+            start, end = map(int, byte_range[len("bytes=") :].split("-"))
+            return MockDownloadResponse(content[start : end + 1], status_code=206)
+
+        monkeypatch.setattr("requests.Session.get", mock_get)
+
+        downloaded = Download(segments=4, segment_threshold=1024).download(
+            "http://test.dev/image.tif", "test@test.com", tmp_path.as_posix()
+        )
+
+        assert sorted(ranges) == [
+            "bytes=0-2559",
+            "bytes=2560-5119",
+            "bytes=5120-7679",
+            "bytes=7680-10239",
+        ]
+        assert downloaded.size == len(content)
+        assert downloaded.checksum == sha256(content).hexdigest()
+        assert open(downloaded.path, "rb").read() == content
+
+        # Small files are downloaded with a single request
+        ranges.clear()
+        downloaded = Download(segments=4, segment_threshold=len(content) + 1).download(
+            "http://test.dev/image.tif", "test@test.com", tmp_path.as_posix()
+        )
+
+        assert not ranges
+        assert downloaded.checksum == sha256(content).hexdigest()
+
+    def test_download_segments_ignored(self, monkeypatch, tmp_path):
+        content = bytes(range(256)) * 40
+        calls = list()
+
+        def mock_get(*args, **kwargs):
+            calls.append(kwargs.get("headers", {}).get("Range"))
+            return MockDownloadResponse(
+                content,
+                {"Content-Length": str(len(content)), "Accept-Ranges": "bytes"},
+            )
+
+        monkeypatch.setattr("requests.Session.get", mock_get)
+
+        # The server advertises ranges but always answers the whole file
+        downloaded = Download(segments=4, segment_threshold=1024, attempts=1).download(
+            "http://test.dev/image.tif", "test@test.com", tmp_path.as_posix()
+        )
+
+        assert calls[0] is None and calls[-1] is None
+        assert downloaded.checksum == sha256(content).hexdigest()
+        assert open(downloaded.path, "rb").read() == content
+
+    def test_download_segments_abort(self, monkeypatch, tmp_path):
+        content = bytes(range(256)) * 40
+        served = list()
+
+        class SlowResponse(MockDownloadResponse):
+            def iter_content(self, chunk_size):
+                for i in range(0, len(self.content), 64):
+                    served.append(1)
+                    sleep(0.01)
+                    yield self.content[i : i + 64]
+
+        def mock_get(*args, **kwargs):
+            byte_range = kwargs.get("headers", {}).get("Range")
+            if byte_range is None:
+                return MockDownloadResponse(
+                    content,
+                    {"Content-Length": str(len(content)), "Accept-Ranges": "bytes"},
+                )
+            start, end = map(int, byte_range[len("bytes=") :].split("-"))
+            if start == 0:
+                return MockDownloadResponse(content, status_code=206)
+            return SlowResponse(content[start : end + 1], status_code=206)
+
+        monkeypatch.setattr("requests.Session.get", mock_get)
+
+        with pytest.raises(IntegrityError):
+            Download(segments=4, segment_threshold=1024, attempts=1).download(
+                "http://test.dev/image.tif", "test@test.com", tmp_path.as_posix()
+            )
+
+        # The other segments stopped on the first failure instead of finishing
+        assert len(served) < 3 * 2560 // 64
+        assert not list(tmp_path.iterdir())
+
+    def test_download_shared_outdir(self, monkeypatch, tmp_path):
+        calls = list()
+
+        def mock_get(*args, **kwargs):
+            calls.append(1)
+            sleep(0.2)
+            return MockDownloadResponse(headers={"Content-Length": "9"})
+
+        monkeypatch.setattr("requests.Session.get", mock_get)
+
+        # Each worker has its own downloader, like separate processes
+        with ThreadPoolExecutor(max_workers=4) as t_pool:
+            downloaded = list(
+                t_pool.map(
+                    lambda _: Download().download(
+                        "http://test.dev/image.tif",
+                        "test@test.com",
+                        tmp_path.as_posix(),
+                    ),
+                    range(4),
+                )
+            )
+
+        assert len(calls) == 1
+        assert {d.checksum for d in downloaded} == {sha256(b"dummydata").hexdigest()}
+        assert sorted(p.name for p in tmp_path.iterdir()) == ["image.tif"]
+
+        # A later request downloads again
+        Download().download(
+            "http://test.dev/image.tif", "test@test.com", tmp_path.as_posix()
+        )
+        assert len(calls) == 2
+
+    def test_adaptive_limiter(self, monkeypatch, tmp_path):
+        limiter = AdaptiveLimiter(initial=2, max_limit=3)
+        running, peak, statuses = [0], [0], [200] * 12 + [503] * 4
+        lock = Lock()
+
+        def mock_get(*args, **kwargs):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            sleep(0.05)
+            with lock:
+                running[0] -= 1
+                return MockDownloadResponse(status_code=statuses.pop(0))
+
+        monkeypatch.setattr("requests.Session.get", mock_get)
+
+        def download(position):
+            Download(attempts=1, limiter=limiter).download(
+                f"http://test.dev/image{position}.tif",
+                "test@test.com",
+                tmp_path.as_posix(),
+            )
+
+        # Successful requests using the whole limit raise it up to max_limit
+        with ThreadPoolExecutor(max_workers=8) as t_pool:
+            list(t_pool.map(download, range(12)))
+
+        assert peak[0] <= 3
+        assert limiter.limit == 3
+
+        # Overloaded server: the limit is cut
+        with ThreadPoolExecutor(max_workers=8) as t_pool:
+            list(t_pool.map(download, range(12, 16)))
+
+        assert limiter.limit == 1
+        assert limiter.in_flight == 0
+
+    def test_monitor_excludes_limiter_wait(self, monkeypatch, tmp_path):
+        def mock_post(*args, **kwargs):
+            sleep(0.2)
+            return MockStacFeatureCollectionResponse()
+
+        def mock_get(*args, **kwargs):
+            sleep(0.2)
+            return MockDownloadResponse(headers={"Content-Length": "9"})
+
+        monkeypatch.setattr("requests.Session.post", mock_post)
+        monkeypatch.setattr("requests.Session.get", mock_get)
+
+        events = list()
+        monitor = Monitor([events.append])
+        limiter = AdaptiveLimiter(initial=1, max_limit=1)
+        downloader = Download(monitor=monitor, limiter=limiter)
+
+        def request(position):
+            if position % 2:
+                downloader.download(
+                    f"http://test.dev/image{position}.tif",
+                    "test@test.com",
+                    tmp_path.as_posix(),
+                )
+            else:
+                Cbers4aAPI.query(
+                    location=(206, 133),
+                    initial_date=date(2021, 1, 1),
+                    end_date=date(2021, 2, 1),
+                    cloud=100,
+                    limit=1,
+                    collections=["CBERS4A_WPM_L4_DN"],
+                    monitor=monitor,
+                    limiter=limiter,
+                )
+
+        # The requests run one at a time: each waits up to 0.6 s for the limiter
+        with ThreadPoolExecutor(max_workers=4) as t_pool:
+            list(t_pool.map(request, range(4)))
+
+        latencies = [e.elapsed for e in events if isinstance(e, RequestEvent)]
+        assert len(latencies) == 4
+        assert all(0.2 <= latency < 0.35 for latency in latencies)
+        assert monitor.stats()["search"]["p95"] < 0.35
+
+    def test_async_search(self):
+        web = pytest.importorskip("aiohttp.web")
+        from cbers4asat.cbers4a import close_shared_session
+
+        feature = deepcopy(feature_with_bands)
+        peers, bodies = set(), list()
+
+        async def search(request):
+            peers.add(request.transport.get_extra_info("peername"))
+            bodies.append(await request.json())
+            await asyncio.sleep(0.01)
+            return web.json_response(
+                {"LGI-CDSR": {col.CBERS4A_WPM_L4_DN.value: {"features": [feature]}}}
+            )
+
+        async def item(request):
+            peers.add(request.transport.get_extra_info("peername"))
+            if request.match_info["id"] != feature["id"]:
+                raise web.HTTPNotFound()
+            return web.json_response(feature)
+
+        async def main():
+            app = web.Application()
+            app.router.add_post("/search", search)
+            app.router.add_get("/collections/{collection}/items/{id}", item)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, "127.0.0.1", 0)
+            await site.start()
+            url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+
+            def new_search(path):
+                search = AsyncSearch()
+                search.BASE_URL_SEARCH = f"{url}/search"
+                search.path_row(*path)
+                search.cloud_cover(50)
+                search.collections([col.CBERS4A_WPM_L4_DN])
+                return search()
+
+            def new_item_search(ids):
+                search = AsyncSearchItem()
+                search.BASE_URL_SEARCH_ITEM = f"{url}/collections"
+                search.ids(ids, col.CBERS4A_WPM_L4_DN)
+                return search()
+
+            try:
+                results = await asyncio.gather(
+                    *(new_search((path, 110)) for path in range(1, 201))
+                )
+                items = await new_item_search([feature["id"]] * 3)
+                with pytest.raises(Exception):
+                    await new_item_search(["missing"])
+            finally:
+                await close_shared_session()
+                await runner.cleanup()
+            return results, items
+
+        results, items = asyncio.run(main())
+
+        assert all(result["features"] == [feature] for result in results)
+        assert len(items["features"]) == 3
+        assert bodies[0]["providers"][0]["query"]["cloud_cover"] == {"lte": 50}
+        assert (
+            len({body["providers"][0]["query"]["path"]["eq"] for body in bodies}) == 200
+        )
+        # Hundreds of searches multiplexed on the connections of the shared session
+        assert len(peers) <= 8
+
+    def test_download_truncated_retry(self, monkeypatch, tmp_path):
+        calls = list()
+
+        def mock_get(*args, **kwargs):
+            calls.append(1)
+            return MockDownloadResponse(headers={"Content-Length": "1024"})
+
+        monkeypatch.setattr("requests.Session.get", mock_get)
+
+        with pytest.raises(IntegrityError):
+            Download(attempts=2).download(
+                "http://test.dev/image.tif", "test@test.com", tmp_path.as_posix()
+            )
+
+        assert len(calls) == 2
+        assert not exists(f"{tmp_path.as_posix()}/image.tif")
+
+    def test_download_html_error_page(self, monkeypatch, tmp_path):
+        def mock_get(*args, **kwargs):
+            return MockDownloadResponse(
+                b"<html></html>", {"Content-Type": "text/html; charset=utf-8"}
+            )
+
+        monkeypatch.setattr("requests.Session.get", mock_get)
+
+        with pytest.raises(IntegrityError):
+            Download(attempts=1).download(
+                "http://test.dev/image.tif", "test@test.com", tmp_path.as_posix()
+            )
+
+    def test_download_verify_geotiff(self, monkeypatch, tmp_path):
+        def mock_get(*args, **kwargs):
+            return MockStacFeatureResponse()
+
+        monkeypatch.setattr("requests.Session.get", mock_get)
+
+        with pytest.raises(IntegrityError):
+            Download(verify_geotiff=True, attempts=1).download(
+                "http://test.dev/image.tif", "test@test.com", tmp_path.as_posix()
+            )
+
+    def test_download_store(self, monkeypatch, tmp_path):
+        calls = list()
+
+        def mock_get(*args, **kwargs):
+            calls.append(args)
+            return MockStacFeatureResponse()
+
+        monkeypatch.setattr("requests.Session.get", mock_get)
+
+        store = AssetStore((tmp_path / "store").as_posix())
+
+        for outdir in ("job1", "job2"):
+            (tmp_path / outdir).mkdir()
+            self.api.download(
+                products=self.expected_result_from_query,
+                bands=["blue"],
+                threads=1,
+                outdir=(tmp_path / outdir).as_posix(),
+                store=store,
+            )
+
+        # Two assets lookups and a single asset download
+        assert len(calls) == 3
+        assert "y/ABC123/image.tif" in store
+        assert store.size == len(b"dummydata")
+
+        for outdir in ("job1", "job2"):
+            with open(tmp_path / outdir / "image.tif", "rb") as f:
+                assert f.read() == b"dummydata"
+
+    def test_store_object_evicted_before_placing(self, monkeypatch, tmp_path):
+        import cbers4asat.cbers4a.store as store_module
+
+        calls, writes = list(), list()
+
+        def mock_get(*args, **kwargs):
+            calls.append(args)
+            return MockDownloadResponse()
+
+        monkeypatch.setattr("requests.Session.get", mock_get)
+
+        store = AssetStore((tmp_path / "store").as_posix())
+        url = "http://test.dev/A/image.tif"
+        store.download(url, "test@test.com", (tmp_path / "a").as_posix(), "y", "A")
+
+        # Cache hits do not rewrite the manifest
+        dump = store_module.json_dump
+        monkeypatch.setattr(
+            store_module, "json_dump", lambda *a: writes.append(1) or dump(*a)
+        )
+        store.download(url, "test@test.com", (tmp_path / "b").as_posix(), "y", "A")
+        assert not writes and len(calls) == 1
+
+        # Another process evicts the content after the lookup
+        link = store_module.link
+
+        def evicted_link(source, outfile):
+            monkeypatch.setattr(store_module, "link", link)
+            remove(source)
+            return link(source, outfile)
+
+        monkeypatch.setattr(store_module, "link", evicted_link)
+        store.download(url, "test@test.com", (tmp_path / "c").as_posix(), "y", "A")
+
+        assert len(calls) == 2
+        assert (tmp_path / "c" / "image.tif").read_bytes() == b"dummydata"
+        assert "y/A/image.tif" in store
+
+    def test_store_eviction(self, monkeypatch, tmp_path):
+        def mock_get(*args, **kwargs):
+            return MockDownloadResponse(content=bytes(args[1], "utf-8"))
+
+        monkeypatch.setattr("requests.Session.get", mock_get)
+
+        store = AssetStore((tmp_path / "store").as_posix(), max_size=40)
+
+        for scene in ("A", "B", "C"):
+            store.download(
+                f"http://test.dev/{scene}/image_{scene}_0123456789.tif",
+                "test@test.com",
+                tmp_path.as_posix(),
+                "y",
+                scene,
+            )
+
+        assert "y/A/image_A_0123456789.tif" not in store
+        assert "y/C/image_C_0123456789.tif" in store
+        assert store.size <= 40
+
+    def test_download_monitor(self, monkeypatch, tmp_path):
+        def mock_get(*args, **kwargs):
+            return MockStacFeatureResponse()
+
+        monkeypatch.setattr("requests.Session.get", mock_get)
+
+        events = list()
+        monitor = Monitor([events.append])
+
+        Cbers4aAPI("test@test.com", monitor=monitor).download(
+            products=self.expected_result_from_query,
+            bands=["blue"],
+            threads=1,
+            outdir=tmp_path.as_posix(),
+        )
+
+        requests = [event for event in events if isinstance(event, RequestEvent)]
+        assert [event.endpoint for event in requests] == ["item", "download"]
+        assert requests[1].status == 200
+        assert requests[1].bytes == len(b"dummydata")
+
+        stats = monitor.stats()
+        assert stats["download"]["requests"] == 1
+        assert stats["download"]["errors"] == 0
+        assert stats["download"]["p95"] >= stats["download"]["p50"] >= 0
+
+    def test_monitor_records_errors(self, monkeypatch, tmp_path):
+        def mock_get(*args, **kwargs):
+            return MockDownloadResponse(headers={"Content-Length": "1024"})
+
+        monkeypatch.setattr("requests.Session.get", mock_get)
+
+        monitor = Monitor()
+
+        with pytest.raises(IntegrityError):
+            Download(attempts=2, monitor=monitor).download(
+                "http://test.dev/image.tif", "test@test.com", tmp_path.as_posix()
+            )
+
+        assert monitor.stats()["download"]["requests"] == 2
+        assert monitor.stats()["download"]["errors"] == 2
+
+    def test_prometheus_exporter(self):
+        prometheus_client = pytest.importorskip("prometheus_client")
+        from cbers4asat.cbers4a import PrometheusExporter
+
+        registry = prometheus_client.CollectorRegistry()
+        monitor = Monitor()
+        PrometheusExporter(monitor, registry=registry)
+
+        monitor.emit(RequestEvent("search", "http://test.dev", 200, 10, 0.1))
+
+        assert (
+            registry.get_sample_value(
+                "cbers4asat_requests_total", {"endpoint": "search", "status": "200"}
+            )
+            == 1
+        )
+
+    def test_thumbnails(self, monkeypatch, tmp_path):
+        calls = list()
+
+        def mock_get(*args, **kwargs):
+            calls.append(args[1])
+            return MockDownloadResponse(content=b"thumbnail")
+
+        monkeypatch.setattr("requests.Session.get", mock_get)
+
+        gdf = self.api.to_geodataframe(self.expected_result_from_query)
+
+        with ThumbnailFetcher(cache_dir=tmp_path.as_posix()) as fetcher:
+            assert fetcher.fetch(self.expected_result_from_query) == {
+                "ABC123": b"thumbnail"
+            }
+            assert fetcher.fetch(gdf) == {"ABC123": b"thumbnail"}
+
+        # Disk cache survives the fetcher
+        with ThumbnailFetcher(cache_dir=tmp_path.as_posix()) as fetcher:
+            assert fetcher.fetch(gdf) == {"ABC123": b"thumbnail"}
+
+        assert calls == ["http://a.b/t.png"]
+        assert not list(tmp_path.glob("*.tmp"))
+
+    def test_thumbnails_decode(self, monkeypatch):
+        def mock_get(*args, **kwargs):
+            return MockDownloadResponse(content=png_bytes())
+
+        monkeypatch.setattr("requests.Session.get", mock_get)
+
+        with ThumbnailFetcher() as fetcher:
+            images = fetcher.fetch(self.expected_result_from_query, decode=True)
+
+        assert images["ABC123"].shape == (3, 2, 4)
+
+    def test_cli_manifest_resume(self, monkeypatch, tmp_path, capsys):
+        calls = list()
+
+        def mock_post(*args, **kwargs):
+            calls.append("search")
+            return MockStacFeatureCollectionResponse()
+
+        def mock_get(*args, **kwargs):
+            calls.append("download")
+            return MockStacFeatureResponse()
+
+        monkeypatch.setattr("requests.Session.post", mock_post)
+        monkeypatch.setattr("requests.Session.get", mock_get)
+
+        manifest = tmp_path / "manifest.csv"
+        manifest.write_text(
+            "id,collections,start,end,path,row,bbox,bands\n"
+            "tile,CBERS4A_WPM_L4_DN,2021-01-01,2021-02-01,206,133,,blue\n"
+            "area,CBERS4A_WPM_L4_DN,2021-01-01,2021-02-01,,,-64.0;-9.0;-63.0;-8.0,blue\n"
+        )
+        arguments = [
+            "run",
+            manifest.as_posix(),
+            "--email",
+            "test@test.com",
+            "--outdir",
+            (tmp_path / "out").as_posix(),
+            "--stages",
+            "search,download",
+            "--jobs",
+            "2",
+        ]
+
+        assert cli(arguments) == 0
+        assert exists(f"{tmp_path.as_posix()}/out/tile/ABC123/image.tif")
+        assert exists(f"{tmp_path.as_posix()}/out/area/ABC123/image.tif")
+
+        events = [loads(line) for line in capsys.readouterr().out.splitlines()]
+        done = {(e["job"], e["stage"]) for e in events if e["status"] == "done"}
+        assert done == {
+            ("tile", "search"),
+            ("tile", "download"),
+            ("area", "search"),
+            ("area", "download"),
+        }
+
+        # Resuming does not repeat completed stages
+        calls.clear()
+        assert cli(arguments + ["--resume"]) == 0
+        assert calls == []
+        assert capsys.readouterr().out == ""
+
+    @pytest.mark.parametrize("extension", ["parquet", "arrow"])
+    def test_catalog_round_trip_download(self, monkeypatch, tmp_path, extension):
+        pytest.importorskip("pyarrow")
+        urls = list()
+
+        def mock_get(self, url, *args, **kwargs):
+            urls.append(url)
+            return MockStacFeatureResponse()
+
+        monkeypatch.setattr("requests.Session.get", mock_get)
+
+        other = deepcopy(feature_with_bands)
+        other["id"] = "DEF456"
+        path = f"{tmp_path.as_posix()}/catalog.{extension}"
+
+        # Written incrementally, one search result at a time
+        with CatalogWriter(path) as writer:
+            writer.write(
+                {"type": "FeatureCollection", "features": [feature_with_bands]}
+            )
+            writer.write({"type": "FeatureCollection", "features": []})
+            writer.write({"type": "FeatureCollection", "features": [other]})
+
+        products = read_catalog(path)
+
+        assert products == {
+            "type": "FeatureCollection",
+            "features": [feature_with_bands, other],
+        }
+
+        if extension == "parquet":
+            from geopandas import read_parquet
+
+            gdf = read_parquet(path)
+            assert gdf.crs == "EPSG:4326" or gdf.crs == "OGC:CRS84"
+            assert list(gdf["blue_href"]) == ["http://test.dev/image.tif"] * 2
+
+        self.api.download(products, ["blue"], threads=1, outdir=tmp_path.as_posix())
+
+        # Assets came from the catalog: no item lookups
+        assert urls == ["http://test.dev/image.tif"] * 2
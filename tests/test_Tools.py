@@ -1,15 +1,36 @@
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
 from os import remove
 from pathlib import Path
+from shutil import copyfile
+from time import sleep
+from zipfile import ZipFile
 import pytest
 from cbers4asat.tools import (
     rgbn_composite,
     grid_download,
+    grid_lookup,
     pansharpening,
     clip,
     read_geojson,
+    Profiler,
+    mosaic,
+    spectral_indices,
+    batch_process,
+    preview,
+    reproject,
+    temporal_stack,
+    temporal_reduce,
+    open_stack,
+    zonal_stats,
+    select_scenes,
 )
+from numpy import allclose, array_equal, float32, isnan, stack, zeros
 from rasterio import open as rasterio_open
-from shapely.geometry import Polygon
+from rasterio.warp import transform_geom
+from rasterio.windows import Window, bounds as rasterio_window_bounds
+from shapely.geometry import Polygon, box, mapping
+from mocks import feature_with_bands
 from fixtures import (
     rgb_assert_metadata,
     pansharp_assert_metadata,
@@ -22,15 +43,35 @@ FIXTURE_DIR = Path(__file__).parent.resolve() / "data"
 
 
 class MockResponse:
-    def __init__(self):
+    def __init__(self, content=b"dummydata"):
         self.status_code = 200
+        self.content = content
 
     def raise_for_status(self):
         pass
 
-    @staticmethod
-    def iter_content(chunk_size):
-        yield b"dummydata"
+    def iter_content(self, chunk_size):
+        yield self.content
+
+
+def split_raster(raster, outdir, windows):
+    """
+    Save each window of the raster as a new file, like adjacent scenes.
+    """
+    paths = list()
+    with rasterio_open(raster) as src:
+        for index, window in enumerate(windows):
+            metadata = src.meta.copy()
+            metadata.update(
+                width=window.width,
+                height=window.height,
+                transform=src.window_transform(window),
+            )
+            path = f"{outdir}/SCENE{index}.tif"
+            with rasterio_open(path, "w", **metadata) as dst:
+                dst.write(src.read(window=window))
+            paths.append(path)
+    return paths
 
 
 class TestTools:
@@ -135,3 +176,497 @@ class TestTools:
             assert raster.meta == crop_assert_metadata
 
         remove(f"{tmp_path.as_posix()}/raster_clip.tif")
+
+    @pytest.mark.datafiles(
+        FIXTURE_DIR / "MULTISPECTRAL.tif",
+        FIXTURE_DIR / "BAND0.tif",
+        on_duplicate="ignore",
+    )
+    def test_pansharp_profiler(self, tmp_path, datafiles):
+        spans = list()
+        profiler = Profiler(hook=spans.append, memory=True)
+
+        pansharpening(
+            panchromatic=f"{datafiles}/BAND0.tif",
+            multispectral=f"{datafiles}/MULTISPECTRAL.tif",
+            outdir=tmp_path.as_posix(),
+            profiler=profiler,
+        )
+
+        report = profiler.report()
+
+        assert [record["name"] for record in report] == [
+            "read",
+            "rgb2hsv",
+            "resize",
+            "hsv2rgb",
+            "write",
+        ]
+        assert report[0]["calls"] == 2
+        assert all(record["seconds"] >= 0 for record in report)
+        assert all(record["peak_memory"] > 0 for record in report)
+        assert len(spans) == 6
+
+        remove(f"{tmp_path.as_posix()}/pansharp.tif")
+
+    @pytest.mark.datafiles(FIXTURE_DIR / "BAND3.tif", on_duplicate="ignore")
+    def test_mosaic(self, tmp_path, datafiles):
+        scenes = split_raster(
+            f"{datafiles}/BAND3.tif",
+            tmp_path.as_posix(),
+            [Window(0, 0, 500, 610), Window(400, 100, 402, 510)],
+        )
+
+        mosaic(
+            scenes,
+            outdir=tmp_path.as_posix(),
+            method="least-cloud",
+            cloud_cover=[30, 10],
+            block_size=128,
+        )
+
+        with (
+            rasterio_open(f"{datafiles}/BAND3.tif") as original,
+            rasterio_open(f"{tmp_path.as_posix()}/mosaic.tif") as result,
+        ):
+            assert result.transform == original.transform
+            assert result.shape == original.shape
+            expected = original.read(1)
+            expected[:100, 500:] = 0  # Not covered by any scene
+            assert array_equal(result.read(1), expected)
+
+        remove(f"{tmp_path.as_posix()}/mosaic.tif")
+
+    @pytest.mark.datafiles(FIXTURE_DIR / "BAND3.tif", on_duplicate="ignore")
+    def test_mosaic_invalid(self, tmp_path, datafiles):
+        with pytest.raises(ValueError):
+            mosaic([f"{datafiles}/BAND3.tif"], method="least-cloud")
+
+    def test_tool_modules_do_not_shadow_tools(self):
+        import cbers4asat.tools as tools
+        import cbers4asat.tools.mosaics
+        import cbers4asat.tools.previews
+        import cbers4asat.tools.warp
+
+        assert tools.mosaic is mosaic
+        assert tools.preview is preview
+        assert tools.reproject is reproject
+
+    @pytest.mark.datafiles(
+        FIXTURE_DIR / "BAND1.tif",
+        FIXTURE_DIR / "BAND2.tif",
+        FIXTURE_DIR / "BAND3.tif",
+        on_duplicate="ignore",
+    )
+    def test_spectral_indices(self, tmp_path, datafiles):
+        spectral_indices(
+            red=f"{datafiles}/BAND3.tif",
+            green=f"{datafiles}/BAND2.tif",
+            nir=f"{datafiles}/BAND1.tif",
+            indices=["ndvi", "ndwi"],
+            outdir=tmp_path.as_posix(),
+            block_size=100,
+        )
+
+        with (
+            rasterio_open(f"{datafiles}/BAND3.tif") as red,
+            rasterio_open(f"{datafiles}/BAND2.tif") as green,
+            rasterio_open(f"{datafiles}/BAND1.tif") as nir,
+        ):
+            r = red.read(1).astype(float32)
+            g = green.read(1).astype(float32)
+            n = nir.read(1).astype(float32)
+
+        with rasterio_open(f"{tmp_path.as_posix()}/indices.tif") as raster:
+            assert raster.count == 2
+            assert raster.descriptions == ("NDVI", "NDWI")
+            ndvi, ndwi = raster.read()
+
+        valid = (r != 0) & (g != 0) & (n != 0)
+        assert allclose(ndvi[valid], ((n - r) / (n + r))[valid])
+        assert allclose(ndwi[valid], ((g - n) / (g + n))[valid])
+        assert isnan(ndvi[~valid]).all()
+
+        remove(f"{tmp_path.as_posix()}/indices.tif")
+
+    def test_spectral_indices_missing_band(self, tmp_path):
+        with pytest.raises(FileNotFoundError):
+            spectral_indices(red="BAND3.tif", indices=["evi"])
+
+    def test_available_memory_without_sysconf(self, monkeypatch):
+        from cbers4asat.tools.batch import available_memory
+
+        # Windows has no os.sysconf
+        monkeypatch.delattr("os.sysconf")
+        assert available_memory() == 2**32
+
+    @pytest.mark.datafiles(
+        FIXTURE_DIR / "BAND1.tif",
+        FIXTURE_DIR / "BAND2.tif",
+        FIXTURE_DIR / "BAND3.tif",
+        on_duplicate="ignore",
+    )
+    def test_batch_process(self, rgb_assert_metadata, tmp_path, datafiles):
+        downloads = tmp_path / "downloads"
+        for scene, bands in (("SCENE_A", (1, 2, 3)), ("SCENE_B", (1, 2))):
+            (downloads / scene).mkdir(parents=True)
+            for band in bands:
+                copyfile(
+                    f"{datafiles}/BAND{band}.tif",
+                    downloads
+                    / scene
+                    / f"CBERS_4A_WPM_20210101_206_133_L4_BAND{band}.tif",
+                )
+
+        results = batch_process(
+            downloads.as_posix(),
+            "composite",
+            outdir=(tmp_path / "output").as_posix(),
+            workers=2,
+        )
+
+        assert [result["scene"] for result in results] == ["SCENE_A", "SCENE_B"]
+        assert results[0]["error"] is None
+        assert results[1]["error"].startswith("KeyError")
+
+        with rasterio_open(results[0]["outputs"][0]) as raster:
+            assert rgb_assert_metadata == raster.meta
+
+    @pytest.mark.datafiles(
+        FIXTURE_DIR / "BAND1.tif",
+        FIXTURE_DIR / "BAND2.tif",
+        FIXTURE_DIR / "BAND3.tif",
+        on_duplicate="ignore",
+    )
+    def test_overviews_preview(self, tmp_path, datafiles):
+        rgbn_composite(
+            red=f"{datafiles}/BAND3.tif",
+            green=f"{datafiles}/BAND2.tif",
+            blue=f"{datafiles}/BAND1.tif",
+            outdir=tmp_path.as_posix(),
+            overviews=[2, 4],
+        )
+
+        with rasterio_open(f"{tmp_path.as_posix()}/rgbn_composite.tif") as raster:
+            assert raster.overviews(1) == [2, 4]
+
+        array = preview(
+            f"{tmp_path.as_posix()}/rgbn_composite.tif",
+            max_size=200,
+            outfile=f"{tmp_path.as_posix()}/preview.png",
+        )
+
+        assert array.shape == (3, 122, 161)
+
+        with rasterio_open(f"{tmp_path.as_posix()}/preview.png") as png:
+            assert png.count == 3
+            assert png.dtypes[0] == "uint8"
+            assert (png.height, png.width) == (122, 161)
+
+    @pytest.mark.datafiles(FIXTURE_DIR / "BAND3.tif", on_duplicate="ignore")
+    def test_reproject(self, tmp_path, datafiles):
+        reproject(
+            f"{datafiles}/BAND3.tif",
+            "EPSG:31980",
+            outdir=tmp_path.as_posix(),
+            resolution=10,
+            snap=True,
+            block_size=128,
+        )
+
+        with rasterio_open(f"{tmp_path.as_posix()}/reprojected.tif") as raster:
+            assert raster.crs == "EPSG:31980"
+            assert raster.res == (10, 10)
+            assert raster.transform.c % 10 == 0
+            assert raster.transform.f % 10 == 0
+            assert raster.read(1).any()
+
+        remove(f"{tmp_path.as_posix()}/reprojected.tif")
+
+    @pytest.mark.datafiles(
+        FIXTURE_DIR / "BAND3.tif",
+        FIXTURE_DIR / "CLIP.tif",
+        on_duplicate="ignore",
+    )
+    def test_crop_geojson_wgs84(self, crop_assert_metadata, tmp_path, datafiles):
+        geometry = transform_geom(
+            "EPSG:32720",
+            "EPSG:4326",
+            mapping(box(808075.9, 8605496.9, 811660.1, 8607398.8)),
+        )
+
+        clip(
+            f"{datafiles}/BAND3.tif",
+            {"type": "Feature", "geometry": geometry, "properties": {}},
+            outdir=tmp_path.as_posix(),
+        )
+
+        with rasterio_open(f"{tmp_path.as_posix()}/raster_clip.tif") as raster:
+            assert raster.crs == crop_assert_metadata["crs"]
+            assert abs(raster.width - crop_assert_metadata["width"]) <= 1
+            assert abs(raster.height - crop_assert_metadata["height"]) <= 1
+
+        remove(f"{tmp_path.as_posix()}/raster_clip.tif")
+
+    @pytest.mark.datafiles(
+        FIXTURE_DIR / "BAND1.tif",
+        FIXTURE_DIR / "BAND2.tif",
+        FIXTURE_DIR / "BAND3.tif",
+        on_duplicate="ignore",
+    )
+    def test_rgbn_composite_cloud_mask(self, tmp_path, datafiles):
+        with rasterio_open(f"{datafiles}/BAND1.tif") as band:
+            metadata = band.meta.copy()
+            metadata.update(dtype="uint8", nodata=None)
+            mask = zeros(band.shape, dtype="uint8")
+            mask[:50, :50] = 1
+
+        with rasterio_open(f"{tmp_path.as_posix()}/MASK.tif", "w", **metadata) as dst:
+            dst.write(mask, 1)
+
+        rgbn_composite(
+            red=f"{datafiles}/BAND3.tif",
+            green=f"{datafiles}/BAND2.tif",
+            blue=f"{datafiles}/BAND1.tif",
+            outdir=tmp_path.as_posix(),
+            cloud_mask=f"{tmp_path.as_posix()}/MASK.tif",
+            cloud_threshold=300,
+            block_size=128,
+        )
+
+        with (
+            rasterio_open(f"{datafiles}/BAND3.tif") as red,
+            rasterio_open(f"{datafiles}/BAND2.tif") as green,
+            rasterio_open(f"{datafiles}/BAND1.tif") as blue,
+        ):
+            original = stack([red.read(1), green.read(1), blue.read(1)])
+
+        with rasterio_open(f"{tmp_path.as_posix()}/rgbn_composite.tif") as raster:
+            result = raster.read()
+
+        bright = (original >= 300).all(axis=0)
+        masked = bright | (mask != 0)
+        assert bright.any()
+        assert (result[:, masked] == 0).all()
+        assert array_equal(result[:, ~masked], original[:, ~masked])
+
+    @pytest.mark.datafiles(
+        FIXTURE_DIR / "BAND1.tif",
+        FIXTURE_DIR / "BAND2.tif",
+        FIXTURE_DIR / "BAND3.tif",
+        on_duplicate="ignore",
+    )
+    def test_temporal_stack(self, tmp_path, datafiles):
+        scenes = tmp_path / "scenes"
+        for date in ("20220105", "20211228"):
+            folder = scenes / f"CBERS4A_WPM209129{date}"
+            folder.mkdir(parents=True)
+            for band in (1, 3):
+                copyfile(
+                    f"{datafiles}/BAND{band}.tif",
+                    folder / f"CBERS_4A_WPM_{date}_209_129_L4_BAND{band}.tif",
+                )
+
+        # The second acquisition has no data in the left half
+        path = (
+            scenes
+            / "CBERS4A_WPM20912920220105"
+            / "CBERS_4A_WPM_20220105_209_129_L4_BAND3.tif"
+        )
+        with rasterio_open(path, "r+") as raster:
+            data = raster.read(1)
+            data[:, :401] = 0
+            raster.write(data, 1)
+
+        cube = temporal_stack(
+            scenes.as_posix(),
+            tmp_path.as_posix(),
+            bands=["red", "blue"],
+            block_size=128,
+        )
+        array, metadata = open_stack(cube)
+
+        with rasterio_open(f"{datafiles}/BAND3.tif") as red:
+            original = red.read(1)
+            assert metadata["transform"] == red.transform
+
+        assert array.shape == (2, 2, 610, 802)
+        assert metadata["times"] == ["2021-12-28", "2022-01-05"]
+        assert array_equal(array[0, 0], original)
+        assert array_equal(array[1, 0], data)
+
+        temporal_reduce(cube, tmp_path.as_posix(), block_size=128)
+
+        with rasterio_open(f"{tmp_path.as_posix()}/reduced.tif") as raster:
+            assert raster.count == 2
+            assert raster.descriptions == ("RED", "BLUE")
+            # Median ignores the acquisition without data
+            assert array_equal(raster.read(1), original)
+
+        with pytest.raises(ValueError):
+            temporal_reduce(cube, tmp_path.as_posix(), method="max-ndvi")
+
+    @pytest.mark.datafiles(FIXTURE_DIR / "BAND3.tif", on_duplicate="ignore")
+    def test_zonal_stats(self, tmp_path, datafiles):
+        with rasterio_open(f"{datafiles}/BAND3.tif") as raster:
+            data = raster.read(1).astype("float64")
+            transform = raster.transform
+            crs = raster.crs
+
+        windows = {"a": Window(10, 20, 100, 50), "b": Window(300, 200, 250, 300)}
+        zones = {
+            "type": "FeatureCollection",
+            "crs": {"type": "name", "properties": {"name": crs.to_string()}},
+            "features": [
+                {
+                    "type": "Feature",
+                    "properties": {"name": name},
+                    "geometry": mapping(
+                        box(*rasterio_window_bounds(window, transform))
+                    ),
+                }
+                for name, window in windows.items()
+            ],
+        }
+
+        stats = zonal_stats(
+            f"{datafiles}/BAND3.tif",
+            zones,
+            zone_id="name",
+            histogram=[0, 200, 400, 1000],
+            block_size=128,
+        )
+
+        assert list(stats["zone"]) == ["a", "b"]
+        for name, window in windows.items():
+            row = stats[stats["zone"] == name].iloc[0]
+            values = data[window.toslices()]
+            values = values[values != 0]
+            assert row["count"] == values.size
+            assert allclose(row["mean"], values.mean())
+            assert allclose(row["std"], values.std())
+            assert row["min"] == values.min() and row["max"] == values.max()
+            assert sum(row["histogram"]) == values.size
+
+        # Where zones overlap, the last zone gets every pixel
+        cells = [Window(64 + 8 * i, 64 + 8 * (i % 8), 8, 8) for i in range(40)]
+        cells.append(Window(64, 64, 64 * 5, 64))
+        overlapping = [box(*rasterio_window_bounds(w, transform)) for w in cells]
+        stats = zonal_stats(
+            f"{datafiles}/BAND3.tif",
+            {
+                "type": "FeatureCollection",
+                "crs": {"type": "name", "properties": {"name": crs.to_string()}},
+                "features": [
+                    {"type": "Feature", "properties": {}, "geometry": mapping(g)}
+                    for g in overlapping
+                ],
+            },
+            block_size=64,
+        )
+
+        last = data[cells[-1].toslices()]
+        assert list(stats["count"])[-1] == (last != 0).sum()
+        assert (stats["count"][:-1] == 0).all()
+
+    def test_grid_lookup(self, monkeypatch, tmp_path):
+        kml = """<?xml version="1.0" encoding="UTF-8"?>
+<kml xmlns="http://www.opengis.net/kml/2.2"><Document>
+  <Placemark>
+    <name>cell</name>
+    <ExtendedData>
+      <Data name="PATH"><value>228</value></Data>
+      <Data name="ROW"><value>116</value></Data>
+    </ExtendedData>
+    <Polygon><outerBoundaryIs><LinearRing><coordinates>
+      -64,-9,0 -63,-9,0 -63,-8,0 -64,-8,0 -64,-9,0
+    </coordinates></LinearRing></outerBoundaryIs></Polygon>
+  </Placemark>
+  <Placemark>
+    <name>229/116</name>
+    <Polygon><outerBoundaryIs><LinearRing><coordinates>
+      -65,-9 -64,-9 -64,-8 -65,-8 -65,-9
+    </coordinates></LinearRing></outerBoundaryIs></Polygon>
+  </Placemark>
+</Document></kml>"""
+
+        with ZipFile(tmp_path / "grid_cbers4a_mux.kmz", "w") as kmz:
+            kmz.writestr("doc.kml", kml)
+
+        def mock_get(*args, **kwargs):
+            raise AssertionError("The grid must be read from the cache")
+
+        monkeypatch.setattr("requests.Session.get", mock_get)
+
+        cache_dir = tmp_path.as_posix()
+        assert grid_lookup([-63.5, -8.5, -63.4, -8.4], cache_dir=cache_dir) == [
+            (228, 116)
+        ]
+        assert grid_lookup(
+            Polygon([(-64.5, -8.5), (-63.5, -8.5), (-63.5, -8.4)]), cache_dir=cache_dir
+        ) == [(228, 116), (229, 116)]
+        assert grid_lookup([-10, -10, -9, -9], cache_dir=cache_dir) == []
+
+        # Concurrent first lookups download the grid once
+        calls = list()
+        kmz = BytesIO()
+        with ZipFile(kmz, "w") as archive:
+            archive.writestr("doc.kml", kml)
+
+        def mock_get_kmz(*args, **kwargs):
+            calls.append(1)
+            sleep(0.1)
+            return MockResponse(kmz.getvalue())
+
+        monkeypatch.setattr("requests.Session.get", mock_get_kmz)
+
+        cache_dir = (tmp_path / "grids").as_posix()
+        with ThreadPoolExecutor(max_workers=4) as t_pool:
+            found = list(
+                t_pool.map(
+                    lambda _: grid_lookup(
+                        [-63.5, -8.5, -63.4, -8.4], cache_dir=cache_dir
+                    ),
+                    range(4),
+                )
+            )
+
+        assert len(calls) == 1
+        assert found == [[(228, 116)]] * 4
+        assert sorted(p.name for p in (tmp_path / "grids").iterdir()) == [
+            "grid_cbers4a_mux.kmz"
+        ]
+
+    def test_select_scenes(self):
+        from copy import deepcopy
+        from cbers4asat import Cbers4aAPI
+
+        scenes = {
+            "recent_cloudy_west": (box(0, 0, 1, 1), 80, "2024-06-01T13:00:00"),
+            "old_clear_west": (box(0, 0, 1, 1), 0, "2024-01-01T13:00:00"),
+            "recent_east": (box(1, 0, 2, 1), 10, "2024-06-01T13:00:00"),
+            "far_away": (box(5, 5, 6, 6), 0, "2024-06-01T13:00:00"),
+        }
+        features = list()
+        for id_, (footprint, cloud, date) in scenes.items():
+            feature = deepcopy(feature_with_bands)
+            feature["id"] = id_
+            feature["geometry"] = mapping(footprint)
+            feature["properties"].update(cloud_cover=cloud, datetime=date)
+            features.append(feature)
+        products = {"type": "FeatureCollection", "features": features}
+
+        selected = select_scenes(products, [0.0, 0.0, 2.0, 1.0])
+        assert [f["id"] for f in selected["features"]] == [
+            "recent_east",
+            "old_clear_west",
+        ]
+
+        half = select_scenes(products, [0.0, 0.0, 2.0, 1.0], coverage=0.5)
+        assert [f["id"] for f in half["features"]] == ["recent_east"]
+
+        gdf = Cbers4aAPI.to_geodataframe(products)
+        assert list(select_scenes(gdf, box(0, 0, 2, 1))["id"]) == [
+            "recent_east",
+            "old_clear_west",
+        ]